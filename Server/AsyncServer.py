@@ -0,0 +1,103 @@
+"""
+asyncio server mode: every connection is handled by the same event loop instead of a dedicated thread.
+Same wire protocol as Server.py. Start it with `python AsyncServer.py [variant]`.
+"""
+
+import sys
+import asyncio
+from Session import Session
+from Tables import TableRegistry, RECONNECT_GRACE
+from Outbox import AsyncOutbox
+from Server import SERVER_IP, PORT, BUFFER
+from Equity import load_preflop_table
+from HandHistory import HandHistory
+from Deck import DeckPool
+from Variants import HOLDEM, VARIANTS
+import Snapshot
+import Log
+import Metrics
+
+
+log = Log.get_logger("server")
+
+
+def call_later(loop):
+    """
+    Thread-safe call_later of an event loop, used by the tables to be called back (see TableRegistry's schedule),
+    e.g. from the threads of Equity.py's process pool
+    :loop: asyncio event loop
+    :return: function (delay, callback)
+    """
+    def schedule(delay, callback):
+        loop.call_soon_threadsafe(loop.call_later, delay, callback)
+    return schedule
+
+
+async def handle_client(registry, reader, writer):
+    """
+    Reads the messages of a client until it disconnects
+    :registry: TableRegistry
+    :reader: asyncio.StreamReader
+    :writer: asyncio.StreamWriter
+    :return: None
+    """
+    client_address = writer.get_extra_info('peername')
+    log.info("Connected", extra={'conn': client_address})
+    await serve_session(Session(registry, AsyncOutbox(writer), client_address), reader)
+
+
+async def serve_session(session, reader):
+    """
+    Passes what a client sends to its session until it disconnects
+    :session: Session, whose connection is an AsyncOutbox
+    :reader: asyncio.StreamReader
+    :return: None
+    """
+    try:
+        while True:
+            try:
+                data = await reader.read(BUFFER)
+            except OSError:
+                return
+            if not data:  # Connection closed by the client
+                return
+            if session.receive(data) == -1:
+                return
+    finally:
+        session.close()
+
+
+async def serve(host=SERVER_IP, port=PORT, variant=HOLDEM):
+    history = HandHistory()
+    games = Snapshot.load()
+    snapshots = Snapshot.Snapshots()
+    registry = TableRegistry(history=history, deck_pool=DeckPool(), snapshots=snapshots,
+                             schedule=call_later(asyncio.get_running_loop()), variant=variant)
+    server = await asyncio.start_server(lambda reader, writer: handle_client(registry, reader, writer), host, port)
+    log.info("Server started. Listening on %s", server.sockets[0].getsockname())
+    if load_preflop_table():
+        log.info("Preflop equity table loaded.")
+    log.info("Table registry created, hands are logged to %s", history.path)
+    if games:
+        registry.restore(games)
+        asyncio.get_running_loop().call_later(RECONNECT_GRACE, registry.expire)
+        log.info("%d tables restored from %s, players have %ds to reconnect", len(games), snapshots.path,
+                 RECONNECT_GRACE)
+    Metrics.watch(registry)
+    metrics = Metrics.serve()
+    log.info("Metrics served on http://%s:%d/metrics", *metrics.server_address)
+    log.info("Waiting for players...")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        history.close()
+        snapshots.close()
+        metrics.shutdown()
+
+
+if __name__ == "__main__":
+    listener = Log.setup()
+    asyncio.run(serve(variant=VARIANTS[sys.argv[1]] if len(sys.argv) > 1 else HOLDEM))
+    log.info("Server terminated.")
+    listener.stop()
@@ -0,0 +1,63 @@
+"""
+Ranks large batches of hands at once with NumPy, for offline analytics and simulations.
+NumPy is only needed by this module, the server itself still runs without any 3rd party library.
+
+Uses the same lookup tables as the Evaluator, so the strengths returned are identical to Evaluator.evaluate and can
+be converted with Evaluator.strength_to_ranking.
+"""
+
+try:
+    import numpy as np
+except ImportError as error:
+    raise ImportError("BatchEvaluator requires NumPy: pip install numpy") from error
+
+from Evaluator import CARD_KEY, RANK_TABLE, FLUSH_TABLE, FLUSH_SUIT, RANK_BITS, RANK_MASK, KICKER_BITS, MAX_KICKERS
+
+
+CHUNK_SIZE = 1 << 20  # Number of hands ranked at once, bounds the memory used by temporary arrays
+
+_CARD_KEY = np.array(CARD_KEY, dtype=np.int64)
+_CARD_SUIT = np.arange(52, dtype=np.int64) // 13
+_CARD_RANK_BIT = np.left_shift(1, np.arange(52, dtype=np.int64) % 13)
+_RANK_KEYS = np.array(sorted(RANK_TABLE), dtype=np.int64)
+_RANK_STRENGTHS = np.array([RANK_TABLE[key] for key in sorted(RANK_TABLE)], dtype=np.int64)
+_FLUSH_TABLE = np.array(FLUSH_TABLE, dtype=np.int64)
+_FLUSH_SUIT = np.array(FLUSH_SUIT, dtype=np.int64)
+
+
+def _rank_chunk(cards):
+    """
+    Strengths of a chunk of hands
+    :cards: (n, k) int array
+    :return: (n,) int64 array
+    """
+    keys = _CARD_KEY[cards].sum(axis=1)
+    strengths = _RANK_STRENGTHS[np.searchsorted(_RANK_KEYS, keys & RANK_MASK)]
+    suits = _FLUSH_SUIT[keys >> RANK_BITS]
+    flush = suits >= 0
+    if flush.any():
+        flush_cards = cards[flush]
+        suited = _CARD_SUIT[flush_cards] == suits[flush][:, None]
+        masks = np.where(suited, _CARD_RANK_BIT[flush_cards], 0).sum(axis=1)
+        strengths[flush] = _FLUSH_TABLE[masks]
+    return strengths
+
+
+def rank_hands(cards):
+    """
+    Ranks every row of an array of card ids (0-51, same encoding as the Deck)
+    :cards: (n, 5), (n, 6) or (n, 7) int array, each row holding distinct cards
+    :return: tuple of 2 (n,) int64 arrays, the comparable strengths (same as Evaluator.evaluate) and the categories
+             (same as the first element of Rules.hand_ranking)
+    """
+    cards = np.asarray(cards)
+    if cards.ndim != 2 or not 5 <= cards.shape[1] <= 7:
+        raise ValueError(f"Expected an (n, 5) to (n, 7) array of cards, got shape {cards.shape}")
+    if cards.size and (cards.min() < 0 or cards.max() > 51):
+        raise ValueError("Card ids must be between 0 and 51")
+    cards = cards.astype(np.intp, copy=False)
+
+    strengths = np.empty(len(cards), dtype=np.int64)
+    for start in range(0, len(cards), CHUNK_SIZE):
+        strengths[start:start + CHUNK_SIZE] = _rank_chunk(cards[start:start + CHUNK_SIZE])
+    return strengths, strengths >> (KICKER_BITS * MAX_KICKERS)
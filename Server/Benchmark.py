@@ -0,0 +1,394 @@
+"""
+Benchmark suite of the server: hand evaluation, deck, game loop, game's state serialization and network fan-out.
+Results are saved as JSON so that commits can be compared and performance regressions caught.
+Usage: python Benchmark.py [--quick] [--output results.json] [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import platform
+import tracemalloc
+import threading
+import subprocess
+import socketserver
+from itertools import combinations
+import Rules
+from Deck import Deck, DeckPool
+from Evaluator import evaluate, evaluate_omaha
+from Game import Game, format_state
+from Wire import encode_state
+from Server import ServerReqHandler
+from Tables import TableRegistry, table_memory
+from Outbox import CAPACITY
+from Simulation import new_table, seat_policies, MAX_ACTIONS
+
+
+TOLERANCE = 0.10  # Relative slowdown above which a result is reported as a regression
+REPEAT = 5  # Every timing is the best of this many runs, to filter out noise
+
+
+def best_time(func, repeat=REPEAT):
+    """
+    Fastest of several runs of a function
+    :func: function without argument
+    :repeat: int
+    :return: float, seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def throughput(count, seconds):
+    """
+    :return: dict, result of a benchmark measuring operations per second
+    """
+    return {'value': count / seconds, 'unit': "ops/s", 'better': "higher"}
+
+
+def latency(seconds):
+    """
+    :return: dict, result of a benchmark measuring microseconds per operation
+    """
+    return {'value': seconds * 1e6, 'unit': "us", 'better': "lower"}
+
+
+def percentile(values, p):
+    """
+    :values: sorted list
+    :p: float, between 0 and 100
+    :return: value below which p percent of the values are
+    """
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def random_hands(count, size, seed=0):
+    """
+    :count: int, number of hands
+    :size: int, number of cards in a hand
+    :return: list of lists of card ids
+    """
+    rng = random.Random(seed)
+    return [rng.sample(range(52), size) for _ in range(count)]
+
+
+def bench_rules(count):
+    """
+    Throughput of the original rules: 5-card rankings, and 7-card hands going through best_hand
+    """
+    fives = random_hands(count, 5)
+    sevens = random_hands(count // 10, 7)
+    rank_time = best_time(lambda: [Rules.hand_ranking(hand) for hand in fives])
+    best_hand_time = best_time(lambda: [Rules.best_hand(combinations(hand, 5)) for hand in sevens])
+    return {
+        'rules.hand_ranking': throughput(len(fives), rank_time),
+        'rules.best_hand_7cards': throughput(len(sevens), best_hand_time),
+    }
+
+
+def bench_evaluator(count):
+    """
+    Throughput of the table-driven evaluator on 7-card hands, and on Omaha hands (4 hole cards and a board of 5)
+    """
+    sevens = random_hands(count, 7)
+    nines = random_hands(count // 10, 9)
+    return {
+        'evaluator.evaluate_7cards': throughput(count, best_time(lambda: [evaluate(hand) for hand in sevens])),
+        'evaluator.evaluate_omaha': throughput(len(nines), best_time(
+            lambda: [evaluate_omaha(hand[:4], hand[4:]) for hand in nines])),
+    }
+
+
+def bench_deck(count):
+    """
+    Cost of building a shuffled deck, and of dealing a 6-handed hold'em hand from it
+    """
+    def deal():
+        for _ in range(count):
+            deck = Deck()
+            for _ in range(6):
+                deck.deal_cards(2)
+            deck.deal_cards(3)
+            deck.deal_cards(1)
+            deck.deal_cards(1)
+
+    pool = DeckPool(count)
+    while not pool.decks.full():
+        time.sleep(0.01)
+    return {
+        'deck.construct': latency(best_time(lambda: [Deck() for _ in range(count)]) / count),
+        'deck.construct_and_deal': latency(best_time(deal) / count),
+        'deck.pool_get': latency(best_time(lambda: [pool.get() for _ in range(count)], repeat=1) / count),
+    }
+
+
+def bench_game_loop(hands, num_players):
+    """
+    Latency of Game.act between bots, shoving often so that hands go to side pots. Hands the engine cannot finish
+    are counted as failures, to be investigated with Simulation.py, and their table is replaced.
+    :hands: int
+    :num_players: int
+    :return: dict
+    """
+    rng = random.Random(num_players)
+    game = new_table(num_players)
+    seats = seat_policies(game, ['maniac'] * num_players)
+    timings = []
+    failures = 0
+    for _ in range(hands):
+        for player in game.players:
+            if player and player.stack < game.bb:
+                player.modify_stack(200)
+        try:
+            game.new_game()
+            actions = 0
+            while game.on and actions < MAX_ACTIONS:
+                actor = game.players[game.acting]
+                action, amount = seats[game.acting](game, actor, rng)
+                start = time.perf_counter()
+                game.act(actor, action, amount)
+                timings.append(time.perf_counter() - start)
+                actions += 1
+            if game.on:
+                raise RuntimeError("Hand stuck")
+        except Exception:
+            failures += 1
+            game = new_table(num_players)
+            seats = seat_policies(game, ['maniac'] * num_players)
+    timings.sort()
+    return {
+        f'game.act_{num_players}p.mean': latency(sum(timings) / len(timings)),
+        f'game.act_{num_players}p.p50': latency(percentile(timings, 50)),
+        f'game.act_{num_players}p.p99': latency(percentile(timings, 99)),
+        f'game.act_{num_players}p.failed_hands': {'value': failures, 'unit': "hands", 'better': "lower"},
+    }
+
+
+def bench_gather_chips(count, num_players):
+    """
+    Latency of gathering the bets of a round where every player bets a different amount, so that each of them
+    opens a side pot
+    """
+    game = new_table(num_players)
+    seated = [player for player in game.players if player]
+
+    def gather():
+        for _ in range(count):
+            game.pots = [0]
+            game.pot_players = [[]]
+            for i, player in enumerate(seated):
+                player.in_hand = True
+                player.betting = 10 * (i + 1)
+                game.contributions[player] = 10 * (i + 1)
+            game.gather_chips()
+
+    return {f'game.gather_chips_{num_players}p': latency(best_time(gather) / count)}
+
+
+def bench_game_info(count):
+    """
+    Cost of serializing the state of a 6-handed table in the middle of a hand, with the text and binary protocols
+    """
+    game = new_table(6)
+    game.new_game()
+    game.community = bytearray([0, 13, 26])
+    game.pots = [120, 40]
+    return {
+        'game.game_info': latency(best_time(lambda: [game.game_info() for _ in range(count)]) / count),
+        'game.state_components': latency(best_time(
+            lambda: [format_state(game.state_components()) for _ in range(count)]) / count),
+        'wire.encode_state': latency(best_time(lambda: [encode_state(game) for _ in range(count)]) / count),
+    }
+
+
+def bench_memory(num_tables):
+    """
+    Memory held by idle 6-handed tables after a few hands: measured by tracemalloc, including the players'
+    (bots') outboxes, and estimated by Tables.table_memory, excluding them
+    :num_tables: int
+    :return: dict
+    """
+    rng = random.Random(0)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    tables = []
+    for _ in range(num_tables):
+        game = new_table(6)
+        seats = seat_policies(game, ['calling_station'] * 6)
+        for _ in range(3):
+            game.new_game()
+            while game.on:
+                actor = game.players[game.acting]
+                game.act(actor, *seats[game.acting](game, actor, rng))
+        tables.append(game)
+    traced = (tracemalloc.get_traced_memory()[0] - start) / num_tables
+    tracemalloc.stop()
+    return {
+        'memory.idle_table_traced': {'value': traced, 'unit': "bytes", 'better': "lower"},
+        'memory.idle_table_estimated': {'value': sum(map(table_memory, tables)) / num_tables, 'unit': "bytes",
+                                        'better': "lower"},
+    }
+
+
+def bench_loopback(num_clients, messages):
+    """
+    End-to-end messages per second through ServerReqHandler over loopback: clients seated at the same table chat,
+    and every chat message is broadcast to all of them
+    :num_clients: int, at most MAX_PLAYERS so that all clients share a table
+    :messages: int, chat messages sent by each client
+    :return: dict
+    """
+    marker = b"bench-chat"
+    expected = num_clients * messages  # Chat messages each client must receive
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), ServerReqHandler)
+    server.daemon_threads = True
+    server.registry = TableRegistry(chat_limit=None)  # Measures the fan-out of every message
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    clients = []
+    for i in range(num_clients):
+        client = socket.create_connection(server.server_address)
+        client.sendall(f"07 seq$00 bench{i}$".encode())  # Sequenced, so that the server does not pause
+        clients.append(client)
+    while len(server.registry.connections) < num_clients:
+        time.sleep(0.01)
+
+    received = [0] * num_clients
+    progress = threading.Condition()
+
+    def read(i):
+        tail = b""
+        while received[i] < expected:
+            data = clients[i].recv(65536)
+            if not data:
+                break
+            data = tail + data
+            with progress:
+                received[i] += data.count(marker)
+                progress.notify()
+            tail = data[-len(marker) + 1:]
+        with progress:
+            if received[i] < expected:
+                received[i] = -1  # Disconnected by the server
+            progress.notify()
+
+    readers = [threading.Thread(target=read, args=(i,), daemon=True) for i in range(num_clients)]
+    for reader in readers:
+        reader.start()
+    # Clients send in windows small enough for the broadcasts not to overflow the outboxes, as real clients would
+    window = max(1, CAPACITY // (2 * num_clients))
+    chat = f"04 {marker.decode()}$".encode()
+    start = time.perf_counter()
+    for sent in range(0, messages, window):
+        batch = min(window, messages - sent)
+        for client in clients:
+            client.sendall(chat * batch)
+        target = num_clients * (sent + batch)
+        with progress:
+            if not progress.wait_for(lambda: all(count >= target or count == -1 for count in received), timeout=60):
+                raise RuntimeError("Loopback benchmark timed out")
+            if -1 in received:
+                raise RuntimeError("A client was disconnected by the server")
+    seconds = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    server.shutdown()
+    server.server_close()
+    return {
+        f'network.loopback_{num_clients}clients.received': throughput(num_clients * expected, seconds),
+        f'network.loopback_{num_clients}clients.sent': throughput(num_clients * messages, seconds),
+    }
+
+
+def git_commit():
+    """
+    :return: str, commit the benchmarks run on, None if unknown
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_all(quick=False):
+    """
+    Runs every benchmark
+    :quick: bool, smaller workloads for a fast sanity check
+    :return: dict, metadata and results
+    """
+    scale = 10 if quick else 1
+    results = {}
+    results.update(bench_rules(20000 // scale))
+    results.update(bench_evaluator(200000 // scale))
+    results.update(bench_deck(5000 // scale))
+    for num_players in range(2, 7):
+        results.update(bench_game_loop(2000 // scale, num_players))
+        results.update(bench_gather_chips(20000 // scale, num_players))
+    results.update(bench_game_info(20000 // scale))
+    results.update(bench_memory(1000 // scale))
+    results.update(bench_loopback(6, 2000 // scale))
+    return {
+        'commit': git_commit(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    """
+    Results that got worse than the baseline by more than the tolerance
+    :baseline: dict, as returned by run_all
+    :current: dict, as returned by run_all
+    :tolerance: float, relative change
+    :return: list of (name, baseline value, current value)
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        if not old['value']:  # e.g. no failed hand before
+            if result['better'] == "lower" and result['value'] > 0:
+                regressions.append((name, old['value'], result['value']))
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        if (result['better'] == "higher" and change < -tolerance) or (result['better'] == "lower" and change > tolerance):
+            regressions.append((name, old['value'], result['value']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the poker server")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slowdown considered a regression")
+    args = parser.parse_args()
+
+    report = run_all(args.quick)
+    for name, result in report['results'].items():
+        print(f"{name:45} {result['value']:>14.2f} {result['unit']}")
+    failed = sum(result['value'] for name, result in report['results'].items() if name.endswith(".failed_hands"))
+    if failed:
+        print(f"WARNING {failed} hands failed, run Simulation.py to see why: the game loop's timings are not reliable")
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.2f} -> {new:.2f}")
+        sys.exit(1 if regressions else 0)
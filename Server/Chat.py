@@ -1,12 +1,94 @@
 """
-Handles the chat box
+Handles the chat box: recent messages of each table, replayed to players joining it, players' rate limits, and
+bursts of messages combined into a single broadcast
 """
 
+from collections import deque
+from time import monotonic
+from Log import get_logger
+
+
+CHAT_HISTORY = 50  # Recent messages kept by a table, replayed to players joining it
+CHAT_RATE = 1.0  # Messages per second a player may send in the long run
+CHAT_BURST = 5  # Messages a player may send at once
+CHAT_WINDOW = 0.25  # Seconds during which messages following a broadcast are held, then broadcast together
+
+
+class TokenBucket:
+    """
+    Rate limit: a token is taken by every message, tokens come back at a steady rate up to a maximum, the burst
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate=CHAT_RATE, burst=CHAT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+
+    def refill(self):
+        """
+        Gives back the tokens earned since the last update
+        :return: float, tokens available
+        """
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def take(self):
+        """
+        :return: bool, True if a token was available and has been taken
+        """
+        if self.refill() < 1:
+            return False
+        self.tokens -= 1
+        return True
+
 
 class Chat:
-    def __init__(self):
-        self.content = []
-        
+    __slots__ = ('content', 'pending', 'last_broadcast', 'schedule', 'log')
+
+    def __init__(self, table_id=0, history=CHAT_HISTORY):
+        self.content = deque(maxlen=history)  # Recent messages, the oldest ones are dropped when it's full
+        self.pending = []  # Messages held to be broadcast together
+        self.last_broadcast = 0.0
+        # Function (delay, callback) calling back later, e.g. the event loop's call_later. Without it, every message is
+        # broadcast at once.
+        self.schedule = None
+        self.log = get_logger("game", table=table_id)  # Game events are logged with the table's id
+
     def update_chat(self, msg):
-        # self.content.append(msg)
-        print(msg)
+        self.log.info(msg)
+
+    def post(self, msg):
+        """
+        Adds a player's message to the chat
+        :msg: str
+        :return: float, seconds to wait before broadcasting the pending messages (0 to broadcast them now), None if
+                 a broadcast is already scheduled
+        """
+        self.update_chat(msg)
+        self.content.append(msg)
+        self.pending.append(msg)
+        if len(self.pending) > 1:
+            return None
+        if self.schedule is None:
+            return 0
+        return max(0.0, self.last_broadcast + CHAT_WINDOW - monotonic())
+
+    def flush(self):
+        """
+        Takes the pending messages, to be broadcast
+        :return: str, pending messages one per line, empty if there is none
+        """
+        msg = "\n".join(self.pending)
+        self.pending.clear()
+        self.last_broadcast = monotonic()
+        return msg
+
+    def history(self):
+        """
+        :return: str, recent messages one per line, empty if there is none
+        """
+        return "\n".join(self.content)
@@ -2,28 +2,85 @@
 Handles all operations related to cards in a deck for a game
 """
 
-from secrets import choice
+import os
+import queue
+import threading
+
+
+DECK_SIZE = 52
+POOL_SIZE = 64  # Number of shuffled decks kept ready by a DeckPool
 
 
 class Deck:
-    def __init__(self):
-        self.cards = []
-        self.get_deck()
+    __slots__ = ('cards',)
+
+    def __init__(self, cards=None):
+        """
+        :cards: bytearray of card ids already shuffled, e.g. by a DeckPool, a new deck is shuffled if None
+        """
+        self.cards = cards if cards is not None else shuffled_cards()
 
     def get_deck(self):
         """
         Generate a crypto-secured randomly shuffled deck of 52 cards
         :return: None
         """
-        ordered_deck = [i for i in range(52)]
-        for _ in range(52):
-            card = choice(ordered_deck)
-            self.cards.append(card)
-            ordered_deck.remove(card)
+        self.cards = shuffled_cards()
 
     def deal_cards(self, n):
         """
         Deal n cards
-        :return: list
+        :return: bytes, card ids
+        """
+        cards = self.cards[:-n - 1:-1]  # Same order as popping them one by one
+        del self.cards[-n:]
+        return bytes(cards)
+
+
+def shuffled_cards():
+    """
+    Crypto-secured Fisher-Yates shuffle of the 52 cards. Random bytes are read from the OS in bulk, and a byte is
+    rejected when keeping it would make some positions more likely than others (modulo bias).
+    :return: bytearray of card ids
+    """
+    cards = bytearray(range(DECK_SIZE))
+    entropy = os.urandom(2 * DECK_SIZE)  # Enough for the shuffle most of the time, rejections are rare
+    k = 0
+    for i in range(DECK_SIZE - 1, 0, -1):
+        bound = i + 1
+        limit = 256 - 256 % bound  # Bytes at or above the limit are rejected
+        while True:
+            if k == len(entropy):
+                entropy = os.urandom(DECK_SIZE)
+                k = 0
+            byte = entropy[k]
+            k += 1
+            if byte < limit:
+                break
+        j = byte % bound
+        cards[i], cards[j] = cards[j], cards[i]
+    return cards
+
+
+class DeckPool:
+    """
+    Shuffled decks kept ready by a background thread, so that starting a hand never waits for the shuffle. Shared by
+    every table of the server. If the pool runs dry, decks are shuffled on the spot.
+    """
+    def __init__(self, size=POOL_SIZE):
+        self.decks = queue.Queue(maxsize=size)
+        self.filler = threading.Thread(target=self.fill, daemon=True)
+        self.filler.start()
+
+    def fill(self):
+        while True:
+            self.decks.put(shuffled_cards())  # Blocks while the pool is full
+
+    def get(self):
+        """
+        :return: Deck object
         """
-        return [self.cards.pop() for _ in range(n)]
+        try:
+            return Deck(self.decks.get_nowait())
+        except queue.Empty:
+            return Deck()
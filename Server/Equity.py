@@ -0,0 +1,583 @@
+"""
+Estimates players' equities for all-in runouts and post-hand analytics. Equities are exact when every runout is
+enumerated, and estimates when runouts are sampled or read from the preflop table, whose values are averages over
+starting hand classes: suits are ignored, e.g. AsKs against QhQd gets the same value as AsKs against QsQh.
+"""
+
+import os
+import sys
+import random
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import combinations, permutations
+from concurrent.futures import ProcessPoolExecutor, Future, InvalidStateError
+from Evaluator import evaluate
+
+
+BATCH_SIZE = 5000  # Number of runouts sampled by a worker in one task
+IN_FLIGHT = 2  # Number of tasks submitted ahead per worker process of the pool, to keep every worker busy
+Z_SCORE = 1.96  # 95% confidence interval
+SAMPLES = 50000  # Maximum number of runouts sampled when there are too many to enumerate
+TARGET_CI = 0.005  # Sampled equities are accurate to +/- 0.5%
+EXACT_LIMIT = 50000  # Runouts are enumerated exactly when there are at most this many of them
+INLINE_LIMIT = 1000  # Runouts enumerated by submit_equity without the process pool, in a few milliseconds
+CACHE_SIZE = 4096  # Number of canonical spots kept in the exact equity cache, see cached_exact
+PREFLOP_CLASSES = 169  # 13 pairs, 78 suited and 78 offsuit starting hands
+PREFLOP_MAGIC = b"PFEQ1"  # Header of the preflop table file
+PREFLOP_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "preflop_equity.bin")
+SUIT_PERMUTATIONS = list(permutations(range(4)))
+
+_executor = None  # Process pool shared by all tables, created on first use
+_pool_size = os.cpu_count() or 1  # Worker processes of the pool, see set_pool_size
+_preflop_table = None  # Heads-up preflop equities of each class against each class, loaded from disk
+# Canonical spot -> exact equities, least recently used first. Kept by the process asking for the equities, e.g. the
+# server, even when they are computed by the pool, whose workers would each have their own.
+_exact_cache = OrderedDict()
+_exact_cache_lock = threading.Lock()  # The pool's callbacks fill the cache from the executor's thread
+
+
+def get_executor():
+    """
+    Returns the process pool shared by every equity computation in this process
+    :return: ProcessPoolExecutor
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_pool_size)
+    return _executor
+
+
+def set_pool_size(workers):
+    """
+    Sets the number of worker processes of the pool, one per core by default. Server processes sharing the machine,
+    e.g. the workers of Lobby.py, each take their share of the cores. Must be called before the pool is first used.
+    :workers: int
+    :return: None
+    """
+    global _pool_size
+    if _executor is not None:
+        raise RuntimeError("The process pool is already running")
+    _pool_size = max(1, workers)
+
+
+def check_cards(hands, board, dead):
+    """
+    Make sure no card is used twice and returns the cards left in the deck
+    :hands: list of lists of int
+    :board: list of int
+    :dead: list of int
+    :return: list
+    """
+    used = [card for hand in hands for card in hand] + list(board) + list(dead)
+    if len(set(used)) != len(used):
+        raise ValueError("A card cannot be used more than once")
+    if len(board) > 5:
+        raise ValueError("The board cannot have more than 5 cards")
+    return [card for card in range(52) if card not in used]
+
+
+def showdown_shares(hands, board):
+    """
+    Share of the pot won by each hand on a complete board
+    :hands: list of lists of int
+    :board: list of int
+    :return: tuple (index of winners, list of strengths)
+    """
+    strengths = [evaluate(board + hand) for hand in hands]
+    best = max(strengths)
+    return [i for i, strength in enumerate(strengths) if strength == best], strengths
+
+
+def sample_runouts(hands, board, remaining, samples, seed):
+    """
+    Deal random runouts and count the results of each hand. Runs inside a worker process.
+    :hands: list of lists of int
+    :board: list of int
+    :remaining: list of int, cards that can still be dealt
+    :samples: int
+    :seed: int
+    :return: tuple (samples, wins, ties, sum of equities, sum of squared equities), the last 4 being lists with one
+             value per hand
+    """
+    rng = random.Random(seed)
+    n = len(hands)
+    wins = [0] * n
+    ties = [0] * n
+    equity = [0.0] * n
+    equity_sq = [0.0] * n
+    missing = 5 - len(board)
+    hands = [list(hand) for hand in hands]
+    board = list(board)
+    for _ in range(samples):
+        winners, _ = showdown_shares(hands, board + rng.sample(remaining, missing))
+        share = 1 / len(winners)
+        for i in winners:
+            if share == 1:
+                wins[i] += 1
+            else:
+                ties[i] += 1
+            equity[i] += share
+            equity_sq[i] += share * share
+    return samples, wins, ties, equity, equity_sq
+
+
+def summarize(wins, ties, equity, samples, exact=False):
+    """
+    Turns counts into the per-player results returned by the equity functions
+    :exact: bool, every runout has been counted
+    :return: list of dicts
+    """
+    return [
+        {'win': wins[i] / samples, 'tie': ties[i] / samples, 'equity': equity[i] / samples, 'exact': exact}
+        for i in range(len(wins))
+    ]
+
+
+def confidence_half_width(equity, equity_sq, samples):
+    """
+    Widest half-width of the confidence interval of the equities among all players
+    :return: float
+    """
+    widest = 0.0
+    for total, total_sq in zip(equity, equity_sq):
+        mean = total / samples
+        variance = max(total_sq / samples - mean * mean, 0.0)
+        widest = max(widest, Z_SCORE * (variance / samples) ** 0.5)
+    return widest
+
+
+def monte_carlo(hands, board=(), dead=(), samples=100000, target_ci=None, executor=None):
+    """
+    Estimates win, tie and equity of each hand from randomly sampled runouts, waiting for the result. See
+    submit_monte_carlo to get it without waiting.
+    :hands: list of lists of int, hole cards of each player
+    :board: list of int, community cards already dealt
+    :dead: list of int, cards known to be out of the deck
+    :samples: int, maximum number of runouts to sample
+    :target_ci: float, stop as soon as every equity is known within +/- target_ci (95% confidence), None to draw
+                every sample
+    :executor: concurrent.futures executor to run the samples on, the shared process pool by default
+    :return: list of dicts with keys 'win', 'tie', 'equity' and 'exact', one per hand
+    """
+    return submit_monte_carlo(hands, board, dead, samples, target_ci, executor).result()
+
+
+def submit_monte_carlo(hands, board=(), dead=(), samples=100000, target_ci=None, executor=None):
+    """
+    Same as monte_carlo without waiting: no thread is blocked while the runouts are sampled, the result is set on a
+    future. It can be waited for with result(), awaited with asyncio.wrap_future, or given a callback with
+    add_done_callback (called from the executor's thread). Cancelling the future stops the sampling.
+    :return: concurrent.futures.Future of a list of dicts with keys 'win', 'tie', 'equity' and 'exact', one per hand
+    """
+    board = list(board)
+    remaining = check_cards(hands, board, dead)
+    if len(board) == 5:  # Nothing left to sample
+        _, wins, ties, equity, _ = sample_runouts(hands, board, remaining, 1, 0)
+        result = Future()
+        result.set_result(summarize(wins, ties, equity, 1, exact=True))
+        return result
+    sampling = Sampling([list(hand) for hand in hands], board, remaining, samples, target_ci,
+                        executor or get_executor())
+    return sampling.start()
+
+
+class Sampling:
+    """
+    Runouts sampled in batches on an executor. Nothing waits for the batches: each one finishing submits the next
+    ones from its done callback, until every sample is drawn or the target precision is reached.
+    """
+    def __init__(self, hands, board, remaining, samples, target_ci, executor):
+        self.hands = hands
+        self.board = board
+        self.remaining = remaining
+        self.samples = samples
+        self.target_ci = target_ci
+        self.executor = executor
+        self.result = Future()
+        self.lock = threading.RLock()  # Cancelling a batch calls its callback at once, from the same thread
+        self.pending = set()  # Batches submitted and not finished yet
+        self.submitted = 0  # Samples submitted
+        self.done = 0  # Samples drawn
+        n = len(hands)
+        self.wins, self.ties, self.equity, self.equity_sq = [0] * n, [0] * n, [0.0] * n, [0.0] * n
+        self.seeds = random.SystemRandom()
+
+    def start(self):
+        """
+        :return: concurrent.futures.Future of the result
+        """
+        with self.lock:
+            batches = self.submit()
+        for batch in batches:
+            batch.add_done_callback(self.finished)
+        return self.result
+
+    def submit(self):
+        """
+        Submits batches until IN_FLIGHT of them per worker process are pending, the lock being held
+        :return: list of the futures of the new batches, their callbacks being added once the lock is released
+        """
+        batches = []
+        while self.submitted < self.samples and len(self.pending) < IN_FLIGHT * _pool_size:
+            size = min(BATCH_SIZE, self.samples - self.submitted)
+            batch = self.executor.submit(sample_runouts, self.hands, self.board, self.remaining, size,
+                                         self.seeds.getrandbits(64))
+            self.pending.add(batch)
+            self.submitted += size
+            batches.append(batch)
+        return batches
+
+    def finished(self, batch):
+        """
+        Done callback of a batch: adds its counts, then either sets the result or submits more batches
+        :batch: concurrent.futures.Future
+        :return: None
+        """
+        with self.lock:
+            self.pending.discard(batch)
+            if self.result.done() or batch.cancelled():
+                self.stop()
+                return
+            try:
+                size, wins, ties, equity, equity_sq = batch.result()
+                for i in range(len(self.hands)):
+                    self.wins[i] += wins[i]
+                    self.ties[i] += ties[i]
+                    self.equity[i] += equity[i]
+                    self.equity_sq[i] += equity_sq[i]
+                self.done += size
+                precise = self.target_ci is not None and \
+                    confidence_half_width(self.equity, self.equity_sq, self.done) <= self.target_ci
+                if precise or (self.submitted == self.samples and not self.pending):
+                    self.stop()
+                    self.result.set_result(summarize(self.wins, self.ties, self.equity, self.done))
+                    return
+                batches = self.submit()
+            except InvalidStateError:  # The result has been cancelled meanwhile
+                self.stop()
+                return
+            except Exception as error:
+                self.stop()
+                self.result.set_exception(error)
+                return
+        for batch in batches:
+            batch.add_done_callback(self.finished)
+
+    def stop(self):
+        """
+        Cancels the batches not started yet. Those already running in a worker cannot be stopped, their results are
+        ignored.
+        :return: None
+        """
+        for batch in list(self.pending):
+            batch.cancel()
+
+
+def enumerate_runouts(hands, board, remaining, first=None):
+    """
+    Deal every possible runout and count the results of each hand. Can run inside a worker process.
+    :hands: list of lists of int
+    :board: list of int
+    :remaining: list of int, cards that can still be dealt
+    :first: int, only deal the runouts whose lowest card is remaining[first], None to deal all of them
+    :return: tuple (runouts, wins, ties, sum of equities)
+    """
+    n = len(hands)
+    wins = [0] * n
+    ties = [0] * n
+    equity = [0.0] * n
+    runouts = 0
+    missing = 5 - len(board)
+    if first is None:
+        dealt = combinations(remaining, missing)
+    else:
+        dealt = ((remaining[first],) + rest for rest in combinations(remaining[first + 1:], missing - 1))
+    for runout in dealt:
+        winners, _ = showdown_shares(hands, board + list(runout))
+        runouts += 1
+        for i in winners:
+            if len(winners) == 1:
+                wins[i] += 1
+            else:
+                ties[i] += 1
+            equity[i] += 1 / len(winners)
+    return runouts, wins, ties, equity
+
+
+def count_runouts(remaining, missing):
+    """
+    Number of possible runouts
+    :return: int
+    """
+    count = 1
+    for i in range(missing):
+        count = count * (remaining - i) // (i + 1)
+    return count
+
+
+def canonical_spot(hands, board, dead):
+    """
+    Relabel the suits of a spot so that every suit-isomorphic spot gets the same representation. Hands keep their
+    order since results are given per hand, cards within a hand, the board and dead cards are sorted.
+    :hands: list of lists of int
+    :board: list of int
+    :dead: list of int
+    :return: tuple (hands, board, dead) of tuples
+    """
+    best = None
+    for perm in SUIT_PERMUTATIONS:
+        def relabel(cards):
+            return tuple(sorted(perm[card // 13] * 13 + card % 13 for card in cards))
+        spot = (tuple(relabel(hand) for hand in hands), relabel(board), relabel(dead))
+        if best is None or spot < best:
+            best = spot
+    return best
+
+
+def exact_canonical(hands, board, dead):
+    """
+    Exact equities of a canonical spot. When there are more than EXACT_LIMIT runouts, e.g. preflop, they are split by
+    their lowest card over the process pool. Can run inside a worker process.
+    :return: list of dicts
+    """
+    remaining = check_cards(hands, board, dead)
+    hands = [list(hand) for hand in hands]
+    board = list(board)
+    missing = 5 - len(board)
+    if not missing or count_runouts(len(remaining), missing) <= EXACT_LIMIT:
+        runouts, wins, ties, equity = enumerate_runouts(hands, board, remaining)
+        return summarize(wins, ties, equity, runouts, exact=True)
+    executor = get_executor()
+    chunks = [executor.submit(enumerate_runouts, hands, board, remaining, first)
+              for first in range(len(remaining) - missing + 1)]
+    n = len(hands)
+    runouts, wins, ties, equity = 0, [0] * n, [0] * n, [0.0] * n
+    for chunk in chunks:
+        chunk_runouts, chunk_wins, chunk_ties, chunk_equity = chunk.result()
+        runouts += chunk_runouts
+        for i in range(n):
+            wins[i] += chunk_wins[i]
+            ties[i] += chunk_ties[i]
+            equity[i] += chunk_equity[i]
+    return summarize(wins, ties, equity, runouts, exact=True)
+
+
+def cached_exact(spot):
+    """
+    Exact equities of a canonical spot if they are in the cache, which keeps the CACHE_SIZE most recently used spots
+    :spot: tuple (hands, board, dead), as returned by canonical_spot
+    :return: list of dicts, copies of the cached ones, None if the spot is not cached
+    """
+    with _exact_cache_lock:
+        results = _exact_cache.get(spot)
+        if results is None:
+            return None
+        _exact_cache.move_to_end(spot)
+    return [dict(result) for result in results]
+
+
+def cache_exact(spot, results):
+    """
+    Adds the exact equities of a canonical spot to the cache, forgetting the least recently used spot if it is full
+    :spot: tuple (hands, board, dead), as returned by canonical_spot
+    :results: list of dicts
+    :return: None
+    """
+    with _exact_cache_lock:
+        _exact_cache[spot] = [dict(result) for result in results]
+        _exact_cache.move_to_end(spot)
+        if len(_exact_cache) > CACHE_SIZE:
+            _exact_cache.popitem(last=False)
+
+
+def exact_equity(hands, board=(), dead=()):
+    """
+    Exact win, tie and equity of each hand, enumerating every runout from the cards left in the deck. Spots that only
+    differ by their suits share their results in the cache. A preflop spot has more than a million runouts: it takes
+    seconds even spread over every core.
+    :hands: list of lists of int, hole cards of each player
+    :board: list of int, community cards already dealt
+    :dead: list of int, cards known to be out of the deck
+    :return: list of dicts with keys 'win', 'tie', 'equity' and 'exact', one per hand
+    """
+    check_cards(hands, board, dead)
+    spot = canonical_spot(hands, board, dead)
+    results = cached_exact(spot)
+    if results is None:
+        results = exact_canonical(*spot)
+        cache_exact(spot, results)
+    return results
+
+
+def submit_exact_equity(hands, board=(), dead=()):
+    """
+    Same as exact_equity without waiting: the runouts are enumerated by the process pool, unless the spot is in the
+    cache, where the pool's result is added once known
+    :return: concurrent.futures.Future of a list of dicts with keys 'win', 'tie', 'equity' and 'exact', one per hand
+    """
+    check_cards(hands, board, dead)
+    spot = canonical_spot(hands, board, dead)
+    result = Future()
+    results = cached_exact(spot)
+    if results is not None:
+        result.set_result(results)
+        return result
+
+    def done(future):
+        error = future.exception()
+        if error is None:
+            cache_exact(spot, future.result())
+        try:
+            if error is None:
+                result.set_result(future.result())
+            else:
+                result.set_exception(error)
+        except InvalidStateError:  # The result has been cancelled meanwhile
+            pass
+    get_executor().submit(exact_canonical, *spot).add_done_callback(done)
+    return result
+
+
+def preflop_class(hand):
+    """
+    Index (0-168) of the class of a starting hand. Pairs are on the diagonal of a 13x13 grid, suited hands above it
+    and offsuit hands below it.
+    :hand: list of 2 ints
+    :return: int
+    """
+    high, low = sorted((hand[0] % 13, hand[1] % 13), reverse=True)
+    if hand[0] // 13 == hand[1] // 13:
+        return high * 13 + low
+    return low * 13 + high
+
+
+def class_hands(index):
+    """
+    Every combination of cards belonging to a starting hand class
+    :index: int
+    :return: list of lists of 2 ints
+    """
+    return [list(hand) for hand in combinations(range(52), 2) if preflop_class(hand) == index]
+
+
+def load_preflop_table(path=PREFLOP_TABLE):
+    """
+    Load the heads-up preflop equity table from disk, making preflop all-in equities instant. Its values are
+    estimates, see build_preflop_table.
+    :path: str
+    :return: bool, True if the table has been loaded
+    """
+    global _preflop_table
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        if f.read(len(PREFLOP_MAGIC)) != PREFLOP_MAGIC:
+            raise ValueError(f"{path} is not a preflop equity table")
+        table = array('d')
+        table.fromfile(f, PREFLOP_CLASSES * PREFLOP_CLASSES)
+    _preflop_table = table
+    return True
+
+
+def build_preflop_table(path=PREFLOP_TABLE, samples=20000):
+    """
+    Estimate the equity of every starting hand class against every other class and save it to disk. Each matchup is
+    sampled over random non-conflicting combinations of both classes: a value is the average equity of the class
+    over every suit combination, give or take the sampling error, not the exact equity of particular hole cards.
+    There are 14365 matchups, so it takes hours: run it once offline.
+    :path: str
+    :samples: int, number of runouts sampled per matchup
+    :return: None
+    """
+    executor = get_executor()
+    hands = [class_hands(index) for index in range(PREFLOP_CLASSES)]
+    table = array('d', [0.0] * (PREFLOP_CLASSES * PREFLOP_CLASSES))
+    futures = {}
+    for a in range(PREFLOP_CLASSES):
+        for b in range(a, PREFLOP_CLASSES):
+            futures[a, b] = executor.submit(sample_matchup, hands[a], hands[b], samples,
+                                            random.SystemRandom().getrandbits(64))
+    for (a, b), future in futures.items():
+        table[a * PREFLOP_CLASSES + b] = future.result()
+        table[b * PREFLOP_CLASSES + a] = 1 - future.result()
+    with open(path, "wb") as f:
+        f.write(PREFLOP_MAGIC)
+        table.tofile(f)
+
+
+def sample_matchup(first, second, samples, seed):
+    """
+    Equity of a random hand of the first class against a random hand of the second class. Runs inside a worker
+    process.
+    :first: list of hands
+    :second: list of hands
+    :samples: int
+    :seed: int
+    :return: float
+    """
+    rng = random.Random(seed)
+    pairs = [(a, b) for a in first for b in second if not set(a) & set(b)]
+    equity = 0.0
+    for _ in range(samples):
+        a, b = rng.choice(pairs)
+        remaining = [card for card in range(52) if card not in a and card not in b]
+        winners, _ = showdown_shares([a, b], rng.sample(remaining, 5))
+        if 0 in winners:
+            equity += 1 / len(winners)
+    return equity / samples
+
+
+def in_preflop_table(hands, board, dead):
+    """
+    :return: bool, True if the equities of a spot can be read from the preflop table, i.e. heads-up preflop
+    """
+    return len(hands) == 2 and not board and not dead and _preflop_table is not None
+
+
+def equity(hands, board=(), dead=(), exact=False):
+    """
+    Equities of each hand using the fastest suitable method: the preflop table for heads-up preflop spots, exact
+    enumeration when there are few enough runouts, sampling otherwise
+    :hands: list of lists of int, hole cards of each player
+    :board: list of int, community cards already dealt
+    :dead: list of int, cards known to be out of the deck
+    :exact: bool, enumerate every runout of the hole cards however many there are, see exact_equity
+    :return: list of dicts with keys 'win', 'tie', 'equity' and 'exact', one per hand, 'exact' being False for
+             estimates. Win and tie are not known from the preflop table and are set to None.
+    """
+    remaining = check_cards(hands, board, dead)
+    if exact:
+        return exact_equity(hands, board, dead)
+    if in_preflop_table(hands, board, dead):
+        first = _preflop_table[preflop_class(hands[0]) * PREFLOP_CLASSES + preflop_class(hands[1])]
+        return [{'win': None, 'tie': None, 'equity': first, 'exact': False},
+                {'win': None, 'tie': None, 'equity': 1 - first, 'exact': False}]
+    if count_runouts(len(remaining), 5 - len(board)) <= EXACT_LIMIT:
+        return exact_equity(hands, board, dead)
+    return monte_carlo(hands, board, dead, samples=SAMPLES, target_ci=TARGET_CI)
+
+
+def submit_equity(hands, board=(), dead=()):
+    """
+    Same as equity without blocking the calling thread for more than a few milliseconds: unless the result is known
+    at once (preflop table, few runouts), it is computed by the process pool
+    :hands: list of lists of int, hole cards of each player
+    :board: list of int, community cards already dealt
+    :dead: list of int, cards known to be out of the deck
+    :return: concurrent.futures.Future of the list of dicts returned by equity
+    """
+    remaining = check_cards(hands, board, dead)
+    runouts = 0 if in_preflop_table(hands, board, dead) else count_runouts(len(remaining), 5 - len(board))
+    if runouts > EXACT_LIMIT:
+        return submit_monte_carlo(hands, board, dead, samples=SAMPLES, target_ci=TARGET_CI)
+    if runouts > INLINE_LIMIT:
+        return submit_exact_equity(hands, board, dead)
+    result = Future()
+    result.set_result(equity(hands, board, dead))
+    return result
+
+
+if __name__ == "__main__":
+    # Usage: python Equity.py [path], builds the preflop equity table
+    build_preflop_table(sys.argv[1] if len(sys.argv) > 1 else PREFLOP_TABLE)
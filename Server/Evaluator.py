@@ -0,0 +1,235 @@
+"""
+Fast hand evaluator based on precomputed lookup tables
+
+Every card id (same 0-51 encoding as the Deck) is mapped to a key made of a rank part and a suit part. Adding the
+keys of all the cards of a hand gives, in a single integer:
+- a rank hash (sum of 5^rank) which is unique for every multiset of ranks, used to look up the best non-flush hand
+- 4 suit counters of 3 bits each, used to detect a flush
+When a flush is found, the ranks of the flush suit are turned into a 13-bit mask and looked up in the flush table.
+
+The strength returned is an int, the higher the better. It is built from the same [category, kickers...] list as
+the one returned by Rules.hand_ranking, so it can be converted back with strength_to_ranking for ranking_reader.
+"""
+
+from itertools import combinations, combinations_with_replacement
+
+
+RANK_BITS = 31  # Number of bits used by the rank hash, 7 * 5^12 < 2^31
+RANK_MASK = (1 << RANK_BITS) - 1
+SUIT_BITS = 3  # Each suit counter holds up to 7 cards
+KICKER_BITS = 4  # Card values go from 2 to 14
+MAX_KICKERS = 5
+
+# Number of values following the category in a ranking, e.g. a straight is [4, high]
+RANKING_LENGTH = {0: 5, 1: 4, 2: 3, 3: 3, 4: 1, 5: 5, 6: 2, 7: 2, 8: 1}
+
+# A-2-3-4-5 (the wheel) as a mask of values 2 to 14
+WHEEL = (1 << 12) | 0b1111
+
+
+def ranking_to_strength(ranking):
+    """
+    Pack a ranking in the form [category, kickers...] into a comparable int
+    :ranking: list of ints
+    :return: int
+    """
+    strength = ranking[0]
+    for i in range(MAX_KICKERS):
+        strength <<= KICKER_BITS
+        if i + 1 < len(ranking):
+            strength |= ranking[i + 1]
+    return strength
+
+
+def strength_to_ranking(strength):
+    """
+    Unpack a strength returned by evaluate into the [category, kickers...] form used by Rules.ranking_reader
+    :strength: int
+    :return: list
+    """
+    category = strength >> (KICKER_BITS * MAX_KICKERS)
+    ranking = [category]
+    for i in range(RANKING_LENGTH[category]):
+        shift = KICKER_BITS * (MAX_KICKERS - 1 - i)
+        ranking.append((strength >> shift) & ((1 << KICKER_BITS) - 1))
+    return ranking
+
+
+def highest_straight(mask):
+    """
+    Find the highest straight in a mask of card ranks (bit 0 is a 2, bit 12 is an ace)
+    :mask: int
+    :return: int, value of the highest card of the straight, 0 if there is no straight
+    """
+    for high in range(12, 3, -1):
+        straight = 0b11111 << (high - 4)
+        if mask & straight == straight:
+            return high + 2
+    if mask & WHEEL == WHEEL:
+        return 5
+    return 0
+
+
+def top_values(mask, n):
+    """
+    Values (2 to 14) of the n highest ranks present in a mask, highest first
+    :mask: int
+    :n: int
+    :return: list
+    """
+    values = []
+    for rank in range(12, -1, -1):
+        if len(values) == n:
+            break
+        if mask & (1 << rank):
+            values.append(rank + 2)
+    return values
+
+
+def rank_ranking(counts):
+    """
+    Best non-flush ranking that can be made from a multiset of ranks
+    :counts: list of 13 ints, number of cards of each rank
+    :return: list
+    """
+    by_count = {4: [], 3: [], 2: [], 1: []}
+    mask = 0
+    for rank in range(12, -1, -1):
+        if counts[rank]:
+            by_count[counts[rank]].append(rank + 2)
+            mask |= 1 << rank
+
+    def kickers(excluded, n):
+        return [val for val in top_values(mask, MAX_KICKERS + 2) if val not in excluded][:n]
+
+    if by_count[4]:
+        quads = by_count[4][0]
+        return [7, quads] + kickers({quads}, 1)  # four of a kind
+    if by_count[3]:
+        trips = by_count[3][0]
+        pairs = sorted(by_count[3][1:] + by_count[2], reverse=True)
+        if pairs:
+            return [6, trips, pairs[0]]  # full house
+    straight = highest_straight(mask)
+    if straight:
+        return [4, straight]  # straight
+    if by_count[3]:
+        trips = by_count[3][0]
+        return [3, trips] + kickers({trips}, 2)  # three of a kind
+    if len(by_count[2]) >= 2:
+        high, low = by_count[2][:2]
+        return [2, high, low] + kickers({high, low}, 1)  # two pairs
+    if by_count[2]:
+        pair = by_count[2][0]
+        return [1, pair] + kickers({pair}, 3)  # one pair
+    return [0] + top_values(mask, 5)  # high card
+
+
+def flush_ranking(mask):
+    """
+    Best ranking that can be made from the ranks of 5 or more cards of the same suit
+    :mask: int, ranks of the suited cards
+    :return: list
+    """
+    straight = highest_straight(mask)
+    if straight:
+        return [8, straight]  # straight flush
+    return [5] + top_values(mask, 5)  # flush
+
+
+def build_rank_table():
+    """
+    Map the rank hash of every multiset of 5 to 7 ranks to its best non-flush strength
+    :return: dict
+    """
+    table = {}
+    for n in range(5, 8):
+        for ranks in combinations_with_replacement(range(13), n):
+            counts = [0] * 13
+            for rank in ranks:
+                counts[rank] += 1
+            if max(counts) > 4:
+                continue
+            key = sum(5 ** rank for rank in ranks)
+            table[key] = ranking_to_strength(rank_ranking(counts))
+    return table
+
+
+def build_flush_table():
+    """
+    Map every 13-bit mask of ranks with at least 5 bits set to its best flush strength, other masks map to 0
+    :return: list
+    """
+    table = [0] * (1 << 13)
+    for mask in range(1 << 13):
+        if bin(mask).count("1") >= 5:
+            table[mask] = ranking_to_strength(flush_ranking(mask))
+    return table
+
+
+def build_flush_suit_table():
+    """
+    Map the 4 packed suit counters to the suit having 5 cards or more, -1 if there is none
+    :return: list
+    """
+    table = [-1] * (1 << (SUIT_BITS * 4))
+    for counters in range(len(table)):
+        for suit in range(4):
+            if (counters >> (SUIT_BITS * suit)) & ((1 << SUIT_BITS) - 1) >= 5:
+                table[counters] = suit
+    return table
+
+
+CARD_KEY = [5 ** (card % 13) + (1 << (RANK_BITS + SUIT_BITS * (card // 13))) for card in range(52)]
+CARD_RANK_BIT = [1 << (card % 13) for card in range(52)]
+RANK_TABLE = build_rank_table()
+FLUSH_TABLE = build_flush_table()
+FLUSH_SUIT = build_flush_suit_table()
+
+
+def evaluate(cards):
+    """
+    Strength of the best 5-card hand that can be made from 5 to 7 cards. With 7 cards or less, a flush always beats
+    any hand that could be made from the remaining cards, so only the flush suit has to be looked at.
+    :cards: list of ints
+    :return: int
+    """
+    key = sum(map(CARD_KEY.__getitem__, cards))
+    suit = FLUSH_SUIT[key >> RANK_BITS]
+    if suit == -1:
+        return RANK_TABLE[key & RANK_MASK]
+    mask = 0
+    for card in cards:
+        if card // 13 == suit:
+            mask |= 1 << (card % 13)
+    return FLUSH_TABLE[mask]
+
+
+def evaluate_omaha(hand, board):
+    """
+    Strength of the best 5-card hand made of exactly 2 hole cards and 3 community cards, as in Omaha. The keys of
+    the 6 pairs of hole cards and of the 10 triples of community cards are added once, then each of the 60 hands is
+    a single lookup in the rank table. Flushes are only looked for when 3 community cards and 2 hole cards share a
+    suit, which happens for a few hands only.
+    :hand: list of ints, 4 hole cards (or any number from 2)
+    :board: list of ints, 5 community cards (or 3 to 5)
+    :return: int, comparable with the strengths returned by evaluate
+    """
+    pairs = [(CARD_KEY[a] + CARD_KEY[b]) & RANK_MASK for a, b in combinations(hand, 2)]
+    triples = [(CARD_KEY[a] + CARD_KEY[b] + CARD_KEY[c]) & RANK_MASK for a, b, c in combinations(board, 3)]
+    best = max([RANK_TABLE[pair + triple] for pair in pairs for triple in triples])
+    for suit in range(4):
+        suited_board = [card for card in board if card // 13 == suit]
+        if len(suited_board) < 3:
+            continue
+        suited_hand = [card for card in hand if card // 13 == suit]
+        if len(suited_hand) < 2:
+            break  # At most one suit has 3 cards on a board of 5
+        for a, b in combinations(suited_hand, 2):
+            for c, d, e in combinations(suited_board, 3):
+                strength = FLUSH_TABLE[CARD_RANK_BIT[a] | CARD_RANK_BIT[b] | CARD_RANK_BIT[c] | CARD_RANK_BIT[d] |
+                                       CARD_RANK_BIT[e]]
+                if strength > best:
+                    best = strength
+        break
+    return best
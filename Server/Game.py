@@ -2,23 +2,48 @@
 Handles the main game's flow
 """
 
-from itertools import cycle, combinations
+from collections import OrderedDict
+from functools import partial
 import random
-from time import sleep
+import threading
+from time import perf_counter
 from Deck import Deck
-from Player import Player
+from Player import Player, Message
 from Chat import Chat
-from Rules import hand_ranking, best_hand, ranking_reader
+from Rules import ranking_reader
+from Evaluator import strength_to_ranking
+from Equity import submit_equity
+from Wire import encode_cards, encode_showdown, encode_state
+from HandHistory import HandRecord
+from Seats import seat_bit, seat_count, next_seat, previous_seat
+from Settlement import build_pots, uncalled_bet, award
+from Variants import HOLDEM
+import Metrics
 
 
-MAX_PLAYERS = 6
+MAX_PLAYERS = 6  # Seats of a table, as displayed by the client
+MAX_SEATS = 10  # Largest table the server can run, e.g. for simulations
+STATE_HISTORY = 16  # Number of past game's state versions kept to compute delta updates
 
 
 class Game:
-    def __init__(self):
-        self.players = [None] * MAX_PLAYERS  # List of players
+    __slots__ = ('table_id', 'max_players', 'players', 'in_hand_seats', 'active_seats', 'pots', 'pot_players',
+                 'contributions', 'deck', 'round', 'dealer', 'highest_bet',
+                 'second_highest_bet', 'acting', 'last_to_act', 'community', 'sb', 'bb', 'on', 'chat', 'log',
+                 'show_equities', 'version', 'states', 'hand_number', 'history', 'record', 'deck_pool', 'snapshots',
+                 'variant', 'schedule', 'runout', 'lock', 'director')
+
+    def __init__(self, table_id=0, max_players=MAX_PLAYERS, variant=HOLDEM):
+        if not 2 <= max_players <= MAX_SEATS:
+            raise ValueError(f"A table has 2 to {MAX_SEATS} seats")
+        self.table_id = table_id  # Id of the table in the server's table registry
+        self.max_players = max_players  # Number of seats
+        self.players = [None] * max_players  # List of players
+        self.in_hand_seats = 0  # Bitmask of the seats still in hand, see Seats.py
+        self.active_seats = 0  # Bitmask of the seats still in hand and not all in, i.e. who may still act
         self.pots = [0]  # List of pots, including main and side pots
         self.pot_players = [[]]  # List of corresponding players in each pot
+        self.contributions = {}  # Player -> chips put in during the current hand, folded players included
         self.deck = None  # Current game's deck
         self.round = 0  # 0: pre-flop, 1: flop, 2: turn, 3: river, 4: showdown
         self.dealer = 0  # Index of player with the dealer's chip
@@ -26,11 +51,29 @@ class Game:
         self.second_highest_bet = 0  # Second highest bet on the table
         self.acting = 0  # Index of player having to act now
         self.last_to_act = 0  # Index of last player to act
-        self.community = []  # List of community cards
+        self.community = bytearray()  # Community cards, 1 byte each
         self.sb = 0  # Small blind
         self.bb = 0  # Big blind
         self.on = False  # Game on
-        self.chat = Chat()  # Chat object for debugging
+        self.chat = Chat(table_id)  # Chat object for debugging
+        self.log = self.chat.log  # Same logger as the chat, with the table's id
+        self.show_equities = True  # Announce players' equities when everyone is all in
+        self.version = 0  # Version of the game's state, increased whenever the state sent to players changes
+        self.states = OrderedDict()  # Version -> tuple of the game's state components of the recent versions
+        self.hand_number = 0  # Number of hands started at the table
+        self.history = None  # HandHistory log the finished hands are written to, if any
+        self.record = None  # HandRecord of the hand being played, if it is logged
+        self.deck_pool = None  # DeckPool the decks are taken from, if any
+        self.snapshots = None  # Snapshots the table's state is saved to after every change, if any
+        self.variant = variant  # Poker variant played at the table, see Variants.py
+        # Function (delay, callback) calling back later, which can be called from any thread, e.g. when the equities
+        # computed by the process pool are known. Without it, the table waits for them.
+        self.schedule = None
+        self.runout = None  # Future of the equities the rest of the community is waiting for, if any
+        # Held while the table is changed from a thread that does not own it, e.g. the handler threads and timers of
+        # Server.py. Re-entrant since a change of the table can lead to another one, e.g. a chat flush.
+        self.lock = threading.RLock()
+        self.director = None  # Tournament director raising the blinds and moving players between hands, if any
 
 
     def set_blinds(self, sb, bb):
@@ -43,6 +86,7 @@ class Game:
         self.sb = sb
         self.bb = bb
         self.chat.update_chat(f"Blinds set to {sb}/{bb}")
+        self.checkpoint()
 
 
     def add_player(self, name, player_socket, name_changed):
@@ -67,18 +111,21 @@ class Game:
         
         # Assign a random seat
         while True:
-            i = random.choice(range(MAX_PLAYERS))
+            i = random.choice(range(self.max_players))
             if not self.players[i]:
                 self.player_sit(player, i)
                 break
         if name_changed:
             # If player's name is changed because the chosen name is taken, send the new name to the player
             player.send_to_client('name', name)
-            sleep(1)
+            player.pause(1)
         self.send_game_state()
         if name_changed:
             # Notify the new name to the player
             player.send_to_client('message', f"You picked an existed name. Your new name is now {name}.")
+        if self.variant is not HOLDEM:
+            player.send_to_client('message', f"This table plays {self.variant.title}.")
+        self.send_chat_history(player)
         return player
 
 
@@ -116,17 +163,31 @@ class Game:
         """
         self.players[seat] = player
         self.chat.update_chat(f"{player} took seat #{seat}.")
+        self.checkpoint()
 
 
     def player_stand(self, player):
         """
-        Make a player stand up
+        Make a player stand up. Leaving the table in the middle of a hand folds it, chips already put in stay in the
+        pots, and the hand goes on without the player.
         :player: Player object
         :return: None
         """
         seat = self.players.index(player)
+        folding = self.on and player.in_hand
+        if folding:
+            acting = seat == self.acting
+            end_round = acting and seat == self.last_to_act
+            self.fold(player, seat, end_round)
+            self.record_action(seat, "fold", 0)
         self.players[seat] = None
+        player.in_hand = False
         self.chat.update_chat(f"{player} stood up.")
+        if folding and (acting or seat_count(self.in_hand_seats) == 1):
+            # The turn moves on, or the hand ends, as if the player had folded
+            self.next_turn(end_round)
+        else:
+            self.checkpoint()
 
 
     def can_start(self):
@@ -145,106 +206,124 @@ class Game:
 
     def new_game(self):
         """
-        Starts a new game
+        Starts a new game, if the table's tournament director lets it
         :return: None
         """
-        self.deck = Deck()
+        if self.director and not self.director.before_hand(self):
+            return
+        self.deck = self.deck_pool.get() if self.deck_pool else Deck()
+        self.hand_number += 1
         self.round = 0
         self.highest_bet = self.bb
         self.second_highest_bet = 0
-        self.community = []
+        self.community = bytearray()
+        self.pots = [0]
         self.pot_players = [[]]
+        self.contributions = {}
 
-        # Cycle through the players list to find the next dealer, deal 2 cards, and other housekeeping stuffs
-        num_players = 0
-        first_player_seat = -1
-        next_dealer_found = False
-        playing = []
+        # Deal hole cards to everyone having chips, find the next dealer, and other housekeeping stuffs
+        playing = 0
         for i, player in enumerate(self.players):
             if not player:
                 continue
             if not player.stack:
                 player.in_hand = False
-                player.hand = []
+                player.hand = b""
                 continue
-            if first_player_seat == -1:
-                first_player_seat = i
-            playing.append(i)
+            playing |= seat_bit(i)
             player.in_hand = True
             player.all_in = False
-            player.hand = self.deck.deal_cards(2)
-            num_players += 1
-            if i > self.dealer:
-                self.dealer = i
-                next_dealer_found = True
-            # Send player's hand over the network
-            msg = ""
-            for card in player.hand:
-                if card < 10:
-                    msg += "0"
-                msg += str(card)
-            player.send_to_client('hand', msg)
-        if not next_dealer_found:
-            self.dealer = first_player_seat
+            player.hand = self.deck.deal_cards(self.variant.hole_cards)
+            self.send_hand(player)
+        self.in_hand_seats = self.active_seats = playing
+        self.dealer = next_seat(playing, self.dealer)
 
-        if num_players == 2:
+        if seat_count(playing) == 2:
             sb_pos = self.acting = self.dealer
-            playing.remove(sb_pos)
-            bb_pos = playing[0]
+            bb_pos = next_seat(playing, sb_pos)
         else:
-            cyc = cycle(playing)
-            for i in cyc:
-                if i == self.dealer:
-                    sb_pos = next(cyc)
-                    bb_pos = next(cyc)
-                    self.acting = next(cyc)
-                    break
-
-        self.last_to_act = bb_pos
+            sb_pos = next_seat(playing, self.dealer)
+            bb_pos = next_seat(playing, sb_pos)
+            self.acting = next_seat(playing, bb_pos)
+
+        if self.history:
+            self.record = HandRecord(self)
         sb_player = self.players[sb_pos]
         bb_player = self.players[bb_pos]
         if self.sb >= sb_player.stack:
             sb_player.shove()
         else:
             sb_player.bet(self.sb)
+        self.record_action(sb_pos, 'blind', sb_player.betting)
         if self.bb >= bb_player.stack:
             bb_player.shove()
         else:
             bb_player.bet(self.bb)
+        self.record_action(bb_pos, 'blind', bb_player.betting)
+        for pos, player in ((sb_pos, sb_player), (bb_pos, bb_player)):
+            if player.all_in:
+                self.active_seats &= ~seat_bit(pos)
         self.on = True
+        if self.nobody_to_act():
+            # Blinds put everyone but at most one covering player all in
+            self.send_game_state()
+            self.gather_chips()
+            self.round += 1
+            self.draw_the_rest()
+            return
+        # Players all in from the blinds are skipped
+        self.acting = next_seat(self.active_seats, self.acting - 1)
+        self.last_to_act = previous_seat(self.active_seats, bb_pos + 1)
         self.send_game_state()
+        self.checkpoint()
+
+
+    def nobody_to_act(self):
+        """
+        :return: bool, True if everyone still in hand is all in, but at most one player who already matched the
+                 highest bet: no one has anything left to decide
+        """
+        return not self.active_seats or (seat_count(self.active_seats) == 1 and
+                                         self.players[next_seat(self.active_seats, 0)].betting >= self.highest_bet)
+
+
+    def send_hand(self, player):
+        """
+        Send a player's hole cards over the network
+        :player: Player object
+        :return: None
+        """
+        msg = ""
+        for card in player.hand:
+            if card < 10:
+                msg += "0"
+            msg += str(card)
+        player.send_to_client('hand', msg, encode_cards(player.hand))
 
 
     def gather_chips(self):
         """
-        Gathers everyone's chips into the middle at the end of each round
+        Gathers everyone's chips into the middle at the end of each round. Pots are rebuilt from what every player
+        put in since the start of the hand, the part of a bet that nobody matched is given back.
         :return: None
         """
-        in_hand = [player for player in self.players if player and player.in_hand]
+        for player in self.players:
+            if player:
+                player.betting = 0
+        player, chips = uncalled_bet(self.contribution_list())
+        if player:
+            player.stack += chips
+            self.contributions[player] -= chips
+        pots = build_pots(self.contribution_list())
+        self.pots = [amount for amount, _ in pots] or [0]
+        self.pot_players = [players for _, players in pots] or [[]]
 
-        list_bet = sorted(set([player.betting for player in in_hand if player.betting > 0]))
-        for i in range(len(list_bet)):
-            diff = list_bet[i]
-            if i > 0:
-                self.pots.append(0)
-                self.pot_players.append([])
-                diff = list_bet[i] - list_bet[i - 1]
-            pot_players = []
-            for player in self.players:
-                if not player or player.betting == 0:
-                    continue
-                if player in in_hand and player.betting >= diff:
-                    pot_players.append(player)
-                into_pot = min(player.betting, diff)
-                self.pots[-1] += into_pot
-                player.betting -= into_pot
-            self.pot_players[-1] = pot_players
-        if len(self.pot_players[-1]) == 1:
-            player = self.pot_players[-1][0]  # The only one player in a side pot, i.e. he should get a refund
-            pot_money = self.pots[-1]
-            player.stack += pot_money
-            del self.pot_players[-1]
-            del self.pots[-1]
+
+    def contribution_list(self):
+        """
+        :return: list of (player, chips put in during the hand, still in hand), as used by Settlement.py
+        """
+        return [(player, chips, player.in_hand) for player, chips in self.contributions.items()]
 
 
     def end_game(self):
@@ -253,45 +332,40 @@ class Game:
         :return: None
         """
         if self.round == 4:  # Hands showdown, i.e. after the river
-            num_pots = len(self.pots)
-            left_over = 0
-            results = []
-            for i in range(1, num_pots + 1):
-                self.pots[-i] += left_over  # Left-over is passed on to the next side-pot
-                winners = []
-                winning_hand = [0]
-                for player in self.pot_players[-i]:
-                    seven_cards = self.community + player.hand
-                    player_best = hand_ranking(best_hand(combinations(seven_cards, 5)))
-                    if player_best > winning_hand:
-                        winning_hand = player_best
-                        winners = [player]
-                    elif player_best == winning_hand:
-                        winners.append(player)
-                for winner in winners:
-                    winner.stack += self.pots[-i] // len(winners)
-
-                pot_results = [self.pots[-i] // len(winners), winners, winning_hand]
-                results.insert(0, pot_results)
-                left_over = self.pots[-i] % len(winners)
-
-            self.pots = [left_over]  # Finally if there is any left-over, it is passed on to the next game
+            start = perf_counter()
+            # Every hand still in is evaluated once, whatever the number of pots it can win
+            strengths = {player: self.variant.strength(player.hand, self.community)
+                         for player in self.contributions if player.in_hand}
+            order = {player: (seat - self.dealer - 1) % self.max_players
+                     for seat, player in enumerate(self.players) if player}
+            pots = build_pots(self.contribution_list())
+            results = [[amount, winners, strength_to_ranking(strength), won]
+                       for amount, winners, strength, won in award(pots, strengths, order)]
+            Metrics.SHOWDOWN_TIME.observe(perf_counter() - start)
 
         else:  # Game ending before showdown means that all but one player have folded
-            winning_amount = sum(self.pots)
             for player in self.players:
                 if not player:
                     continue
                 if player.in_hand:
                     winner = player  # The sole winner has been determined
-                winning_amount += player.betting
                 player.betting = 0
+            winning_amount = sum(self.contributions.values())
             winner.stack += winning_amount
-            results = [[winning_amount, [winner], None]]
+            results = [[winning_amount, [winner], None, [winning_amount]]]
 
         self.pots = [0]
         self.on = False
+        self.deck = None  # Not needed until the next hand
+        Metrics.HANDS.inc()
+        if self.record:
+            seats = {player: i for i, player in enumerate(self.players) if player}
+            self.history.write(self.record.encode(self.community, results, seats))
+            self.record = None
         self.announce_winners(results)
+        self.checkpoint()
+        if self.director:
+            self.director.after_hand(self)
 
 
     def act(self, actor, action, amt):
@@ -304,43 +378,27 @@ class Game:
         """
         bet_diff = self.highest_bet - self.second_highest_bet
         end_round = False
-        in_hand = []
-        not_all_in = []
         actor_index = self.players.index(actor)
-        no_raising = False
+        actor_bit = seat_bit(actor_index)
+        actor_betting = actor.betting
 
-        for i, player in enumerate(self.players):
-            if player and player.in_hand:
-                in_hand.append(i)
-                if not player.all_in:
-                    not_all_in.append(i)
+        if action in ["bet", "shove"]:
+            # A bet above the variant's limit, e.g. the pot in Pot-Limit Omaha, is reduced to the limit
+            limit = self.variant.max_bet(self, actor) - actor_betting
+            if (action == "shove" and actor.stack > limit) or (action == "bet" and amt > limit):
+                action, amt = ("shove", 0) if limit == actor.stack else ("bet", limit)
+                actor.send_to_client('message', f"Your bet is reduced to the limit of {actor_betting + limit}.")
 
         if action in ["fold", "check", "call"] and self.acting == self.last_to_act:
             end_round = True
 
         if action == "fold":
-            actor.fold()
-            in_hand.remove(actor_index)
-            if not end_round:
-                find_next_acting = cycle(not_all_in)
-                for i in find_next_acting:
-                    if i == actor_index:
-                        self.acting = next(find_next_acting)
-                        break
-            not_all_in.remove(actor_index)
-            for pot in self.pot_players:
-                if actor in pot:
-                    pot.remove(actor)
-            self.chat.update_chat(f"{actor} folded.")
+            self.fold(actor, actor_index, end_round)
 
         elif action == "check":
             actor.check()
-            find_next_acting = cycle(not_all_in)
             if not end_round:
-                for i in find_next_acting:
-                    if i == actor_index:
-                        self.acting = next(find_next_acting)
-                        break
+                self.acting = next_seat(self.active_seats, actor_index)
             self.chat.update_chat(f"{actor} checked.")
 
         elif action == "call":
@@ -351,29 +409,17 @@ class Game:
             actor.call(call_amount)
             call_all_in = ""
             if not end_round:
-                find_next_acting = cycle(not_all_in)
-                for i in find_next_acting:
-                    if i == actor_index:
-                        self.acting = next(find_next_acting)
-                        break
+                self.acting = next_seat(self.active_seats, actor_index)
             if actor.all_in:
-                not_all_in.remove(actor_index)
+                self.active_seats &= ~actor_bit
                 call_all_in = "ALL IN "
             self.chat.update_chat(f"{actor} called {call_all_in}{call_amount} chips.")
 
         elif action == "shove":
             actor.shove()
-            find_next_acting = cycle(not_all_in)
-            for i in find_next_acting:
-                if i == actor_index:
-                    self.acting = next(find_next_acting)
-                    break
-            find_last_to_act = cycle(reversed(not_all_in))
-            for i in find_last_to_act:
-                if i == actor_index:
-                    self.last_to_act = next(find_last_to_act)
-                    break
-            not_all_in.remove(actor_index)
+            self.acting = next_seat(self.active_seats, actor_index)
+            self.last_to_act = previous_seat(self.active_seats, actor_index)
+            self.active_seats &= ~actor_bit
             if actor.betting - self.highest_bet >= bet_diff:
                 self.second_highest_bet, self.highest_bet = self.highest_bet, actor.betting
             else:
@@ -382,48 +428,64 @@ class Game:
 
         elif action == "bet":
             actor.bet(amt)
-            find_next_acting = cycle(not_all_in)
-            for i in find_next_acting:
-                if i == actor_index:
-                    self.acting = next(find_next_acting)
-                    break
-            find_last_to_act = cycle(reversed(not_all_in))
-            for i in find_last_to_act:
-                if i == actor_index:
-                    self.last_to_act = next(find_last_to_act)
-                    break
+            self.acting = next_seat(self.active_seats, actor_index)
+            self.last_to_act = previous_seat(self.active_seats, actor_index)
+            if actor.all_in:
+                self.active_seats &= ~actor_bit
             self.second_highest_bet, self.highest_bet = self.highest_bet, actor.betting
             self.chat.update_chat(f"{actor} raised {amt} chips to the total of {actor.betting}.")
 
-        # After an action, the following lines of code handle the game's state
+        self.record_action(actor_index, action, actor.betting - actor_betting)
 
-        if len(not_all_in) == 1:  # Testing
-            no_raising = True
+        self.next_turn(end_round)
 
-        if len(in_hand) == 1:  # If everyone folds and only 1 player is left, game over
+
+    def fold(self, player, seat, end_round):
+        """
+        Folds a player's hand, on his turn or when he leaves the table. The player whose turn it is gives it to the next
+        one, unless the round ends; a player folding out of turn who was to act last hands that to the one before him.
+        :player: Player object
+        :seat: int
+        :end_round: bool, the player is acting and was the last to act this round
+        :return: None
+        """
+        bit = seat_bit(seat)
+        player.fold()
+        if seat == self.acting:
+            if not end_round:
+                self.acting = next_seat(self.active_seats, seat)
+        elif seat == self.last_to_act and self.active_seats & ~bit:
+            self.last_to_act = previous_seat(self.active_seats & ~bit, seat)
+        self.in_hand_seats &= ~bit
+        self.active_seats &= ~bit
+        for pot in self.pot_players:
+            if player in pot:
+                pot.remove(player)
+        self.chat.update_chat(f"{player} folded.")
+
+
+    def next_turn(self, end_round):
+        """
+        Handles the game's state after an action: ends the hand if everyone but one player folded, goes to the next
+        round if this one is over, and sends the new state
+        :end_round: bool, the last player to act this round just acted
+        :return: None
+        """
+        no_raising = seat_count(self.active_seats) == 1  # Testing
+        if seat_count(self.in_hand_seats) == 1:  # If everyone folds and only 1 player is left, game over
             self.end_game()
 
         elif end_round and self.round <= 3:
             self.gather_chips()
             self.round += 1
             self.highest_bet = self.second_highest_bet = 0
-            if len(not_all_in) >= 2:
+            if seat_count(self.active_seats) >= 2:
                 # When the next round starts, decide who goes first and goes last
-                for i in not_all_in:
-                    if i > self.dealer:
-                        self.acting = i
-                        break
-                else:
-                    self.acting = not_all_in[0]
-                find_last_to_act = cycle(reversed(not_all_in))
-                for i in find_last_to_act:
-                    if i == self.acting:
-                        self.last_to_act = next(find_last_to_act)
-                        break
+                self.acting = next_seat(self.active_seats, self.dealer)
+                self.last_to_act = previous_seat(self.active_seats, self.acting)
             else:
                 # When everyone has gone all in, go to show down
                 self.draw_the_rest()
-                self.end_game()
                 # self.send_game_state()  # REVIEW
                 return
 
@@ -432,8 +494,8 @@ class Game:
                 self.end_game()
                 return  # REVIEW
             elif self.round == 1:  # Preflop -> Flop
-                self.community = self.deck.deal_cards(3)
-                self.chat.update_chat("Flop: " + str(self.community))
+                self.community = bytearray(self.deck.deal_cards(3))
+                self.chat.update_chat("Flop: " + str(list(self.community)))
             elif self.round == 2:  # Flop -> Turn
                 self.community.append(self.deck.deal_cards(1)[0])
                 self.chat.update_chat("Turn: " + str(self.community[3]))
@@ -442,6 +504,30 @@ class Game:
                 self.chat.update_chat("River: " + str(self.community[4]))
 
         self.send_game_state(no_raising)
+        self.checkpoint()
+
+
+    def record_action(self, seat, action, amount):
+        """
+        Counts the chips put in by an action, and adds the action to the record of the hand if it is logged
+        :seat: int
+        :action: str, e.g. "call"
+        :amount: int, chips put in by the action
+        :return: None
+        """
+        player = self.players[seat]
+        self.contributions[player] = self.contributions.get(player, 0) + amount
+        if self.record:
+            self.record.add_action(seat, self.round, action, amount)
+
+
+    def checkpoint(self):
+        """
+        Reports a change of the table's state once it is over, if snapshots are taken, see Snapshot.py
+        :return: None
+        """
+        if self.snapshots:
+            self.snapshots.update(self)
 
 
     def announce_winners(self, results):
@@ -452,7 +538,8 @@ class Game:
         """
         msg = ""
         for i, result in enumerate(results):
-            winning_amount, winners, winning_hand = result
+            _, winners, winning_hand, won = result
+            winning_amount = min(won)  # Share of each winner, odd chips aside
             win = "win" if len(winners) == 1 else "split"
             if i == 0:
                 pot_name = "main pot"
@@ -462,42 +549,149 @@ class Game:
                 msg = f"{winners[0]} wins {winning_amount} chips"
             else:
                 msg += f"{', '.join(map(str, winners))} {win} {winning_amount} chips from the {pot_name} with {ranking_reader(winning_hand)}\n"
-        sleep(0.5)  # Sleep for 0.5 sec to make sure every previous message is properly parsed and executed by clients before sending the message
+        self.pace(0.5)
         self.send_all('announcement', msg)
         
 
-    def send_all(self, protocol, msg):
+    def send_all(self, protocol, msg, payload=None):
         """
         Send a message over the network to all players
         :protocol: str, keys in Player.sp
         :msg: str, message to be sent over the network
+        :payload: bytes, binary encoding of the message if it's not just the text
+        :return: None
+        """
+        message = Message(protocol, msg, payload)
+        for player in self.players:
+            if player:
+                player.send(message)
+        self.log.debug("Sent to all: %s", message)
+
+
+    def send_chat(self, msg):
+        """
+        Broadcast a player's chat message. Messages following the previous broadcast too closely are held and then
+        broadcast together, so that a burst of messages costs a single message to every player.
+        :msg: str, e.g. "Bob: nice hand"
+        :return: None
+        """
+        delay = self.chat.post(msg)
+        if delay == 0:
+            self.flush_chat()
+        elif delay is not None:
+            self.chat.schedule(delay, self.flush_chat)
+
+
+    def flush_chat(self):
+        """
+        Broadcast the chat messages being held, if any. Called back by the chat's schedule, possibly from another thread.
+        :return: None
+        """
+        with self.lock:
+            msg = self.chat.flush()
+            if msg:
+                self.send_all('message', msg)
+
+
+    def send_chat_history(self, player):
+        """
+        Send the table's recent chat messages to a player joining it, all in one message
+        :player: Player object
+        :return: None
+        """
+        history = self.chat.history()
+        if history:
+            player.send_to_client('message', "Recent chat:\n" + history)
+
+
+    def pace(self, seconds):
+        """
+        Make sure every previous message is properly parsed and executed by clients before sending the next one.
+        Only the players' outboxes wait, the table itself never sleeps.
+        :seconds: float
         :return: None
         """
         for player in self.players:
             if player:
-                player.send_to_client(protocol, msg)
+                player.pause(seconds)
         
 
     def draw_the_rest(self):
         """
-        Draw the rest of the cards in the community
+        Everyone is all in: shows the hands and announces the equities, then draws the rest of the community and
+        ends the game. Equities may take a while to compute: they are left to the process pool of Equity.py and, if
+        the table can be called back, the hand goes on once they are known, so that other tables never wait.
+        :return: None
         """
         self.showdown()
+        if not self.show_equities or not self.variant.equities:
+            self.run_out()
+            return
+        in_hand = [player for player in self.players if player and player.in_hand]
+        future = submit_equity([list(player.hand) for player in in_hand], list(self.community))
+        if self.schedule is None:
+            self.announce_equities(in_hand, future)
+            self.run_out()
+            return
+        self.runout = future
+        self.checkpoint()
+        future.add_done_callback(lambda future: self.schedule(0, partial(self.equities_known, in_hand, future)))
+
+
+    def equities_known(self, in_hand, future):
+        """
+        Goes on with the hand waiting for its equities. Called back by the table's schedule, possibly from another thread.
+        :in_hand: list of Player objects, whose equities are computed
+        :future: concurrent.futures.Future of the equities
+        :return: None
+        """
+        with self.lock:
+            if self.runout is not future:
+                return
+            self.runout = None
+            self.announce_equities(in_hand, future)
+            self.run_out()
+
+
+    def run_out(self):
+        """
+        Draw the rest of the cards in the community, then ends the game
+        :return: None
+        """
         if self.round == 1:  # Pre-flop all-in
             self.community += self.deck.deal_cards(3)  # Draw 3 flop cards
             self.send_game_state()
             self.round += 1
-            sleep(1)
+            self.pace(1)
         if self.round == 2:  # Flop all-in
             self.community += self.deck.deal_cards(1)  # Draw turn card
             self.send_game_state()
             self.round += 1
-            sleep(1)
+            self.pace(1)
         if self.round == 3:  # Turn all-in
             self.community += self.deck.deal_cards(1)  # Draw river card
             self.send_game_state()
             self.round += 1
-            sleep(1)
+            self.pace(1)
+        self.end_game()
+
+
+    def announce_equities(self, in_hand, future):
+        """
+        Announce the equity of each player still in hand before the rest of the community is drawn
+        :in_hand: list of Player objects
+        :future: concurrent.futures.Future of their equities, as computed by Equity.submit_equity
+        :return: None
+        """
+        try:
+            results = future.result()
+        except Exception:
+            self.log.exception("Equities could not be computed")
+            return
+        msg = ", ".join(f"{player} {result['equity']:.1%}" for player, result in zip(in_hand, results))
+        msg = ("Equities: " if all(result['exact'] for result in results) else "Estimated equities: ") + msg
+        self.chat.update_chat(msg)
+        self.send_all('message', msg)
 
 
     def showdown(self):
@@ -505,6 +699,7 @@ class Game:
         Show cards of everyone still playing
         """
         players_info = []
+        hands = []
         for i, player in enumerate(self.players):
             if not player or not player.in_hand:
                 continue
@@ -514,64 +709,129 @@ class Game:
                     msg += "0"
                 msg += str(card)
             players_info.append(msg)
+            hands.append((i, player.hand))
         msg = ' '.join(players_info)
-        self.send_all('showdown', msg)
+        self.send_all('showdown', msg, encode_showdown(hands))
 
 
-    def send_game_state(self, *args):
+    def send_game_state(self, no_raising=False, full=False):
         """
-        Shortcut to send game's state to all players
+        Shortcut to send game's state to all players. Players who negotiated delta updates only get the components
+        that changed since the last version they acknowledged, or the full state if that version is too old.
+        :no_raising: bool, the acting player cannot raise
+        :full: bool, force sending the full state to everyone
+        :return: None
         """
-        if args and args[0]:
-            msg = self.game_info(True)
-        else:
-            msg = self.game_info()
-        sleep(0.5)  # Sleep for 0.5 sec to make sure every previous message is properly parsed and executed by clients before sending the current message
-        self.send_all('game', msg)
+        components = self.state_components(no_raising)
+        values = tuple(components.values())
+        previous = self.states.get(self.version)
+        if values != previous:
+            if previous:
+                # Unchanged components share the strings of the previous version to keep the history small
+                values = tuple(old if old == new else new for old, new in zip(previous, values))
+            self.version += 1
+            self.states[self.version] = values
+            if len(self.states) > STATE_HISTORY:
+                self.states.popitem(last=False)
+        # Every message is encoded once and shared by all the players it's sent to
+        seated = [player for player in self.players if player]
+        self.prune_states(seated)
+        binary = encode_state(self, no_raising) if any(player.sock.binary for player in seated) else None
+        snapshot = Message('game', format_state(components), binary)
+        versioned = None  # Full state with its version, for players having negotiated delta updates
+        deltas = {}  # Base version -> delta message
+        self.pace(0.5)
+        for player in seated:
+            if player.sock.binary or not player.delta:
+                player.send(snapshot)
+            elif full or player.acked_version not in self.states:
+                if versioned is None:
+                    versioned = Message('game', f"VS({self.version}:0) " + snapshot.msg[1:])
+                player.send(versioned)
+            elif player.acked_version != self.version:
+                base = player.acked_version
+                if base not in deltas:
+                    changed = {key: value for (key, value), old in zip(components.items(), self.states[base])
+                               if old != value}
+                    deltas[base] = Message('delta', f"VS({self.version}:{base}) " + format_state(changed))
+                player.send(deltas[base])
+        self.log.debug("Sent to all: %s", snapshot)
+
+
+    def prune_states(self, seated):
+        """
+        Forget the versions of the game's state older than every version the players may still acknowledge, i.e.
+        older than the oldest one acknowledged by a player using delta updates
+        :seated: list of Player objects
+        :return: None
+        """
+        oldest = min((player.acked_version for player in seated if player.delta and player.acked_version is not None),
+                     default=self.version)
+        while len(self.states) > 1 and next(iter(self.states)) < oldest:
+            self.states.popitem(last=False)
 
 
-    def game_info(self, *args):
+    def state_components(self, no_raising=False):
         """
-        Generate a string containing all info of current game to send over the network
-        :return: str
+        Current game's state as components, each seat being a component of its own so that it can be sent alone
+        :no_raising: bool
+        :return: dict, e.g. {'ON': "1", 'BL': "5:10", 'P0': "0:TrungDam:100:10:1", 'P1': "1:_", ...}
         """
-        # Message example: ON(1) PL(0:TrungDam:100:10:1,1:_,2:_) PT(100:50) DL(0) AC(0) CM(0:33:15)
-        msg = ""
+        components = {}
 
         # Game on or off
-        msg += f"ON({int(self.on)}) "
+        components['ON'] = str(int(self.on))
 
         # Blinds
-        msg += f"BL({self.sb}:{self.bb}) "
+        components['BL'] = f"{self.sb}:{self.bb}"
 
         # Players currently sitting
-        players_info = []
         for i, player in enumerate(self.players):
             if player:
-                players_info.append(f"{i}:{player.name}:{player.stack}:{player.betting}:{int(player.in_hand)}")
+                components[f"P{i}"] = f"{i}:{player.name}:{player.stack}:{player.betting}:{int(player.in_hand)}"
             else:
-                players_info.append(f"{i}:_")
-        msg += f"PL({','.join(players_info)}) "
+                components[f"P{i}"] = f"{i}:_"
 
         # Highest & 2nd highest bet
-        msg += f"BT({self.highest_bet}:{self.second_highest_bet}) "
-        
+        components['BT'] = f"{self.highest_bet}:{self.second_highest_bet}"
+
         # Main and side pots
-        msg += f"PT({':'.join(map(str, self.pots))}) "
+        components['PT'] = ':'.join(map(str, self.pots))
 
         # Dealer's chip and action position
-        msg += f"DL({self.dealer}) "
-        msg += f"AC({self.acting}) "
+        components['DL'] = str(self.dealer)
+        components['AC'] = str(self.acting)
 
         # Community
-        if len(self.community) == 0:
-            msg += "CM() "
-        else:
-            msg += f"CM({':'.join(map(str, self.community))}) "
-        
+        components['CM'] = ':'.join(map(str, self.community))
+
         # Test functionality (no betting)
-        if (args and args[0]):
-            msg += f"NR(1)"
+        components['NR'] = str(int(no_raising))
+        return components
+
+
+    def game_info(self, no_raising=False):
+        """
+        Generate a string containing all info of current game to send over the network
+        :return: str
+        """
+        # Message example: ON(1) PL(0:TrungDam:100:10:1,1:_,2:_) PT(100:50) DL(0) AC(0) CM(0:33:15)
+        return format_state(self.state_components(no_raising))
+
+
+def format_state(components):
+    """
+    Format game's state components into the string sent over the network, seats being grouped in PL(...)
+    :components: dict, as returned by Game.state_components
+    :return: str
+    """
+    parts = []
+    seats = []
+    for key, value in components.items():
+        if key[0] == 'P' and key[1:].isdigit():
+            if not seats:
+                parts.append(None)  # Placeholder, seats are all listed where the first one appears
+            seats.append(value)
         else:
-            msg += f"NR(0)"
-        return msg            
\ No newline at end of file
+            parts.append(f"{key}({value})")
+    return ' '.join(f"PL({','.join(seats)})" if part is None else part for part in parts)
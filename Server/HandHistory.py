@@ -0,0 +1,278 @@
+"""
+Append-only binary log of every finished hand, for auditing, disputes and offline analytics. Tables only encode the
+hand and queue it: a background thread does the disk writes. The reader memory-maps the log so that millions of
+hands can be scanned without decoding them into Python objects.
+
+The log starts with MAGIC, followed by records, each one made of its length (4 bytes) and:
+- HAND: table id, hand number, time, blinds, dealer, the number of seats, actions, board cards and pots, and the
+  variant played (see Variants.py)
+- SEAT for each player dealt in: seat, stack before the blinds, hole cards and name (UTF-8), their lengths first
+- ACTION for each action, blinds included: seat, round, action code, chips put in by the action
+- board cards, 1 byte each
+- POT for each pot: amount of the pot, strength of the winning hand as computed by Evaluator.py (NO_SHOWDOWN if
+  everyone else folded), number of winners, followed by WINNER for each winner: seat and chips won, odd chips of a
+  split included
+"""
+
+import os
+import sys
+import mmap
+import time
+import queue
+import struct
+import threading
+from Rules import ranking_reader
+from Evaluator import ranking_to_strength, strength_to_ranking
+from Variants import VARIANTS, VARIANT_CODES
+
+
+HAND_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hands.log")
+MAGIC = b"PHH1"
+LENGTH = struct.Struct('!I')
+# Table id, hand number, time, sb, bb, dealer, seats, actions, board, pots, variant
+HAND = struct.Struct('!IQdIIBBHBBB')
+SEAT = struct.Struct('!BIBB')  # Seat, stack, number of hole cards, length of the name
+ACTION = struct.Struct('!BBBI')  # Seat, round, action code, amount
+POT = struct.Struct('!IIB')  # Amount of the pot, strength of the winning hand, number of winners
+WINNER = struct.Struct('!BI')  # Seat, chips won
+NO_SHOWDOWN = 0xFFFFFFFF
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of the log to disk when hands keep coming
+BUFFER_SIZE = 1 << 20
+
+# Same codes as the actions of Session.RECV_PROTOCOL['action'], 0 being a blind
+ACTION_CODES = {'blind': 0, 'fold': 1, 'check': 2, 'call': 3, 'shove': 4, 'bet': 5}
+ACTION_NAMES = {code: name for name, code in ACTION_CODES.items()}
+
+
+class HandRecord:
+    """
+    A hand being played, recorded by its table
+    """
+    def __init__(self, game):
+        self.table_id = game.table_id
+        self.hand_number = game.hand_number
+        self.time = time.time()
+        self.sb = game.sb
+        self.bb = game.bb
+        self.dealer = game.dealer
+        self.variant = game.variant.code
+        # Stacks are recorded before the blinds are posted
+        self.seats = [(i, player.stack, player.hand, player.name)
+                      for i, player in enumerate(game.players) if player and player.in_hand]
+        self.actions = []
+
+    def add_action(self, seat, round_, action, amount):
+        """
+        :seat: int
+        :round_: int, 0: pre-flop, 1: flop, 2: turn, 3: river
+        :action: str, key of ACTION_CODES
+        :amount: int, chips put in by the action
+        :return: None
+        """
+        self.actions.append((seat, round_, ACTION_CODES[action], amount))
+
+    def encode(self, community, results, seats):
+        """
+        Binary record of the finished hand
+        :community: list of card ids
+        :results: list of [amount, winners, ranking, chips won by each winner], as built by Game.end_game
+        :seats: dict, Player -> seat
+        :return: bytes, length included
+        """
+        body = bytearray(HAND.pack(self.table_id, self.hand_number, self.time, self.sb, self.bb, self.dealer,
+                                   len(self.seats), len(self.actions), len(community), len(results), self.variant))
+        for seat, stack, hand, name in self.seats:
+            name = name.encode()
+            body += SEAT.pack(seat, stack, len(hand), len(name))
+            body += hand
+            body += name
+        for action in self.actions:
+            body += ACTION.pack(*action)
+        body += bytes(community)
+        for amount, winners, ranking, won in results:
+            body += POT.pack(amount, NO_SHOWDOWN if ranking is None else ranking_to_strength(ranking), len(winners))
+            for winner, chips in zip(winners, won):
+                body += WINNER.pack(seats[winner], chips)
+        return LENGTH.pack(len(body)) + body
+
+
+class HandHistory:
+    """
+    Writer of the hand log, shared by every table of the server. Records are queued by the tables and written by a
+    background thread, so a table never waits for the disk.
+    """
+    def __init__(self, path=HAND_LOG, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()  # Encoded records, None to stop the writer
+        self.file = open(path, "ab", buffering=BUFFER_SIZE)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.writer = threading.Thread(target=self.drain, daemon=True)
+        self.writer.start()
+
+    def write(self, record):
+        """
+        Queues an encoded hand, never blocks
+        :record: bytes
+        :return: None
+        """
+        self.queue.put(record)
+
+    def drain(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:  # Idle: what has been buffered goes to disk
+                self.file.flush()
+                last_flush = time.monotonic()
+                continue
+            if record is None:
+                self.file.close()
+                return
+            self.file.write(record)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.file.flush()
+                last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Writes every queued hand and closes the log
+        :return: None
+        """
+        self.queue.put(None)
+        self.writer.join()
+
+
+class HandLogReader:
+    """
+    Memory-mapped view of a hand log. Hands are located and their headers read in place, and only decoded when asked.
+    """
+    def __init__(self, path=HAND_LOG):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a hand log")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def offsets(self):
+        """
+        Offsets of the hands in the log. A record cut short by a crash during a write is ignored.
+        :return: generator of ints, offset of the body of each record
+        """
+        offset = len(MAGIC)
+        end = len(self.map)
+        while offset + LENGTH.size <= end:
+            length, = LENGTH.unpack_from(self.map, offset)
+            offset += LENGTH.size
+            if offset + length > end:
+                return
+            yield offset
+            offset += length
+
+    def header(self, offset):
+        """
+        Header of a hand
+        :offset: int, as yielded by offsets
+        :return: tuple (table id, hand number, time, sb, bb, dealer, seats, actions, board, pots, variant's code)
+        """
+        return HAND.unpack_from(self.map, offset)
+
+    def headers(self):
+        """
+        Header of every hand, without decoding the rest of the records
+        :return: generator of tuples, as returned by header
+        """
+        for offset in self.offsets():
+            yield self.header(offset)
+
+    def count(self):
+        """
+        :return: int, number of hands in the log
+        """
+        return sum(1 for _ in self.offsets())
+
+    def read(self, offset):
+        """
+        Decodes a hand
+        :offset: int, as yielded by offsets
+        :return: dict
+        """
+        table_id, hand_number, time_, sb, bb, dealer, num_seats, num_actions, num_board, num_pots, variant = \
+            self.header(offset)
+        offset += HAND.size
+        seats = []
+        for _ in range(num_seats):
+            seat, stack, num_cards, length = SEAT.unpack_from(self.map, offset)
+            offset += SEAT.size
+            hand = list(self.map[offset:offset + num_cards])
+            offset += num_cards
+            name = self.map[offset:offset + length].decode()
+            offset += length
+            seats.append({'seat': seat, 'name': name, 'stack': stack, 'hand': hand})
+        actions = []
+        for _ in range(num_actions):
+            seat, round_, code, amount = ACTION.unpack_from(self.map, offset)
+            offset += ACTION.size
+            actions.append({'seat': seat, 'round': round_, 'action': ACTION_NAMES[code], 'amount': amount})
+        board = list(self.map[offset:offset + num_board])
+        offset += num_board
+        pots = []
+        for _ in range(num_pots):
+            amount, strength, num_winners = POT.unpack_from(self.map, offset)
+            offset += POT.size
+            winners, won = [], []
+            for _ in range(num_winners):
+                seat, chips = WINNER.unpack_from(self.map, offset)
+                offset += WINNER.size
+                winners.append(seat)
+                won.append(chips)
+            pots.append({'amount': amount, 'ranking': None if strength == NO_SHOWDOWN else strength_to_ranking(strength),
+                         'winners': winners, 'won': won})
+        return {'table_id': table_id, 'hand_number': hand_number, 'time': time_, 'sb': sb, 'bb': bb,
+                'dealer': dealer, 'variant': VARIANT_CODES[variant].name, 'seats': seats, 'actions': actions,
+                'board': board, 'pots': pots}
+
+    def __iter__(self):
+        for offset in self.offsets():
+            yield self.read(offset)
+
+
+def replay(hand):
+    """
+    Human-readable account of a decoded hand
+    :hand: dict, as returned by HandLogReader.read
+    :return: list of str
+    """
+    names = {seat['seat']: seat['name'] for seat in hand['seats']}
+    lines = [f"Table {hand['table_id']} hand #{hand['hand_number']} of {VARIANTS[hand['variant']].title} "
+             f"({time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(hand['time']))}), "
+             f"blinds {hand['sb']}/{hand['bb']}, dealer {names.get(hand['dealer'], hand['dealer'])}"]
+    for seat in hand['seats']:
+        lines.append(f"Seat {seat['seat']}: {seat['name']} ({seat['stack']} chips) {seat['hand']}")
+    for action in hand['actions']:
+        lines.append(f"[{action['round']}] {names[action['seat']]} {action['action']} {action['amount']}")
+    lines.append(f"Board: {hand['board']}")
+    for pot in hand['pots']:
+        winners = ', '.join(f"{names[seat]} ({chips})" for seat, chips in zip(pot['winners'], pot['won']))
+        with_hand = "" if pot['ranking'] is None else f" with {ranking_reader(pot['ranking'])}"
+        lines.append(f"Pot of {pot['amount']} chips won by {winners}{with_hand}")
+    return lines
+
+
+if __name__ == "__main__":
+    # Prints the hands of a log: python HandHistory.py [path]
+    with HandLogReader(sys.argv[1] if len(sys.argv) > 1 else HAND_LOG) as reader:
+        for hand in reader:
+            print('\n'.join(replay(hand)), end="\n\n")
@@ -0,0 +1,372 @@
+"""
+Load generator: thousands of bots playing over real connections, speaking the text protocol of the clients, to
+measure what a running server (Server.py, AsyncServer.py or Lobby.py) sustains. Bots act after a random think time,
+with the policies of Simulation.py applied to the game's states they receive, and may chat.
+Every bot connects with the game master's name: the first one seated at a table keeps it and deals the hands, the
+others are renamed by the server. Tables are thus run whatever the way the server spreads the connections.
+Reports the throughput and the latency between an action and the first game's state showing it, i.e. the bot's bet
+having changed or the turn having passed, which includes the bots' own processing: run the generator on another
+machine than the server for thousands of bots.
+Usage: python LoadGenerator.py [--clients 1000] [--duration 60] [--policy random] [--host 127.0.0.1]
+"""
+
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from Server import SERVER_IP, PORT
+from Simulation import POLICIES, REBUY
+
+
+GM_NAME = "TrungDam"  # Only a player of this name is hired as game master
+BLINDS = (5, 10)
+THINK_TIME = (0.5, 2.0)  # Bounds of the random time a bot takes to act, in seconds
+RAMP = 200  # Connections opened per second
+CHAT_TEXT = "gl hf"
+ACTION_CODES = {"fold": 1, "check": 2, "call": 3, "shove": 4, "bet": 5}
+COMPONENT = re.compile(r"(\w\w)\(([^)]*)\)")
+
+
+def parse_state(text):
+    """
+    Components of a game's state, as sent in the 01 and 06 messages
+    :text: str, e.g. "ON(1) BL(5:10) PL(0:TrungDam:100:10:1,1:_) BT(10:5) ..."
+    :return: dict, e.g. {'ON': "1", 'BL': "5:10", 'P0': "0:TrungDam:100:10:1", 'P1': "1:_", 'BT': "10:5", ...}
+    """
+    components = {}
+    for key, value in COMPONENT.findall(text):
+        if key == "PL":
+            for seat in value.split(','):
+                components["P" + seat.split(':', 1)[0]] = seat
+        else:
+            components[key] = value
+    return components
+
+
+def percentile(values, fraction):
+    """
+    :values: sorted list of numbers
+    :fraction: float, between 0 and 1
+    :return: the value below which this fraction of the values lies, None if there is none
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Stats:
+    """
+    Counters shared by every bot, only counting what happens once the measure started, i.e. once every bot connected
+    """
+    def __init__(self):
+        self.started = None
+        self.connected = 0
+        self.failed = 0  # Connections refused, or closed by the server
+        self.actions = 0
+        self.hands = 0
+        self.chats = 0
+        self.messages = 0
+        self.bytes = 0
+        self.latencies = []  # Seconds between an action and the first game's state showing it
+
+    def measuring(self):
+        return self.started is not None
+
+    def report(self, seconds):
+        """
+        :seconds: float, duration of the measure
+        :return: dict
+        """
+        latencies = sorted(self.latencies)
+        p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+        return {
+            'connections': self.connected,
+            'failed': self.failed,
+            'seconds': round(seconds, 2),
+            'actions_per_second': round(self.actions / seconds, 1),
+            'hands_per_second': round(self.hands / seconds, 2),
+            'chats_per_second': round(self.chats / seconds, 1),
+            'messages_per_second': round(self.messages / seconds, 1),
+            'bytes_per_second': round(self.bytes / seconds),
+            'latency_p50_ms': None if p50 is None else round(p50 * 1000, 2),
+            'latency_p99_ms': None if p99 is None else round(p99 * 1000, 2),
+        }
+
+
+class Bot:
+    def __init__(self, stats, policy, rng, think_time=THINK_TIME, chat=0.0, options=("seq",)):
+        """
+        :stats: Stats object
+        :policy: function of Simulation.POLICIES
+        :rng: random.Random
+        :think_time: tuple (min, max) of seconds
+        :chat: float, probability of chatting after each action
+        :options: tuple of protocol options negotiated with the server, 'seq' and 'delta'
+        """
+        self.stats = stats
+        self.policy = policy
+        self.rng = rng
+        self.think_time = think_time
+        self.chat = chat
+        self.options = options
+        self.writer = None
+        self.name = GM_NAME
+        self.state = {}  # Components of the latest game's state
+        self.hand = 0  # Hands dealt to the bot
+        self.turn = None  # What the game's state looked like when the bot last decided to act
+        self.acted_at = None  # When the last action was sent, until a game's state shows it
+        self.action = None  # (hand, seat, seat's component, state's version) the last action was decided on
+        self.playing = False  # A hand is going on at the table, for the game master
+        self.closed = False
+
+    @property
+    def gm(self):
+        return self.name == GM_NAME
+
+    def send(self, text):
+        if not self.closed:
+            self.writer.write(text.encode())
+
+    async def run(self, host, port, deadline):
+        """
+        Plays until the deadline, then disconnects
+        :host: str
+        :port: int
+        :deadline: float, time.perf_counter() value
+        :return: None
+        """
+        try:
+            reader, self.writer = await asyncio.open_connection(host, port)
+        except OSError:
+            self.stats.failed += 1
+            return
+        self.stats.connected += 1
+        if self.options:
+            self.send(f"07 {' '.join(self.options)}$")
+        self.send(f"00 {self.name}$")
+        tasks = [asyncio.ensure_future(self.read(reader))]
+        tasks.append(asyncio.ensure_future(self.deal()))
+        await asyncio.wait(tasks, timeout=max(0, deadline - time.perf_counter()),
+                           return_when=asyncio.FIRST_COMPLETED)
+        if tasks[0].done() and not self.closed:
+            self.stats.failed += 1  # The server closed the connection
+        self.send("-1$")
+        self.closed = True
+        for task in tasks:
+            task.cancel()
+        self.writer.close()
+
+    async def read(self, reader):
+        buffer = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            if self.stats.measuring():
+                self.stats.bytes += len(data)
+            *messages, buffer = (buffer + data).split(b"$")
+            for message in messages:
+                self.receive(message.decode(errors="replace"))
+
+    def receive(self, message):
+        """
+        Handles a message of the server, stripped of its end of message
+        :message: str, e.g. "#12 01 ON(1) BL(5:10) ..."
+        :return: None
+        """
+        if message.startswith("#"):
+            message = message.split(' ', 1)[1]  # Sequence number
+        protocol, text = message[:2], message[2:].strip()
+        if self.stats.measuring():
+            self.stats.messages += 1
+        if protocol == "03":
+            self.name = text
+        elif protocol == "00":
+            self.hand += 1
+            self.playing = True
+        elif protocol == "01":
+            self.update(parse_state(text))
+        elif protocol == "06":
+            self.update(parse_state(text), delta=True)
+        elif protocol == "05":
+            self.playing = False
+            if self.gm:
+                if self.stats.measuring():
+                    self.stats.hands += 1
+                self.send("06$")  # Stacks after the pots were awarded, as the client does
+        elif protocol == "-1":
+            self.closed = True
+
+    def update(self, components, delta=False):
+        """
+        Applies a game's state, then acts if it is the bot's turn
+        :components: dict, as returned by parse_state
+        :delta: bool, only the components that changed since the version acknowledged are given
+        :return: None
+        """
+        if delta:
+            self.state.update(components)
+        else:
+            self.state = components
+        if 'VS' in components:
+            self.send(f"08 {components['VS'].split(':')[0]}$")
+        self.playing = self.state.get('ON') == "1"
+        if self.acted_at is not None and self.shows_action():
+            if self.stats.measuring():
+                self.stats.latencies.append(time.perf_counter() - self.acted_at)
+            self.acted_at = None
+        seat = self.seat()
+        if not self.playing or seat is None or self.state.get('AC') != str(seat):
+            return
+        # The same state may be sent again (e.g. full state asked by the game master): act once per turn
+        turn = (self.hand, self.state.get('P' + str(seat)), self.state.get('BT'), self.state.get('CM'))
+        if turn != self.turn:
+            self.turn = turn
+            asyncio.ensure_future(self.act(seat))
+
+    def shows_action(self):
+        """
+        Other players' actions, chat and timers also make the table send states: only a state newer than the one the
+        bot acted on, where the bot's bet or stack changed or the turn left the bot's seat, answers the bot's action
+        :return: bool, the latest game's state shows the last action of the bot
+        """
+        hand, seat, component, version = self.action
+        if version is not None and 'VS' in self.state and int(self.state['VS'].split(':')[0]) <= version:
+            return False
+        return (self.hand != hand or not self.playing or self.state.get('AC') != str(seat)
+                or self.state.get('P' + str(seat)) != component)
+
+    def seats(self):
+        """
+        :return: dict, seat -> (name, stack, betting, in hand) of the players seated
+        """
+        seats = {}
+        for key, value in self.state.items():
+            if key[0] == 'P' and key[1:].isdigit() and not value.endswith(":_"):
+                seat, name, stack, betting, in_hand = value.split(':')
+                seats[int(seat)] = (name, int(stack), int(betting), in_hand == "1")
+        return seats
+
+    def seat(self):
+        for seat, (name, _, _, _) in self.seats().items():
+            if name == self.name:
+                return seat
+        return None
+
+    def view(self, seat):
+        """
+        The game as seen by the bot, with what the policies of Simulation.py look at
+        :seat: int, the bot's seat
+        :return: tuple (game, player) of SimpleNamespace objects
+        """
+        seats = self.seats()
+        players = [None] * (max(seats) + 1)
+        for i, (_, stack, betting, in_hand) in seats.items():
+            players[i] = SimpleNamespace(stack=stack, betting=betting, in_hand=in_hand, all_in=in_hand and not stack)
+        highest, second = map(int, self.state.get('BT', "0:0").split(':'))
+        bb = int(self.state.get('BL', "0:0").split(':')[1])
+        game = SimpleNamespace(players=players, highest_bet=highest, second_highest_bet=second, bb=bb)
+        return game, players[seat]
+
+    async def act(self, seat):
+        low, high = self.think_time
+        await asyncio.sleep(self.rng.uniform(low, high))
+        if self.closed or self.seat() != seat or self.state.get('AC') != str(seat) or not self.playing:
+            return
+        game, player = self.view(seat)
+        action, amount = self.policy(game, player, self.rng)
+        if self.state.get('NR') == "1" and action in ("bet", "shove"):
+            action = "call" if game.highest_bet > player.betting else "check"
+        version = self.state.get('VS')
+        version = None if version is None else int(version.split(':')[0])
+        self.action = (self.hand, seat, self.state.get('P' + str(seat)), version)
+        self.acted_at = time.perf_counter()
+        self.send(f"03 {ACTION_CODES[action]} {player.betting + amount}$")  # A bet is sent as the total bet
+        if self.stats.measuring():
+            self.stats.actions += 1
+        if self.chat and self.rng.random() < self.chat:
+            self.send(f"04 {CHAT_TEXT}$")
+            if self.stats.measuring():
+                self.stats.chats += 1
+
+    async def deal(self):
+        """
+        Game master's duty: sets the blinds, gives chips back to busted players, and starts a hand whenever the
+        table is idle with at least 2 players
+        :return: None
+        """
+        low, high = self.think_time
+        blinds_set = False
+        while not self.closed:
+            await asyncio.sleep(self.rng.uniform(low, high))
+            if not self.gm or self.playing or not self.state:
+                continue
+            seats = self.seats()
+            if len(seats) < 2:
+                continue
+            if not blinds_set:
+                self.send("02 %d:%d$" % BLINDS)
+                blinds_set = True
+            for seat, (_, stack, _, _) in seats.items():
+                if not stack:
+                    self.send(f"05 {seat} {REBUY}$")
+            self.send("01$")
+
+
+async def run(clients, host=SERVER_IP, port=PORT, duration=60, policy="random", think_time=THINK_TIME, chat=0.0,
+              options=("seq",), ramp=RAMP, seed=None):
+    """
+    Connects the bots, progressively, then measures for a given duration
+    :clients: int
+    :host: str
+    :port: int
+    :duration: float, seconds of measure once every bot is connected
+    :policy: str, key of Simulation.POLICIES
+    :think_time: tuple (min, max) of seconds
+    :chat: float, probability of chatting after each action
+    :options: tuple of protocol options
+    :ramp: float, connections opened per second
+    :seed: int
+    :return: dict, as returned by Stats.report
+    """
+    rng = random.Random(seed)
+    stats = Stats()
+    ramp_seconds = clients / ramp
+    deadline = time.perf_counter() + ramp_seconds + duration
+    bots = []
+    for i in range(clients):
+        bot = Bot(stats, POLICIES[policy], random.Random(rng.random()), think_time, chat, options)
+        bots.append(asyncio.ensure_future(bot.run(host, port, deadline)))
+        await asyncio.sleep(1 / ramp)
+    stats.started = time.perf_counter()
+    await asyncio.gather(*bots)
+    return stats.report(time.perf_counter() - stats.started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the poker server")
+    parser.add_argument("--clients", type=int, default=1000, help="bots connected at once")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--duration", type=float, default=60, help="seconds of measure once every bot is connected")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--think", type=float, nargs=2, default=THINK_TIME, metavar=("MIN", "MAX"),
+                        help="bounds of the think time, in seconds")
+    parser.add_argument("--chat", type=float, default=0.0, help="probability of chatting after each action")
+    parser.add_argument("--options", nargs="*", choices=("seq", "delta"), default=["seq"],
+                        help="protocol options, none for the paced protocol of the original client")
+    parser.add_argument("--ramp", type=float, default=RAMP, help="connections opened per second")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="JSON file the report is written to")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.clients, args.host, args.port, args.duration, args.policy, tuple(args.think),
+                             args.chat, tuple(args.options), args.ramp, args.seed))
+    for name, value in report.items():
+        print(f"{name:25} {value}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
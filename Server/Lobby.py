@@ -0,0 +1,462 @@
+"""
+Multi-process server mode: a lobby process accepts the connections and hands each of them over to one of several worker
+processes, which host the tables. Every worker has its own interpreter, so tables are spread over every core.
+
+The lobby never relays any traffic: the socket of a new connection is itself passed to a worker (SCM_RIGHTS over a
+Unix socket), and from then on the client and the worker talk directly. Workers regularly report their load. When
+one hosts many more players than another, the lobby asks it to hand one of its tables over: a table between hands
+whose messages have all been sent is snapshotted (see Snapshot.py) and passed to the least loaded worker together with
+the sockets of its players, who keep playing without reconnecting. The bytes received from them but not parsed yet,
+their chat rate limits, the versions of the game's state they acknowledged and the table's recent chat messages go
+along.
+
+Workers share the cores for the equities too: each one's process pool (see Equity.py) has its share of them.
+
+Same wire protocol as Server.py, Unix only. Start it with `python Lobby.py [workers] [variant]`, one worker per core by
+default, Hold'em unless the variant is `plo`.
+Workers log hands to hands.<worker>.log, save their tables to tables.<worker>.snapshot and serve their metrics on
+METRICS_PORT + 1 + worker.
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import asyncio
+import selectors
+import multiprocessing
+from Session import Session, RECV_PROTOCOL
+from Tables import TableRegistry, RECONNECT_GRACE
+from Outbox import AsyncOutbox
+from Server import SERVER_IP, PORT
+from AsyncServer import serve_session, call_later
+from Equity import load_preflop_table, set_pool_size
+from HandHistory import HandHistory, HAND_LOG, LENGTH
+from Deck import DeckPool
+from Game import MAX_PLAYERS, MAX_SEATS
+from Variants import VARIANTS
+import Snapshot
+import Log
+import Metrics
+
+
+LOAD_INTERVAL = 1.0  # Seconds between two load reports of a worker
+REBALANCE_INTERVAL = 5.0  # Seconds between two checks of the workers' loads by the lobby
+IMBALANCE = 2 * MAX_PLAYERS  # Difference of players between the busiest and the idlest worker triggering a hand-over
+MESSAGE_SIZE = 1 << 16  # Largest message between the lobby and a worker
+
+# Messages between the lobby and the workers, each one starting with its kind
+CONNECTION = b"C"  # Lobby -> worker: new connection, its socket attached, followed by the client's address
+LOAD = b"L"  # Worker -> lobby: LOAD_INFO
+MIGRATE = b"M"  # Lobby -> worker: hand a table over to another worker, MIGRATE_INFO
+TABLE = b"T"  # Worker -> lobby -> worker: table handed over, the players' sockets attached
+LOAD_INFO = struct.Struct('!III')  # Seated players, tables, free seats at the open tables
+MIGRATE_INFO = struct.Struct('!BH')  # Worker to hand the table over to, most players the table may have
+# Worker the table is handed over to, players, chat messages, followed by the table's snapshot, then CLIENT for each
+# player and CHAT_LINE for each chat message
+TABLE_INFO = struct.Struct('!BBB')
+# Seat, sequence number, length of the options, of the unparsed bytes and of the address, CLIENT_FLAGS, version of the
+# game's state acknowledged, chat tokens left
+CLIENT = struct.Struct('!BIHHBBId')
+CHAT_LINE = struct.Struct('!H')  # Length of a chat message, followed by the message (UTF-8)
+
+# Client's flags
+ACKED = 1  # A version of the game's state was acknowledged
+THROTTLED = 2  # Warned for chatting too fast
+
+log = Log.get_logger("lobby")
+
+
+def worker_path(path, worker):
+    """
+    :path: str, e.g. hands.log
+    :worker: int
+    :return: str, e.g. hands.1.log
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{worker}{extension}"
+
+
+class Lobby:
+    def __init__(self, workers, host=SERVER_IP, port=PORT, variant="holdem"):
+        """
+        :workers: int, number of worker processes
+        :host: str
+        :port: int
+        :variant: str, key of Variants.VARIANTS, variant played at the new tables
+        """
+        self.listener = socket.create_server((host, port))
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.workers = []  # Lobby's end of the Unix socket of each worker, None once a worker stopped
+        self.processes = []
+        self.loads = [[0, 0, 0] for _ in range(workers)]  # Last LOAD_INFO reported by each worker
+        self.assigned = [0] * workers  # Connections handed to each worker since its last report
+        self.migrating = None  # Worker asked to hand a table over, until it reports its load again
+        for i in range(workers):
+            lobby_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            process = multiprocessing.Process(target=run_worker, args=(i, workers, worker_end, variant))
+            process.start()
+            worker_end.close()
+            self.workers.append(lobby_end)
+            self.processes.append(process)
+            self.selector.register(lobby_end, selectors.EVENT_READ, i)
+
+    def serve_forever(self):
+        last_rebalance = time.monotonic()
+        while any(self.workers):
+            for key, _ in self.selector.select(REBALANCE_INTERVAL):
+                if key.fileobj is self.listener:
+                    self.accept()
+                else:
+                    self.receive(key.data)
+            if time.monotonic() - last_rebalance >= REBALANCE_INTERVAL:
+                self.rebalance()
+                last_rebalance = time.monotonic()
+
+    def accept(self):
+        """
+        Hands a new connection over to a worker, preferably one having a table to complete so that tables fill up
+        :return: None
+        """
+        conn, address = self.listener.accept()
+        running = [i for i, worker in enumerate(self.workers) if worker]
+        with_seats = [i for i in running if self.loads[i][2] > self.assigned[i]]
+        i = min(with_seats or running, key=lambda i: self.loads[i][0] + self.assigned[i])
+        socket.send_fds(self.workers[i], [CONNECTION + f"{address[0]}:{address[1]}".encode()], [conn.fileno()])
+        conn.close()  # The worker has its own copy
+        self.assigned[i] += 1
+        log.debug("Connection from %s handed to worker %d", address, i)
+
+    def receive(self, i):
+        """
+        Handles a message from a worker
+        :i: int, worker
+        :return: None
+        """
+        try:
+            msg, fds, _, _ = socket.recv_fds(self.workers[i], MESSAGE_SIZE, MAX_SEATS)
+        except OSError:
+            msg, fds = b"", []
+        if not msg:
+            log.error("Worker %d stopped", i)
+            self.selector.unregister(self.workers[i])
+            self.workers[i].close()
+            self.workers[i] = None
+            return
+        kind = msg[:1]
+        if kind == LOAD:
+            self.loads[i] = list(LOAD_INFO.unpack_from(msg, 1))
+            self.assigned[i] = 0
+            if self.migrating == i:
+                self.migrating = None
+        elif kind == TABLE:
+            target, _, _ = TABLE_INFO.unpack_from(msg, 1)
+            if self.workers[target]:
+                socket.send_fds(self.workers[target], [msg], fds)
+            for fd in fds:
+                os.close(fd)
+
+    def rebalance(self):
+        """
+        Asks the busiest worker to hand a table over to the idlest one if their loads are too far apart
+        :return: None
+        """
+        if self.migrating is not None:
+            return
+        running = [i for i, worker in enumerate(self.workers) if worker]
+        if len(running) < 2:
+            return
+        busiest = max(running, key=lambda i: self.loads[i][0])
+        idlest = min(running, key=lambda i: self.loads[i][0])
+        gap = self.loads[busiest][0] - self.loads[idlest][0]
+        if gap >= IMBALANCE:
+            # Moving more than half the gap would only swap the roles of the two workers
+            self.workers[busiest].send(MIGRATE + MIGRATE_INFO.pack(idlest, gap // 2))
+            self.migrating = busiest
+            log.info("Worker %d asked to hand a table over to worker %d", busiest, idlest)
+
+    def close(self):
+        for worker in self.workers:
+            if worker:
+                worker.close()  # Workers stop when their Unix socket is closed
+        for process in self.processes:
+            process.join()
+        self.listener.close()
+
+
+class Worker:
+    """
+    Hosts tables for the lobby, with an event loop like AsyncServer.py
+    """
+    def __init__(self, index, workers, control, variant="holdem"):
+        """
+        :index: int, this worker
+        :workers: int, number of workers
+        :control: socket, worker's end of the Unix socket to the lobby
+        :variant: str, key of Variants.VARIANTS
+        """
+        self.index = index
+        self.workers = workers
+        self.control = control
+        self.variant = VARIANTS[variant]
+        self.registry = None
+        # Connection (AsyncOutbox) -> (task reading the client, Session, asyncio.StreamReader, asyncio.StreamWriter)
+        self.clients = {}
+        self.loop = None
+        self.stopped = None  # Future set when the lobby is gone
+        self.log = Log.get_logger(f"worker.{index}")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        set_pool_size((os.cpu_count() or 1) // self.workers)
+        history = HandHistory(worker_path(HAND_LOG, self.index))
+        path = worker_path(Snapshot.SNAPSHOT_FILE, self.index)
+        games = Snapshot.load(path)
+        snapshots = Snapshot.Snapshots(path)
+        self.registry = TableRegistry(history=history, deck_pool=DeckPool(), snapshots=snapshots,
+                                      first_id=self.index, id_step=self.workers, schedule=call_later(self.loop),
+                                      variant=self.variant)
+        if games:
+            self.registry.restore(games)
+            self.loop.call_later(RECONNECT_GRACE, self.registry.expire)
+            self.log.info("%d tables restored from %s", len(games), path)
+        load_preflop_table()
+        Metrics.watch(self.registry)
+        metrics = Metrics.serve(port=Metrics.METRICS_PORT + 1 + self.index)
+        self.loop.add_reader(self.control.fileno(), self.receive)
+        self.report()
+        self.log.info("Worker started, metrics served on http://%s:%d/metrics", *metrics.server_address)
+        try:
+            await self.stopped
+        finally:
+            self.loop.remove_reader(self.control.fileno())
+            history.close()
+            snapshots.close()
+            metrics.shutdown()
+
+    def receive(self):
+        """
+        Handles a message from the lobby
+        :return: None
+        """
+        try:
+            msg, fds, _, _ = socket.recv_fds(self.control, MESSAGE_SIZE, MAX_SEATS)
+        except OSError:
+            msg, fds = b"", []
+        if not msg:
+            if not self.stopped.done():
+                self.stopped.set_result(None)
+            return
+        kind = msg[:1]
+        if kind == CONNECTION:
+            self.loop.create_task(self.accept(fds[0], msg[1:].decode()))
+        elif kind == MIGRATE:
+            target, most_players = MIGRATE_INFO.unpack_from(msg, 1)
+            self.loop.create_task(self.migrate(target, most_players))
+        elif kind == TABLE:
+            self.adopt(msg, fds)
+
+    def report(self):
+        registry = self.registry
+        free_seats = sum(game.max_players - registry.seated[table_id]
+                         for table_id, game in list(registry.open_tables.items()))
+        try:
+            self.control.send(LOAD + LOAD_INFO.pack(len(registry.connections), len(registry.tables), free_seats))
+        except OSError:  # The lobby is gone, the worker is stopping
+            return
+        self.loop.call_later(LOAD_INTERVAL, self.report)
+
+    async def accept(self, fd, address):
+        """
+        Serves a new connection handed over by the lobby
+        :fd: int, file descriptor of its socket
+        :address: str
+        :return: None
+        """
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+        self.log.info("Connected", extra={'conn': address})
+        await self.serve(Session(self.registry, AsyncOutbox(writer), address), reader, writer)
+
+    async def serve(self, session, reader, writer):
+        self.clients[session.conn] = (asyncio.current_task(), session, reader, writer)
+        try:
+            await serve_session(session, reader)
+        finally:
+            self.clients.pop(session.conn, None)
+
+    def movable(self, game, most_players):
+        """
+        :game: Game object
+        :most_players: int
+        :return: bool, True if the table is between hands, has at most most_players players, every message to them
+                 has been sent, no chat message is held to be broadcast, and it is not a tournament's table, whose
+                 director runs in this process
+        """
+        if game.on or game.director or game.chat.pending or self.registry.seated[game.table_id] > most_players:
+            return False
+        for player in game.players:
+            if not player:
+                continue
+            client = self.clients.get(player.sock)
+            if client is None or player.sock.queue or client[3].transport.get_write_buffer_size():
+                return False
+        return True
+
+    async def migrate(self, target, most_players):
+        """
+        Hands a table over to another worker, with the sockets of its players. Nothing happens if no table can be
+        moved right now, the lobby will ask again later. Nothing is awaited for long: the readers of the players are
+        at their end, so the table cannot change before it is handed over.
+        :target: int, worker
+        :most_players: int, most players the table may have
+        :return: None
+        """
+        game = next((game for game in self.registry.tables.values() if self.movable(game, most_players)), None)
+        if game is None:
+            return
+        seated = [(i, player) for i, player in enumerate(game.players) if player]
+        unparsed = []
+        for _, player in seated:
+            task, session, reader, writer = self.clients[player.sock]
+            # What comes next stays in the socket for the other worker, what this one already received goes with it:
+            # the task reading the client stops, and the reader is emptied up to the end it is given
+            writer.transport.pause_reading()
+            task.cancel()
+            reader.feed_eof()
+            unparsed.append(session.buffer + await reader.read())
+        table = Snapshot.encode_table(game)
+        conns = self.registry.release(game)
+        clients = bytearray()
+        fds = []
+        for (seat, player), conn, buffer in zip(seated, conns, unparsed):
+            _, session, _, writer = self.clients[conn]
+            options = ' '.join(session.options).encode()
+            address = str(session.address).encode()
+            acked = player.acked_version
+            flags = ACKED * (acked is not None) | THROTTLED * session.throttled
+            tokens = session.chat_limit.refill() if session.chat_limit else 0.0
+            clients += CLIENT.pack(seat, conn.seq, len(options), len(buffer), len(address), flags, acked or 0, tokens)
+            clients += options
+            clients += buffer
+            clients += address
+            fds.append(writer.get_extra_info('socket').fileno())
+        # The most recent chat messages fitting in the message
+        room = MESSAGE_SIZE - 1 - TABLE_INFO.size - len(table) - len(clients)
+        chat = []
+        for line in reversed(game.chat.content):
+            line = line.encode()
+            room -= CHAT_LINE.size + len(line)
+            if room < 0 or len(line) > 0xFFFF:
+                break
+            chat.append(CHAT_LINE.pack(len(line)) + line)
+        chat.reverse()
+        info = TABLE_INFO.pack(target, len(conns), len(chat))
+        socket.send_fds(self.control, [TABLE + info + table + clients + b"".join(chat)], fds)
+        for conn in conns:
+            _, _, _, writer = self.clients.pop(conn)
+            conn.closed = True  # Nothing is sent anymore, not even when the session closes
+            conn.queue.clear()
+            conn.task.cancel()
+            writer.transport.abort()  # Only closes this process' copy of the socket
+        self.log.info("Table handed over to worker %d", target, extra={'table': game.table_id})
+
+    def adopt(self, msg, fds):
+        """
+        Hosts a table handed over by another worker, its players keeping their connections
+        :msg: bytes, TABLE message
+        :fds: list of file descriptors of the players' sockets
+        :return: None
+        """
+        _, _, num_chat = TABLE_INFO.unpack_from(msg, 1)
+        offset = 1 + TABLE_INFO.size
+        length, = LENGTH.unpack_from(msg, offset)
+        game = Snapshot.decode_table(msg, offset + LENGTH.size)
+        offset += LENGTH.size + length
+        self.registry.restore([game], reclaim=False)
+        game.checkpoint()
+        resumed = []
+        for fd in fds:
+            seat, seq, options_size, buffer_size, address_size, flags, acked, tokens = CLIENT.unpack_from(msg, offset)
+            offset += CLIENT.size
+            options = msg[offset:offset + options_size].decode()
+            offset += options_size
+            buffer = msg[offset:offset + buffer_size]
+            offset += buffer_size
+            address = msg[offset:offset + address_size].decode()
+            offset += address_size
+            game.players[seat].acked_version = acked if flags & ACKED else None
+            resumed.append((fd, game.players[seat].sock, options, seq, buffer, address,
+                            (tokens, bool(flags & THROTTLED))))
+        for _ in range(num_chat):
+            size, = CHAT_LINE.unpack_from(msg, offset)
+            offset += CHAT_LINE.size
+            game.chat.content.append(msg[offset:offset + size].decode())
+            offset += size
+        for client in resumed:  # Once the chat is back, it is sent to the players with the full game's state
+            self.loop.create_task(self.resume(*client))
+        self.log.info("Table taken over with %d players", len(fds), extra={'table': game.table_id})
+
+    async def resume(self, fd, detached, options, seq, buffer, address, chat_limit):
+        """
+        Serves a connection handed over with its table, where the previous worker left it
+        :fd: int, file descriptor of its socket
+        :detached: DetachedOutbox of the player until the connection is served
+        :options: str, protocol options negotiated by the client
+        :seq: int, sequence number of the last message sent to the client
+        :buffer: bytes, received but not parsed yet, complete messages included
+        :address: str
+        :chat_limit: tuple (chat tokens left, whether the client was warned for chatting too fast)
+        :return: None
+        """
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+        session = Session(self.registry, AsyncOutbox(writer), address)
+        session.dispatch(RECV_PROTOCOL['options'], options)
+        session.conn.seq = seq
+        tokens, session.throttled = chat_limit
+        if session.chat_limit:
+            session.chat_limit.tokens = min(tokens, session.chat_limit.burst)
+        game, player = self.registry.claim(detached, session.conn)
+        player.delta = 'delta' in session.options
+        session.log.extra['table'] = game.table_id
+        # Messages the previous worker received but did not get to, if any, are handled first
+        if session.receive(buffer) == -1:
+            session.close()
+            return
+        await self.serve(session, reader, writer)
+
+
+def run_worker(index, workers, control, variant="holdem"):
+    """
+    Entry point of a worker process
+    :index: int
+    :workers: int
+    :control: socket, worker's end of the Unix socket to the lobby
+    :variant: str, key of Variants.VARIANTS
+    :return: None
+    """
+    listener = Log.setup()
+    try:
+        asyncio.run(Worker(index, workers, control, variant).run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.stop()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    variant = sys.argv[2] if len(sys.argv) > 2 else "holdem"
+    lobby = Lobby(workers, variant=variant)
+    listener = Log.setup()
+    log.info("Lobby started with %d workers. Listening on %s", workers, lobby.listener.getsockname())
+    try:
+        lobby.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lobby.close()
+    log.info("Server terminated.")
+    listener.stop()
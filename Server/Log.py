@@ -0,0 +1,114 @@
+"""
+Leveled, structured logging of the server. Records are queued by the tables and connections, then formatted and
+written by a background thread, so that logging never holds up a table.
+
+- INFO: game events (actions, cards, blinds), connections, server lifecycle
+- DEBUG: every message received from and sent to clients, i.e. message-level tracing, which can be sampled or
+  turned off in production
+
+Records carry their context (table id, client's address, player's name) as fields, e.g.
+    12:30:01 INFO poker.game [table=3] TrungDam called 20 chips.
+"""
+
+import sys
+import json
+import queue
+import logging
+import logging.handlers
+
+
+ROOT = "poker"  # Every logger of the server is a child of this one
+LEVEL = logging.INFO
+TRACE = False  # Message-level tracing, costly under load
+TRACE_SAMPLE = 1.0  # Fraction of the message-level (DEBUG) records kept when tracing is on
+CONTEXT = ('table', 'conn', 'player')  # Fields of a record's context, in the order they're written
+
+
+def get_logger(name, **context):
+    """
+    Logger of a part of the server, with an optional context added to all its records
+    :name: str, e.g. "game"
+    :context: fields among CONTEXT, e.g. table=3
+    :return: logging.Logger, or logging.LoggerAdapter if there is a context
+    """
+    logger = logging.getLogger(f"{ROOT}.{name}")
+    return logging.LoggerAdapter(logger, context) if context else logger
+
+
+class TextFormatter(logging.Formatter):
+    """
+    One line per record, its context between brackets
+    """
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(context)s%(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        fields = [f"{key}={getattr(record, key)}" for key in CONTEXT if getattr(record, key, None) is not None]
+        record.context = f"[{' '.join(fields)}] " if fields else ""
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, for log collectors
+    """
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage()}
+        for key in CONTEXT:
+            if getattr(record, key, None) is not None:
+                entry[key] = str(getattr(record, key))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps one DEBUG record out of every 1 / rate, other levels are always kept
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.period = round(1 / rate) if rate > 0 else 0
+        self.count = 0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if not self.period:
+            return False
+        self.count += 1
+        return self.count % self.period == 0
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without formatting them: the message and its arguments are only merged by the writer thread
+    """
+    def prepare(self, record):
+        return record
+
+
+def setup(level=LEVEL, trace=TRACE, sample=TRACE_SAMPLE, stream=None, structured=False):
+    """
+    Starts the background writer of the server's logs
+    :level: int, e.g. logging.INFO
+    :trace: bool, log every message received and sent (DEBUG records)
+    :sample: float, fraction of the messages traced
+    :stream: file object, standard output by default
+    :structured: bool, write JSON lines instead of text
+    :return: logging.handlers.QueueListener, to stop when the server stops
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if structured else TextFormatter())
+    records = queue.SimpleQueue()
+    queue_handler = ContextQueueHandler(records)
+    if trace and sample < 1:
+        queue_handler.addFilter(SampleFilter(sample))
+    root = logging.getLogger(ROOT)
+    root.handlers = [queue_handler]
+    root.setLevel(logging.DEBUG if trace else level)
+    root.propagate = False
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -0,0 +1,224 @@
+"""
+Runtime metrics of the server, exposed in the Prometheus text format over a local HTTP endpoint
+(http://127.0.0.1:11001/metrics by default) for a scraper to poll.
+
+Collection stays cheap enough to be always on: every thread updates its own cells without any lock, and cells are
+only summed when the metrics are scraped. Values that can be read from the server's state (connected clients,
+active tables, queued messages) are computed at scraping time only.
+"""
+
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_IP = "127.0.0.1"
+METRICS_PORT = 11001
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+METRICS = []  # Every metric, in the order they are exported
+
+
+class Metric:
+    """
+    Base of the metrics. Every thread gets its own cell, found by the thread's id: thread ids are reused by new
+    threads, so the number of cells is bounded by the number of threads running at once.
+    """
+    kind = None
+
+    def __init__(self, name, description, register=True):
+        self.name = name
+        self.description = description
+        self.cells = {}  # Thread id -> cell of that thread
+        if register:
+            METRICS.append(self)
+
+    def cell(self):
+        ident = threading.get_ident()
+        cell = self.cells.get(ident)
+        if cell is None:
+            cell = self.cells[ident] = self.new_cell()
+        return cell
+
+    def new_cell(self):
+        return [0]
+
+    def total(self):
+        """
+        :return: sum of every thread's cell
+        """
+        return sum(cell[0] for cell in list(self.cells.values()))
+
+    def samples(self):
+        """
+        :return: list of (suffix, labels, value) to export
+        """
+        return [("", "", self.total())]
+
+    def export(self):
+        """
+        :return: str, the metric in the Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {value}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self.cell()[0] += amount
+
+
+class Gauge(Metric):
+    """
+    Value going up and down, e.g. connected clients
+    """
+    kind = "gauge"
+
+    def inc(self, amount=1):
+        self.cell()[0] += amount
+
+    def dec(self, amount=1):
+        self.cell()[0] -= amount
+
+
+class GaugeFunction(Metric):
+    """
+    Gauge whose value is read from the server's state when scraped
+    """
+    kind = "gauge"
+
+    def __init__(self, name, description, function=None):
+        super().__init__(name, description)
+        self.function = function  # Function without argument returning the value, None if nothing to watch yet
+
+    def samples(self):
+        return [("", "", self.function() if self.function else 0)]
+
+
+class Histogram(Metric):
+    """
+    Distribution of values, e.g. latencies, in buckets
+    """
+    kind = "histogram"
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        super().__init__(name, description)
+
+    def new_cell(self):
+        return [0] * (len(self.buckets) + 3)  # Count per bucket, above the last bucket, sum, count
+
+    def observe(self, value):
+        cell = self.cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def samples(self):
+        totals = [0] * (len(self.buckets) + 3)
+        for cell in list(self.cells.values()):
+            for i, value in enumerate(cell):
+                totals[i] += value
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), totals):
+            cumulative += count
+            samples.append(("_bucket", f'{{le="{bound}"}}', cumulative))
+        samples.append(("_sum", "", totals[-2]))
+        samples.append(("_count", "", totals[-1]))
+        return samples
+
+
+class LabeledCounter(Metric):
+    """
+    One counter per value of a label, e.g. per table. Children are fetched once and kept by their user.
+    """
+    kind = "counter"
+
+    def __init__(self, name, description, label):
+        super().__init__(name, description)
+        self.label = label
+        self.children = {}  # Label's value -> Counter
+
+    def labels(self, value):
+        """
+        :value: label's value
+        :return: Counter
+        """
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = Counter(self.name, self.description, register=False)
+        return child
+
+    def remove(self, value):
+        """
+        Stops exporting a label's value, e.g. when its table is closed
+        """
+        self.children.pop(value, None)
+
+    def samples(self):
+        return [("", f'{{{self.label}="{value}"}}', child.total()) for value, child in list(self.children.items())]
+
+
+ACTION_LATENCY = Histogram("poker_action_latency_seconds",
+                           "Time from receiving a player's action to the end of the game's state broadcast")
+SHOWDOWN_TIME = Histogram("poker_showdown_seconds", "Time to evaluate the hands and split the pots at showdown")
+TOURNAMENT_SETTLE_TIME = Histogram("poker_tournament_settle_seconds",
+                                   "Time for the tournament director to handle the end of a hand at a table")
+SNAPSHOT_TIME = Histogram("poker_snapshot_write_seconds", "Time to write the snapshot of every table to disk")
+HANDS = Counter("poker_hands_total", "Hands completed")
+CHAT_DROPPED = Counter("poker_chat_dropped_total", "Chat messages dropped because their sender exceeded the rate limit")
+TABLE_BYTES = LabeledCounter("poker_table_sent_bytes_total", "Bytes sent to the players of each table", "table")
+CLIENTS = Gauge("poker_connected_clients", "Clients connected")
+TABLES = GaugeFunction("poker_active_tables", "Tables open")
+QUEUED = GaugeFunction("poker_queued_messages", "Messages waiting in the connections' outboxes")
+
+
+def watch(registry):
+    """
+    Exports the state of a table registry
+    :registry: TableRegistry
+    :return: None
+    """
+    TABLES.function = lambda: len(registry.tables)
+    QUEUED.function = lambda: sum(len(conn.queue) for conn in list(registry.connections))
+
+
+def export():
+    """
+    :return: str, every metric in the Prometheus text format
+    """
+    return '\n'.join(metric.export() for metric in METRICS) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = export().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth logging
+
+
+def serve(host=METRICS_IP, port=METRICS_PORT):
+    """
+    Starts the metrics endpoint on a background thread
+    :host: str
+    :port: int
+    :return: ThreadingHTTPServer, to shut down when the server stops
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,224 @@
+"""
+Outbound message queues of the connections. Tables only queue messages, a writer drains each queue to its client, so
+a slow client never blocks the table.
+"""
+
+import abc
+import asyncio
+import socket
+import threading
+from collections import deque
+from time import sleep
+import Wire
+
+
+CAPACITY = 256  # Maximum number of messages waiting to be sent to a client
+STALE_PROTOCOL = 'game'  # A queued game state is useless once a newer one is queued, it can be dropped when full
+
+
+def send_buffers(sock, buffers):
+    """
+    Send several buffers with as few system calls as possible and without joining them
+    :sock: socket object
+    :buffers: list of bytes
+    :return: None
+    """
+    if not hasattr(sock, 'sendmsg'):  # Windows
+        sock.sendall(b"".join(buffers))
+        return
+    views = [memoryview(buffer) for buffer in buffers if buffer]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+class Outbox(abc.ABC):
+    """
+    Bounded queue of messages to send to a client, in order. Legacy clients parse one message at a time, so pauses
+    are kept between their messages. Clients that negotiated sequence numbers get every message prefixed by
+    #<seq> (or a 4-byte sequence number with the binary framing) and no pause at all.
+    """
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.queue = deque()  # (protocol, data) to send, protocol is 'pause' or 'close' for the writer's own orders
+        self.sequenced = False  # Client negotiated sequence numbers
+        self.binary = False  # Client negotiated the binary framing of Wire.py
+        self.seq = 0  # Sequence number of the last message sent
+        self.closed = False
+        self.sent_bytes = None  # Metrics counter of the bytes sent to the table, set when the client is seated
+
+    def put(self, protocol, data):
+        """
+        Queues a message. If the queue is full, the oldest stale game state is dropped, and if there is none the
+        client is too slow to keep up and is disconnected.
+        :protocol: str, key of Player.SEND_PROTOCOL
+        :data: bytes
+        :return: None
+        """
+        if self.closed:
+            return
+        if len(self.queue) >= self.capacity and not self.drop_stale(protocol):
+            self.queue.clear()
+            self.closed = True
+            self.queue.append(('close', None))
+        else:
+            self.queue.append((protocol, data))
+        self.wake()
+
+    def drop_stale(self, protocol):
+        """
+        Drops the oldest queued game state if the message being queued is a newer one, with the pause following it
+        :protocol: str
+        :return: bool, True if some room has been made
+        """
+        if protocol != STALE_PROTOCOL:
+            return False
+        for i, (queued, _) in enumerate(self.queue):
+            if queued == STALE_PROTOCOL:
+                del self.queue[i]
+                if i < len(self.queue) and self.queue[i][0] == 'pause':
+                    del self.queue[i]
+                return True
+        return False
+
+    def pause(self, seconds):
+        """
+        Waits a number of seconds before sending the next message, unless the client uses sequence numbers.
+        Consecutive pauses make a single longer one, and a client whose queue is full gets no more pause: it is
+        already late, pausing would only delay it further.
+        :seconds: float
+        :return: None
+        """
+        if self.sequenced or self.closed:
+            return
+        if self.queue and self.queue[-1][0] == 'pause':
+            self.queue[-1] = ('pause', self.queue[-1][1] + seconds)
+        elif len(self.queue) < self.capacity:
+            self.queue.append(('pause', seconds))
+        else:
+            return
+        self.wake()
+
+    def close(self):
+        """
+        Closes the connection once every queued message has been sent
+        :return: None
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.append(('close', None))
+            self.wake()
+
+    def header(self):
+        """
+        Sequence number of the next message if the client negotiated it. It is written just before the message, which
+        is never copied since it may be shared with other clients.
+        :return: bytes
+        """
+        if not self.sequenced:
+            return b""
+        self.seq += 1
+        if self.binary:
+            return Wire.SEQ.pack(self.seq)
+        return b"#%d " % self.seq
+
+    @abc.abstractmethod
+    def wake(self):
+        """
+        Notifies the writer that something has been queued
+        """
+
+
+class ThreadOutbox(Outbox):
+    """
+    Outbox of a socket, drained by a writer thread
+    """
+    def __init__(self, sock, capacity=CAPACITY):
+        super().__init__(capacity)
+        self.sock = sock
+        self.ready = threading.Condition()
+        self.writer = threading.Thread(target=self.drain, daemon=True)
+        self.writer.start()
+
+    def put(self, protocol, data):
+        with self.ready:
+            super().put(protocol, data)
+
+    def pause(self, seconds):
+        with self.ready:
+            super().pause(seconds)
+
+    def close(self):
+        with self.ready:
+            super().close()
+
+    def wake(self):
+        self.ready.notify()
+
+    def drain(self):
+        while True:
+            with self.ready:
+                while not self.queue:
+                    self.ready.wait()
+                protocol, data = self.queue.popleft()
+            try:
+                if protocol == 'pause':
+                    sleep(data)
+                elif protocol == 'close':
+                    self.sock.shutdown(socket.SHUT_RDWR)  # Also wakes up the thread reading the socket
+                    self.sock.close()
+                    return
+                else:
+                    header = self.header()
+                    send_buffers(self.sock, [header, data])
+                    if self.sent_bytes:
+                        self.sent_bytes.inc(len(header) + len(data))
+            except OSError:
+                with self.ready:
+                    self.closed = True
+                    self.queue.clear()
+                self.sock.close()
+                return
+
+
+class AsyncOutbox(Outbox):
+    """
+    Outbox of an asyncio stream, drained by a task of the event loop
+    """
+    def __init__(self, writer, capacity=CAPACITY):
+        super().__init__(capacity)
+        self.writer = writer
+        self.ready = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.drain())
+
+    def wake(self):
+        self.ready.set()
+
+    async def drain(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.queue:
+                protocol, data = self.queue.popleft()
+                try:
+                    if protocol == 'pause':
+                        await asyncio.sleep(data)
+                    elif protocol == 'close':
+                        self.writer.close()
+                        return
+                    else:
+                        header = self.header()
+                        self.writer.writelines([header, data])
+                        await self.writer.drain()  # Waits while the client is not reading fast enough
+                        if self.sent_bytes:
+                            self.sent_bytes.inc(len(header) + len(data))
+                except OSError:
+                    self.closed = True
+                    self.queue.clear()
+                    self.writer.close()
+                    return
@@ -3,6 +3,11 @@ Handles everything related to a player, including his actions
 """
 
 from datetime import datetime
+import Wire
+from Log import get_logger
+
+
+log = get_logger("player")
 
 
 # Protocols for sending message to player
@@ -14,20 +19,63 @@ SEND_PROTOCOL = {
     'name': "03",
     'showdown': "04",
     'announcement': "05",
+    'delta': "06",
     'end_of_msg': "$",
 }
 
 
+class Message:
+    """
+    A message to send to one or many players. It is encoded at most once per framing, so that broadcasting it costs
+    the same whatever the number of recipients.
+    """
+    __slots__ = ('protocol', 'msg', 'payload', 'text', 'binary')
+
+    def __init__(self, protocol, msg, payload=None):
+        if msg != "":
+            msg = " " + msg
+        # If a text message is sent to player, it should include a time stamp
+        if protocol == 'message':
+            msg = f" [{datetime.now().strftime('%H:%M:%S')}] " + msg
+        self.protocol = protocol
+        self.msg = msg
+        self.payload = payload  # Binary encoding of the message if it's not just the text
+        self.text = None  # Encoded frames of the text and binary protocols
+        self.binary = None
+
+    def __str__(self):
+        return SEND_PROTOCOL[self.protocol] + self.msg
+
+    def encode(self, binary):
+        """
+        Frame of the message for the text or binary protocol, encoded on first use
+        :binary: bool
+        :return: bytes
+        """
+        if binary:
+            if self.binary is None:
+                payload = self.msg[1:].encode() if self.payload is None else self.payload
+                self.binary = Wire.encode_frame(self.protocol, payload)
+            return self.binary
+        if self.text is None:
+            self.text = (SEND_PROTOCOL[self.protocol] + self.msg + SEND_PROTOCOL['end_of_msg']).encode()
+        return self.text
+
+
 class Player:
+    __slots__ = ('name', 'sock', 'stack', 'betting', 'in_hand', 'all_in', 'hand', 'gm', 'delta', 'acked_version')
+
     def __init__(self, name, sock):
         self.name = name
-        self.sock = sock
+        self.sock = sock  # Outbox of the player's connection
         self.stack = 200
         self.betting = 0
         self.in_hand = False
         self.all_in = False
-        self.hand = []
+        self.hand = b""  # Card ids, 1 byte each
         self.gm = False
+        self.delta = False  # Player negotiated delta updates of the game's state
+        self.acked_version = None  # Last version of the game's state acknowledged by the player
         if name == "TrungDam":
             self.hire()
 
@@ -62,16 +110,29 @@ class Player:
     def fire(self):
         self.gm = False
 
-    def send_to_client(self, protocol, msg):
-        if msg != "":
-            msg = " " + msg
-        # If a text message is sent to player, it should include a time stamp
-        if protocol == 'message':
-            msg = f" [{datetime.now().strftime('%H:%M:%S')}] " + msg
-
-        data = SEND_PROTOCOL[protocol] + msg + SEND_PROTOCOL['end_of_msg']
-        self.sock.sendall(data.encode())
-        print(f"Sent to {self.name}: {data[:-1]}")
+    def send_to_client(self, protocol, msg, payload=None):
+        """
+        Send a message to the player only, with the framing negotiated by the client
+        :protocol: str, key of SEND_PROTOCOL
+        :msg: str, message of the text protocol
+        :payload: bytes, binary encoding of the message for the binary protocol, if it's not just the text
+        :return: None
+        """
+        message = Message(protocol, msg, payload)
+        self.send(message)
+        log.debug("Sent: %s", message, extra={'player': self.name})
+
+    def send(self, message):
+        """
+        Queue a message, possibly shared with other players, using the framing negotiated by the client
+        :message: Message object
+        :return: None
+        """
+        self.sock.put(message.protocol, message.encode(self.sock.binary))
+
+    def pause(self, seconds):
+        # Leaves time for the client to parse the previous message, without blocking the table
+        self.sock.pause(seconds)
 
     def disconnect(self):
         self.send_to_client('disconnect', "")
@@ -0,0 +1,59 @@
+"""
+Sets of seats kept as bitmasks (bit i set if seat i belongs to the set), so that finding who acts next or last at a
+table costs a few integer operations whatever the table's size
+"""
+
+
+def seat_bit(seat):
+    """
+    :seat: int
+    :return: int, mask of the seat alone
+    """
+    return 1 << seat
+
+
+def seat_count(seats):
+    """
+    :seats: int, mask of seats
+    :return: int, number of seats in the mask
+    """
+    return bin(seats).count("1")
+
+
+def seat_list(seats):
+    """
+    :seats: int, mask of seats
+    :return: list of seat numbers, in increasing order
+    """
+    result = []
+    while seats:
+        low = seats & -seats
+        result.append(low.bit_length() - 1)
+        seats ^= low
+    return result
+
+
+def next_seat(seats, seat):
+    """
+    First seat of the mask after a seat, going around the table
+    :seats: int, mask of seats, must not be empty
+    :seat: int
+    :return: int, the seat itself if it's the only one in the mask
+    """
+    after = seats >> (seat + 1)
+    if after:
+        return seat + 1 + (after & -after).bit_length() - 1
+    return (seats & -seats).bit_length() - 1
+
+
+def previous_seat(seats, seat):
+    """
+    Last seat of the mask before a seat, going around the table
+    :seats: int, mask of seats, must not be empty
+    :seat: int
+    :return: int, the seat itself if it's the only one in the mask
+    """
+    before = seats & ((1 << seat) - 1)
+    if before:
+        return before.bit_length() - 1
+    return seats.bit_length() - 1
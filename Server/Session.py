@@ -0,0 +1,270 @@
+"""
+Handles a client's session: the messages it sends and the table it is seated at. Shared by every server mode.
+"""
+
+from time import perf_counter
+from Player import Player
+from Chat import TokenBucket
+import Wire
+from Log import get_logger
+import Metrics
+
+
+# Protocols for parsing message from client
+RECV_PROTOCOL = {
+    'disconnect': "-1",
+    'connected': "00",
+    'start': "01",
+    'blind': "02",
+    'action': "03",
+    'chat': "04",
+    'stack': "05",
+    'request_state': "06",
+    'options': "07",
+    'ack': "08",
+    'end_of_msg': "$",
+}
+
+
+class Session:
+    def __init__(self, registry, conn, address=None):
+        self.registry = registry  # Registry of the tables hosted by the server
+        self.conn = conn  # Outbox of the connection to the client
+        self.address = address  # Client's address, for debugging
+        self.buffer = bytearray()  # Bytes received but not parsed yet
+        self.options = set()  # Protocol options negotiated by the client
+        self.log = get_logger("session", conn=address)  # The table's id is added once the client is seated
+        self.received_at = 0  # When the data being parsed was received
+        # Chat's rate limit, a client exceeding it is warned once and its messages are dropped until it slows down
+        self.chat_limit = TokenBucket(*registry.chat_limit) if registry.chat_limit else None
+        self.throttled = False
+        Metrics.CLIENTS.inc()
+
+    @property
+    def game(self):
+        """
+        Table the client is seated at, None if it is not seated. Looked up in the registry, since a tournament
+        director moves players between tables.
+        """
+        return self.registry.lookup(self.conn)[0]
+
+    @property
+    def player(self):
+        return self.registry.lookup(self.conn)[1]
+
+    def close(self):
+        """
+        Frees the seat if the client left without saying goodbye, and stops the connection's writer
+        :return: None
+        """
+        self.registry.leave(self.conn)
+        self.conn.close()
+        Metrics.CLIENTS.dec()
+
+    def receive(self, data):
+        """
+        Handles the bytes received from the client, which may hold any number of messages, or only part of one
+        :data: bytes
+        :return: int, -1 if the client is to be disconnected
+        """
+        self.received_at = perf_counter()
+        self.buffer += data
+        while self.buffer:
+            if self.conn.binary:
+                if len(self.buffer) < Wire.HEADER.size:
+                    return 0
+                opcode, length = Wire.HEADER.unpack_from(self.buffer)
+                end = Wire.HEADER.size + length
+                if len(self.buffer) < end:
+                    return 0
+                payload = bytes(self.buffer[Wire.HEADER.size:end])
+                del self.buffer[:end]
+                self.log.debug(">> RECEIVED: %d %r", opcode, payload)
+                status = self.parse_frame(opcode, payload)
+            else:
+                i = self.buffer.find(RECV_PROTOCOL['end_of_msg'].encode())
+                if i == -1:
+                    return 0
+                msg = self.buffer[:i].decode()
+                del self.buffer[:i + 1]
+                self.log.debug(">> RECEIVED: %s", msg)
+                status = self.parse_message(msg)
+            if status == -1:
+                return -1
+        return 0
+
+    def parse_message(self, msg):
+        """
+        Get the meaning from a text message sent by the client to take proper actions
+        :msg: str
+        :return: int
+        """
+        protocol = msg[:2]
+        command = msg[3:]
+
+        if protocol in (RECV_PROTOCOL['connected'], RECV_PROTOCOL['chat']):
+            # Example: 00 TrungDam
+            fields = (command,)
+        elif protocol == RECV_PROTOCOL['blind']:
+            # Example: 02 50:100
+            SEPERATOR = ':'
+            i = command.find(SEPERATOR)
+            fields = (int(command[:i]), int(command[i+1:]))
+        elif protocol == RECV_PROTOCOL['action']:
+            # Example: 03 3 0
+            fields = (int(command[0]), int(command[2:]))
+        elif protocol == RECV_PROTOCOL['stack']:
+            # Example: 05 1 -15
+            info = command.split(' ')
+            fields = (int(info[0]), int(info[1]))
+        elif protocol == RECV_PROTOCOL['options']:
+            # Example: 07 seq delta
+            fields = (command,)
+        elif protocol == RECV_PROTOCOL['ack']:
+            # Example: 08 12
+            fields = (int(command),)
+        else:
+            fields = ()
+        return self.dispatch(protocol, *fields)
+
+    def parse_frame(self, opcode, payload):
+        """
+        Get the meaning from a binary frame sent by the client to take proper actions
+        :opcode: int
+        :payload: bytes
+        :return: int
+        """
+        try:
+            protocol, fields = Wire.decode_request(opcode, payload)
+        except Wire.ProtocolError as error:
+            # The frame is skipped, the next ones can still be read since its length was known
+            self.log.warning("Invalid frame rejected: %s", error)
+            return 0
+        return self.dispatch(protocol, *fields)
+
+    def dispatch(self, protocol, *fields):
+        """
+        Take proper actions for a message sent by the client, whatever the framing it was received with
+        :protocol: str, code of RECV_PROTOCOL
+        :fields: values decoded from the message
+        :return: int
+        """
+        if protocol == RECV_PROTOCOL['disconnect']:
+            # Client requests to disconnect
+            self.registry.leave(self.conn)
+            self.conn.close()
+
+        elif protocol == RECV_PROTOCOL['connected']:
+            # First message received from client when connected, with the player's name
+            # The client is seated at a table with a free seat. If name already exists there, changes it so it's unique
+            name, = fields
+            game, player = self.registry.join(name, self.conn)
+            if not player:
+                # Every table is full, the client is disconnected
+                Player(name, self.conn).disconnect()
+                return -1
+            self.log.extra['table'] = game.table_id
+            player.delta = 'delta' in self.options
+
+        elif protocol == RECV_PROTOCOL['options']:
+            # Protocol options supported by the client, can be sent at any time
+            # seq: every message sent to the client is prefixed by its sequence number (#12 01 ON(1)...) and messages
+            # are no longer spaced out by pauses
+            # delta: game's states are versioned, VS(version:base). After acknowledging a version, the client only
+            # gets the components changed since then (06 VS(12:10) PL(2:Bob:180:20:1) AC(3)), to be applied on top
+            # of the state of the base version
+            # binary: every following message in both directions uses the binary framing of Wire.py, which is always
+            # sequenced. Binary game's states are always full states.
+            self.options.update(fields[0].split(' '))
+            self.conn.binary = 'binary' in self.options
+            self.conn.sequenced = 'seq' in self.options or self.conn.binary
+            if self.player:
+                self.player.delta = 'delta' in self.options
+
+        elif protocol == RECV_PROTOCOL['ack']:
+            # Client acknowledges having applied a version of the game's state
+            if self.player:
+                self.player.acked_version, = fields
+
+        elif not self.player:
+            # Client must connect before anything else
+            pass
+
+        else:
+            # A tournament director may move the player to another table, or knock him out, until the lock is held
+            game = self.game
+            while game:
+                with game.lock:
+                    if self.game is game:
+                        self.order(protocol, *fields)
+                        break
+                game = self.game
+
+        return int(protocol)
+
+    def order(self, protocol, *fields):
+        """
+        Take proper actions for a seated player's order or chat message, the table's lock being held. At a
+        tournament's table, the director deals and sets the blinds, game master or not.
+        :protocol: str, code of RECV_PROTOCOL
+        :fields: values decoded from the message
+        :return: None
+        """
+        if self.game.director and protocol in (RECV_PROTOCOL['start'], RECV_PROTOCOL['blind'], RECV_PROTOCOL['stack']):
+            # Tournament's table: hands, blinds and stacks are the director's
+            pass
+
+        elif protocol == RECV_PROTOCOL['start']:
+            # Game master's order to start a new game
+            if self.player.gm and not self.game.on:
+                if self.game.can_start():
+                    self.game.new_game()
+                else:
+                    self.player.send_to_client('message', "Game cannot start. Not enough player to play, or blind not set.")
+
+        elif protocol == RECV_PROTOCOL['blind']:
+            # Game master's order to set small & big blinds
+            if self.player.gm:
+                sb, bb = fields
+                self.game.set_blinds(sb, bb)
+
+        elif protocol == RECV_PROTOCOL['action']:
+            # A player's action during a game
+            ACTIONS = {
+                1: "fold",
+                2: "check",
+                3: "call",
+                4: "shove",
+                5: "bet",
+            }
+            i, amt = fields
+            if i == 5:
+                amt -= self.player.betting
+            if self.game.runout is None:  # Nothing is left to decide while the rest of an all-in hand is drawn
+                self.game.act(self.player, ACTIONS[i], amt)
+                Metrics.ACTION_LATENCY.observe(perf_counter() - self.received_at)
+
+        elif protocol == RECV_PROTOCOL['chat']:
+            # A player's chat message
+            if self.chat_limit and not self.chat_limit.take():
+                Metrics.CHAT_DROPPED.inc()
+                if not self.throttled:
+                    self.throttled = True
+                    self.player.send_to_client('message', "You are sending messages too fast, please slow down.")
+            else:
+                self.throttled = False
+                self.game.send_chat(f"{self.player}: {fields[0]}")
+
+        elif protocol == RECV_PROTOCOL['stack']:
+            # Game master's order to set a player's stack
+            if self.player.gm:
+                seat, amount = fields
+                self.game.players[seat].modify_stack(amount)
+                self.game.send_game_state()
+                self.game.checkpoint()
+
+        elif protocol == RECV_PROTOCOL['request_state']:
+            # Game master's request of game's state, often occurs after announcement of winners
+            if self.player.gm:
+                self.game.send_game_state(full=True)
+
@@ -0,0 +1,69 @@
+"""
+Builds the main and side pots of a hand from what every player put in, and awards them at showdown
+"""
+
+
+def build_pots(contributions):
+    """
+    Main and side pots, built in one pass over the contributions sorted by amount. A new pot starts at each amount
+    put in by a player still in hand, and only players having put in at least that much can win it. Chips of folded
+    players above the biggest amount of a player still in hand go to the last pot.
+    :contributions: list of (player, chips put in during the hand, still in hand)
+    :return: list of [amount, list of players who can win it], from the main pot to the last side pot
+    """
+    order = sorted(contributions, key=lambda contribution: contribution[1])
+    pots = []
+    previous = 0  # Amount the previous pot was built up to
+    partial = 0  # Chips of folded players between the previous amount and the next one
+    for i, (_, chips, in_hand) in enumerate(order):
+        if not in_hand or chips == previous:
+            partial += chips - previous
+            continue
+        # Every player from this one on put in at least this amount
+        amount = partial + (chips - previous) * (len(order) - i)
+        pots.append([amount, [player for player, _, live in order[i:] if live]])
+        previous = chips
+        partial = 0
+    if pots:
+        pots[-1][0] += partial
+    elif partial:
+        pots.append([partial, []])
+    return pots
+
+
+def uncalled_bet(contributions):
+    """
+    Chips put in by the biggest contributor that nobody else matched, to be given back to him
+    :contributions: list of (player, chips put in during the hand, still in hand)
+    :return: tuple (player, chips), player being None if every bet has been matched
+    """
+    if len(contributions) < 2:
+        return None, 0
+    order = sorted(contributions, key=lambda contribution: contribution[1])
+    (player, chips, _), (_, second, _) = order[-1], order[-2]
+    if chips > second:
+        return player, chips - second
+    return None, 0
+
+
+def award(pots, strengths, order):
+    """
+    Splits every pot between the players having the best hand among those who can win it. Odd chips of a split go
+    one by one to the winners closest to the dealer's left.
+    :pots: list of [amount, players], as returned by build_pots
+    :strengths: dict, player -> strength of the hand, as returned by Evaluator.evaluate
+    :order: dict, player -> position from the dealer's left, 0 being the first
+    :return: list of [amount of the pot, winners, strength of the winning hand, chips won by each winner], one per pot
+    """
+    results = []
+    for amount, players in pots:
+        if not players:
+            continue
+        best = max(strengths[player] for player in players)
+        winners = sorted((player for player in players if strengths[player] == best), key=order.get)
+        share, odd = divmod(amount, len(winners))
+        won = [share + (i < odd) for i in range(len(winners))]
+        for winner, chips in zip(winners, won):
+            winner.stack += chips
+        results.append([amount, winners, best, won])
+    return results
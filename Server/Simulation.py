@@ -0,0 +1,234 @@
+"""
+Headless simulation: plays hands between bots without any socket or client, to regression-test the game's logic
+(pots, side pots, chips) at volume and to plan capacity.
+Usage: python Simulation.py [hands] [players] [workers] [variant]
+"""
+
+import sys
+import random
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from Game import Game, MAX_PLAYERS
+from Outbox import Outbox
+from Variants import VARIANTS
+
+
+MAX_ACTIONS = 200  # A hand taking more actions than this is considered stuck
+REBUY = 200  # Stack given back to busted players
+
+
+class NullOutbox(Outbox):
+    """
+    Outbox of a bot: messages are dropped, pauses are ignored
+    """
+    def __init__(self, keep=False):
+        super().__init__()
+        self.sequenced = True  # No pause needed
+        self.keep = keep  # Keep the messages in memory, for debugging
+        self.sent = []
+
+    def put(self, protocol, data):
+        if self.keep:
+            self.sent.append(data)
+
+    def pause(self, seconds):
+        pass
+
+    def close(self):
+        pass
+
+    def wake(self):
+        pass
+
+
+def legal_actions(game, player):
+    """
+    What a player can do, following the same rules as the client's UI
+    :game: Game object
+    :player: Player object
+    :return: tuple (to_call, can_raise, min_raise) where min_raise is the minimum amount of chips to add to raise
+    """
+    to_call = game.highest_bet - player.betting
+    others = [p for p in game.players if p and p is not player and p.in_hand and not p.all_in]
+    can_raise = bool(others) and player.stack > to_call
+    raise_to = game.highest_bet + max(game.highest_bet - game.second_highest_bet, game.bb)
+    return to_call, can_raise, raise_to - player.betting
+
+
+def calling_station(game, player, rng):
+    """
+    Never folds, never raises
+    :return: tuple (action, amount)
+    """
+    to_call, _, _ = legal_actions(game, player)
+    return ("call", 0) if to_call else ("check", 0)
+
+
+def random_bot(game, player, rng):
+    """
+    Picks any legal action at random, including min-raises, bigger raises and shoves
+    :return: tuple (action, amount)
+    """
+    to_call, can_raise, min_raise = legal_actions(game, player)
+    choices = ["call" if to_call else "check"]
+    if to_call:
+        choices.append("fold")
+    if can_raise:
+        choices += ["bet", "shove"]
+    action = rng.choice(choices)
+    if action == "bet":
+        amount = rng.randint(min_raise, max(min_raise, player.stack // 2))
+        if amount >= player.stack:
+            return "shove", 0
+        return "bet", amount
+    return action, 0
+
+
+def maniac(game, player, rng):
+    """
+    Shoves a lot, creating many all-ins and side pots
+    :return: tuple (action, amount)
+    """
+    to_call, can_raise, _ = legal_actions(game, player)
+    if can_raise and rng.random() < 0.3:
+        return "shove", 0
+    if to_call and rng.random() < 0.2:
+        return "fold", 0
+    return ("call", 0) if to_call else ("check", 0)
+
+
+POLICIES = {
+    'calling_station': calling_station,
+    'random': random_bot,
+    'maniac': maniac,
+}
+
+
+def new_table(num_players, blinds=(5, 10), variant="holdem"):
+    """
+    A table with bots sitting, no client connected
+    :num_players: int, more than MAX_PLAYERS for bigger tables, e.g. 9 or 10-max
+    :blinds: tuple
+    :variant: str, key of Variants.VARIANTS
+    :return: Game object
+    """
+    game = Game(max_players=max(num_players, MAX_PLAYERS), variant=VARIANTS[variant])
+    game.show_equities = False
+    for i in range(num_players):
+        game.add_player(f"bot{i}", NullOutbox(), False)
+    game.set_blinds(*blinds)
+    return game
+
+
+def seat_policies(game, policy_names):
+    """
+    Policy of the bot sitting at each seat
+    :game: Game object
+    :policy_names: list of keys of POLICIES, in the order the bots were added
+    :return: dict, seat -> policy
+    """
+    bots = sorted((int(player.name[3:]), seat) for seat, player in enumerate(game.players) if player)
+    return {seat: POLICIES[policy_names[i]] for i, seat in bots}
+
+
+def table_chips(game):
+    """
+    Every chip at the table: stacks, bets and pots
+    :return: int
+    """
+    seated = [player for player in game.players if player]
+    return sum(player.stack + player.betting for player in seated) + sum(game.pots)
+
+
+def play_hand(game, policies, rng):
+    """
+    Plays a hand until it ends
+    :game: Game object
+    :policies: dict, seat -> policy
+    :rng: random.Random
+    :return: int, number of actions taken
+    """
+    game.new_game()
+    actions = 0
+    while game.on:
+        if actions == MAX_ACTIONS:
+            raise RuntimeError(f"Hand stuck after {MAX_ACTIONS} actions")
+        actor = game.players[game.acting]
+        action, amount = policies[game.acting](game, actor, rng)
+        game.act(actor, action, amount)
+        actions += 1
+    return actions
+
+
+def run(hands, num_players=MAX_PLAYERS, policy_names=None, seed=None, variant="holdem"):
+    """
+    Plays hands at one table and checks that no chip is ever created or lost
+    :hands: int
+    :num_players: int
+    :policy_names: list of keys of POLICIES, one per seat, random policies by default
+    :seed: int, seed of the bots' decisions
+    :variant: str, key of Variants.VARIANTS
+    :return: dict of statistics
+    """
+    rng = random.Random(seed)
+    if policy_names is None:
+        policy_names = [rng.choice(list(POLICIES)) for _ in range(num_players)]
+    stats = {'hands': 0, 'actions': 0, 'errors': 0, 'chip_errors': 0, 'seconds': 0.0, 'failures': []}
+    start = time.perf_counter()
+    game = new_table(num_players, variant=variant)
+    seats = seat_policies(game, policy_names)
+    for _ in range(hands):
+        for player in game.players:
+            if player and not player.stack:
+                player.modify_stack(REBUY)
+        chips = table_chips(game)
+        try:
+            stats['actions'] += play_hand(game, seats, rng)
+        except Exception:
+            stats['errors'] += 1
+            stats['failures'].append(traceback.format_exc(limit=3))
+            game = new_table(num_players, variant=variant)
+            seats = seat_policies(game, policy_names)
+            continue
+        stats['hands'] += 1
+        if table_chips(game) != chips:
+            stats['chip_errors'] += 1
+            stats['failures'].append(f"Chips went from {chips} to {table_chips(game)}")
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def simulate(hands, num_players=MAX_PLAYERS, workers=None, chunk=1000, variant="holdem"):
+    """
+    Plays hands on every core, each worker process running its own tables
+    :hands: int, total number of hands
+    :num_players: int
+    :workers: int, number of processes, one per core by default
+    :chunk: int, hands played by a worker per task
+    :variant: str, key of Variants.VARIANTS
+    :return: dict of aggregated statistics
+    """
+    start = time.perf_counter()
+    total = {'hands': 0, 'actions': 0, 'errors': 0, 'chip_errors': 0, 'failures': []}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, min(chunk, hands - i), num_players, variant=variant)
+                   for i in range(0, hands, chunk)]
+        for future in futures:
+            stats = future.result()
+            for key in total:
+                total[key] += stats[key]
+    total['seconds'] = time.perf_counter() - start
+    total['hands_per_hour'] = total['hands'] / total['seconds'] * 3600 if total['seconds'] else 0
+    return total
+
+
+if __name__ == "__main__":
+    hands = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_players = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_PLAYERS
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    variant = sys.argv[4] if len(sys.argv) > 4 else "holdem"
+    result = simulate(hands, num_players, workers, variant=variant)
+    for failure in result.pop('failures')[:10]:
+        print(failure)
+    print(result)
@@ -0,0 +1,322 @@
+"""
+Snapshots of every table's state, hands in progress included, so that a server can be restarted (after a crash or to
+deploy a new version) without losing any stack, pot or hand. Each table reports that it changed when an action is
+over, and a background thread regularly encodes the tables that changed since its previous write, once however many
+actions they had, then writes the latest state of every table to disk, replacing the previous snapshot file at once
+so that it is never half written.
+
+The snapshot holds the players' hole cards and the order of the cards left in the deck: anyone reading it during a
+hand knows every card to come. The file is created readable and writable by the server's user only (0o600), and
+should not be copied anywhere less protected.
+
+The snapshot file starts with FILE (MAGIC, format version, time, number of tables), followed by the tables, each one
+made of its length (4 bytes) and:
+- TABLE: ids, seats, blinds, hand's state (round, dealer, acting players, bets, seats in hand), state's version, the
+  number of seated players, contributions, pots, cards left in the deck, community cards, whether the hand is being
+  recorded for the hand log, and the variant played (see Variants.py)
+- SEAT for each seated player: seat, stack, bet, FLAGS, hole cards, name (UTF-8, its length first)
+- CONTRIBUTION for each player having put chips in during the hand, in the order they did: seat (DEPARTED for a
+  player who left the table since, followed by his name), chips put in
+- POT for each pot: amount, number of players who can win it, followed by their seats
+- cards left in the deck then community cards, 1 byte each
+- if recorded, RECORD then the seats and actions of the hand's record, as in HandHistory.py
+"""
+
+import os
+import sys
+import time
+import struct
+import threading
+from collections import OrderedDict
+from Game import Game
+from Player import Player
+from Deck import Deck
+from Outbox import Outbox
+from HandHistory import HandRecord, LENGTH, SEAT as RECORD_SEAT, ACTION as RECORD_ACTION
+from Variants import VARIANT_CODES
+import Metrics
+
+
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tables.snapshot")
+MAGIC = b"PTS1"
+FORMAT_VERSION = 1
+FILE = struct.Struct('!4sHdI')  # Magic, format version, time, number of tables
+# Table id, hand number, seats, on, sb, bb, round, dealer, acting, last to act, highest bet, second highest bet,
+# seats in hand, seats still able to act, state's version, seated players, contributions, pots, deck, community,
+# recorded, variant
+TABLE = struct.Struct('!IIBBIIBBBBIIHHIBBBBBBB')
+SEAT = struct.Struct('!BIIBBB')  # Seat, stack, bet, flags, hole cards, length of the name
+CONTRIBUTION = struct.Struct('!BI')  # Seat, chips put in
+DEPARTED = 0xFF  # Seat of a player who left the table
+POT = struct.Struct('!IB')  # Amount, number of players who can win it
+RECORD = struct.Struct('!dBH')  # Time, seats, actions
+SNAPSHOT_INTERVAL = 0.5  # Seconds between two writes of the snapshot file when tables keep changing
+FILE_MODE = 0o600  # Hole cards and decks are secret: only the server's user can read the file
+
+# Player's flags
+IN_HAND = 1
+ALL_IN = 2
+GM = 4
+DELTA = 8
+
+
+class DetachedOutbox(Outbox):
+    """
+    Outbox of a restored player whose client has not re-attached yet: messages are dropped, the client gets the full
+    game's state when it comes back
+    """
+    def put(self, protocol, data):
+        pass
+
+    def pause(self, seconds):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def wake(self):
+        pass
+
+
+def encode_table(game):
+    """
+    Binary snapshot of a table
+    :game: Game object
+    :return: bytes, length included
+    """
+    seated = [(i, player) for i, player in enumerate(game.players) if player]
+    pots = list(zip(game.pots, game.pot_players))
+    deck = game.deck.cards if game.deck else b""
+    record = game.record
+    body = bytearray(TABLE.pack(game.table_id, game.hand_number, game.max_players, game.on, game.sb, game.bb,
+                                game.round, game.dealer, game.acting, game.last_to_act, game.highest_bet,
+                                game.second_highest_bet, game.in_hand_seats, game.active_seats, game.version,
+                                len(seated), len(game.contributions), len(pots), len(deck), len(game.community),
+                                record is not None, game.variant.code))
+    for i, player in seated:
+        name = player.name.encode()
+        flags = IN_HAND * player.in_hand | ALL_IN * player.all_in | GM * player.gm | DELTA * player.delta
+        body += SEAT.pack(i, player.stack, player.betting, flags, len(player.hand), len(name))
+        body += player.hand
+        body += name
+    seats = {player: i for i, player in seated}
+    for player, chips in game.contributions.items():
+        seat = seats.get(player, DEPARTED)
+        body += CONTRIBUTION.pack(seat, chips)
+        if seat == DEPARTED:
+            name = player.name.encode()
+            body += bytes((len(name),))
+            body += name
+    for amount, players in pots:
+        players = [seats[player] for player in players if player in seats]
+        body += POT.pack(amount, len(players))
+        body += bytes(players)
+    body += deck
+    body += game.community
+    if record is not None:
+        body += RECORD.pack(record.time, len(record.seats), len(record.actions))
+        for seat, stack, hand, name in record.seats:
+            name = name.encode()
+            body += RECORD_SEAT.pack(seat, stack, len(hand), len(name))
+            body += hand
+            body += name
+        for action in record.actions:
+            body += RECORD_ACTION.pack(*action)
+    return LENGTH.pack(len(body)) + body
+
+
+def decode_table(data, offset=0):
+    """
+    Rebuilds a table from its snapshot. Its players have a DetachedOutbox until their clients re-attach.
+    :data: bytes-like, e.g. the content of a snapshot file
+    :offset: int, where the table starts, after its length
+    :return: Game object
+    """
+    (table_id, hand_number, max_players, on, sb, bb, round_, dealer, acting, last_to_act, highest_bet,
+     second_highest_bet, in_hand_seats, active_seats, version, num_seated, num_contributions, num_pots, deck_size,
+     community_size, recorded, variant) = TABLE.unpack_from(data, offset)
+    offset += TABLE.size
+    game = Game(table_id, max_players, VARIANT_CODES[variant])
+    game.hand_number = hand_number
+    game.on = bool(on)
+    game.sb, game.bb = sb, bb
+    game.round, game.dealer, game.acting, game.last_to_act = round_, dealer, acting, last_to_act
+    game.highest_bet, game.second_highest_bet = highest_bet, second_highest_bet
+    game.in_hand_seats, game.active_seats = in_hand_seats, active_seats
+    game.version = version
+    for _ in range(num_seated):
+        seat, stack, betting, flags, hand_size, name_size = SEAT.unpack_from(data, offset)
+        offset += SEAT.size
+        hand = bytes(data[offset:offset + hand_size])
+        offset += hand_size
+        name = bytes(data[offset:offset + name_size]).decode()
+        offset += name_size
+        player = Player(name, DetachedOutbox())
+        player.stack, player.betting, player.hand = stack, betting, hand
+        player.in_hand, player.all_in = bool(flags & IN_HAND), bool(flags & ALL_IN)
+        player.gm, player.delta = bool(flags & GM), bool(flags & DELTA)
+        game.players[seat] = player
+    for _ in range(num_contributions):
+        seat, chips = CONTRIBUTION.unpack_from(data, offset)
+        offset += CONTRIBUTION.size
+        if seat == DEPARTED:
+            name_size = data[offset]
+            name = bytes(data[offset + 1:offset + 1 + name_size]).decode()
+            offset += 1 + name_size
+            game.contributions[Player(name, DetachedOutbox())] = chips
+        else:
+            game.contributions[game.players[seat]] = chips
+    pots = []
+    for _ in range(num_pots):
+        amount, num_players = POT.unpack_from(data, offset)
+        offset += POT.size
+        pots.append((amount, [game.players[seat] for seat in data[offset:offset + num_players]]))
+        offset += num_players
+    game.pots = [amount for amount, _ in pots] or [0]
+    game.pot_players = [players for _, players in pots] or [[]]
+    if on:
+        game.deck = Deck(bytearray(data[offset:offset + deck_size]))
+    offset += deck_size
+    game.community = bytearray(data[offset:offset + community_size])
+    offset += community_size
+    if recorded:
+        record = HandRecord(game)
+        record.time, num_seats, num_actions = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        record.seats = []
+        for _ in range(num_seats):
+            seat, stack, hand_size, name_size = RECORD_SEAT.unpack_from(data, offset)
+            offset += RECORD_SEAT.size
+            hand = bytes(data[offset:offset + hand_size])
+            offset += hand_size
+            name = bytes(data[offset:offset + name_size]).decode()
+            offset += name_size
+            record.seats.append((seat, stack, hand, name))
+        record.actions = []
+        for _ in range(num_actions):
+            record.actions.append(RECORD_ACTION.unpack_from(data, offset))
+            offset += RECORD_ACTION.size
+        game.record = record
+    game.states = OrderedDict()  # Clients re-attaching get the full state, no delta is computed from older versions
+    return game
+
+
+def load(path=SNAPSHOT_FILE):
+    """
+    Reads the tables of a snapshot file
+    :path: str
+    :return: list of Game objects, empty if there is no snapshot
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as file:
+        data = memoryview(file.read())
+    magic, version, _, num_tables = FILE.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a table snapshot of version {FORMAT_VERSION}")
+    games = []
+    offset = FILE.size
+    for _ in range(num_tables):
+        length, = LENGTH.unpack_from(data, offset)
+        games.append(decode_table(data, offset + LENGTH.size))
+        offset += LENGTH.size + length
+    return games
+
+
+class Snapshots:
+    """
+    Latest snapshot of every table, shared by every table of the server. Tables report when they change (see
+    Game.checkpoint), a background thread encodes the tables that changed and writes the snapshots of all the tables,
+    at most once per interval. A table is encoded while holding its lock, so that its state is consistent.
+    """
+    def __init__(self, path=SNAPSHOT_FILE, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.tables = {}  # Table id -> encoded snapshot
+        self.dirty = {}  # Table id -> Game, tables changed since they were last encoded
+        self.lock = threading.Lock()  # Taken by tables and the writer alike, a table's lock is never taken under it
+        self.changed = threading.Event()  # Some table changed since the last write
+        self.stopped = threading.Event()
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    def update(self, game):
+        """
+        Marks a table as changed, to be encoded again before the next write. Never waits for the writer.
+        :game: Game object
+        :return: None
+        """
+        with self.lock:
+            self.dirty[game.table_id] = game
+        self.changed.set()
+
+    def remove(self, table_id):
+        """
+        Forgets a closed table
+        :table_id: int
+        :return: None
+        """
+        with self.lock:
+            self.dirty.pop(table_id, None)
+            removed = self.tables.pop(table_id, None) is not None
+        if removed:
+            self.changed.set()
+
+    def encode(self):
+        """
+        Encodes the tables changed since they were last encoded
+        :return: None
+        """
+        with self.lock:
+            dirty, self.dirty = self.dirty, {}
+        for table_id, game in dirty.items():
+            with game.lock:
+                encoded = encode_table(game)
+            with self.lock:
+                if game.snapshots is self:  # The table was not closed meanwhile
+                    self.tables[table_id] = encoded
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.changed.wait()
+            self.changed.clear()
+            self.write()
+            self.stopped.wait(self.interval)
+
+    def write(self):
+        """
+        Writes the snapshot file, replacing the previous one only once the new one is complete
+        :return: None
+        """
+        start = time.perf_counter()
+        self.encode()
+        with self.lock:
+            tables = list(self.tables.values())  # Encoded snapshots are shared, not copied
+        temporary = self.path + ".tmp"
+        if os.path.exists(temporary):  # Left by a crash, maybe with wider permissions: O_CREAT would keep them
+            os.remove(temporary)
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), FILE_MODE)
+        with open(descriptor, "wb") as file:
+            file.write(FILE.pack(MAGIC, FORMAT_VERSION, time.time(), len(tables)))
+            file.writelines(tables)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+        Metrics.SNAPSHOT_TIME.observe(time.perf_counter() - start)
+
+    def close(self):
+        """
+        Stops the writer and writes the final state of every table
+        :return: None
+        """
+        self.stopped.set()
+        self.changed.set()
+        self.writer.join()
+        self.write()
+
+
+if __name__ == "__main__":
+    # Prints the tables of a snapshot: python Snapshot.py [path]
+    for game in load(sys.argv[1] if len(sys.argv) > 1 else SNAPSHOT_FILE):
+        state = "hand #%d in progress" % game.hand_number if game.on else "waiting"
+        print(f"Table {game.table_id}, {state}: {game.game_info()}")
@@ -0,0 +1,347 @@
+"""
+Hosts many independent tables (Game objects) in a single server process
+"""
+
+import sys
+import logging
+import threading
+from itertools import count
+from Game import Game, MAX_PLAYERS
+from Outbox import Outbox
+from Deck import DeckPool
+from HandHistory import HandHistory
+from Snapshot import Snapshots, DetachedOutbox
+from Chat import CHAT_RATE, CHAT_BURST
+from Variants import HOLDEM
+import Metrics
+
+
+MAX_TABLES = 5000  # Maximum number of tables hosted by one process
+RECONNECT_GRACE = 120  # Seconds restored players have to re-attach before losing their seat
+# Objects referenced by tables but not owned by them
+SHARED = (Outbox, DeckPool, HandHistory, Snapshots, logging.Logger)
+
+
+class TableRegistry:
+    def __init__(self, max_tables=MAX_TABLES, history=None, deck_pool=None, snapshots=None, first_id=0, id_step=1,
+                 schedule=None, chat_limit=(CHAT_RATE, CHAT_BURST), variant=HOLDEM):
+        """
+        :first_id: int, id of the first table
+        :id_step: int, difference between the ids of consecutive tables, so that several registries (e.g. one per
+                  worker process of Lobby.py) never give the same id to two tables
+        :schedule: function (delay, callback) calling back later, which can be called from any thread. Used to
+                   combine bursts of chat messages, and to go on with a hand once the equities computed by the
+                   process pool are known. Callbacks run on the event loop's thread for the asyncio servers, and on a
+                   timer thread for Server.py: they hold the table's lock (Game.lock). None to broadcast every chat
+                   message at once and have tables wait for the equities.
+        :chat_limit: tuple (messages per second, burst) of every player's chat rate limit, None for no limit
+        :variant: variant of Variants.py played at the new tables
+        """
+        self.max_tables = max_tables
+        self.history = history  # HandHistory log shared by all tables, None if hands are not logged
+        self.deck_pool = deck_pool  # DeckPool shared by all tables, None if decks are shuffled when a hand starts
+        self.snapshots = snapshots  # Snapshots of all tables, None if tables are not saved
+        self.schedule = schedule
+        self.chat_limit = chat_limit
+        self.variant = variant
+        self.tables = {}  # Table id -> Game
+        self.open_tables = {}  # Tables having at least one free seat, in creation order (dicts keep insertion order)
+        self.unlisted = set()  # Ids of the tables whose players are seated by a tournament director, never by join
+        self.connections = {}  # Connection (Outbox) -> (Game, Player)
+        self.detached = {}  # Name -> DetachedOutbox of the restored players with that name waiting for their client
+        self.seated = {}  # Table id -> number of seated players
+        self.first_id = first_id
+        self.id_step = id_step
+        self.next_id = count(first_id, id_step)
+        # Connections are handled by several threads. A table's lock may be held when taking it, never the other way
+        # round: tables are only changed once it's released.
+        self.lock = threading.Lock()
+
+    def create_table(self, max_players=MAX_PLAYERS, listed=True):
+        """
+        Creates a new empty table, the lock being held
+        :max_players: int, seats
+        :listed: bool, False for a table whose players are seated by a tournament director (see Tournament.py)
+        :return: Game object, None if the maximum number of tables is reached
+        """
+        if len(self.tables) >= self.max_tables:
+            return None
+        table_id = next(self.next_id)
+        game = self.new_table(table_id, max_players)
+        self.tables[table_id] = game
+        if listed:
+            self.open_tables[table_id] = game
+        else:
+            self.unlisted.add(table_id)
+        self.seated[table_id] = 0
+        return game
+
+    def new_table(self, table_id, max_players=MAX_PLAYERS):
+        """
+        Builds the Game object of a new table, can be overridden by other server modes
+        :table_id: int
+        :max_players: int
+        :return: Game object
+        """
+        game = Game(table_id, max_players, self.variant)
+        self.attach(game)
+        return game
+
+    def attach(self, game):
+        """
+        Gives a table the objects shared by every table of the registry
+        :game: Game object
+        :return: None
+        """
+        game.history = self.history
+        game.deck_pool = self.deck_pool
+        game.snapshots = self.snapshots
+        game.schedule = game.chat.schedule = self.schedule
+
+    def restore(self, games, reclaim=True):
+        """
+        Hosts tables rebuilt from a snapshot, see Snapshot.load. Their players keep their seats while waiting for
+        their clients to connect again with the same name, until expire is called.
+        :games: list of Game objects
+        :reclaim: bool, False if the players' connections are handed over with the tables (see claim), instead of
+                  reconnecting by name
+        :return: None
+        """
+        with self.lock:
+            for game in games:
+                self.attach(game)
+                table_id = game.table_id
+                self.tables[table_id] = game
+                self.seated[table_id] = 0
+                for player in game.players:
+                    if player:
+                        self.seated[table_id] += 1
+                        self.connections[player.sock] = (game, player)
+                        if reclaim:
+                            self.detached.setdefault(player.name, []).append(player.sock)
+                if self.seated[table_id] < game.max_players:
+                    self.open_tables[table_id] = game
+            # New tables get ids above the restored ones
+            first_id = max(self.tables, default=-1) + 1
+            first_id += (self.first_id - first_id) % self.id_step
+            self.next_id = count(first_id, self.id_step)
+        for game in games:
+            with game.lock:
+                if game.on and game.nobody_to_act():
+                    # Saved while waiting for the equities of an all-in hand
+                    game.draw_the_rest()
+
+    def reattach(self, name, conn):
+        """
+        Gives a restored player waiting for its client to a new connection with the same name
+        :name: str
+        :conn: Outbox of the connection
+        :return: tuple (Game, Player), both None if no restored player has this name
+        """
+        with self.lock:
+            waiting = self.detached.get(name)
+            if not waiting:
+                return None, None
+            detached = waiting.pop()
+            if not waiting:
+                del self.detached[name]
+        return self.claim(detached, conn, "Welcome back, your seat has been kept.")
+
+    def claim(self, detached, conn, message=None):
+        """
+        Gives the seat of a restored player to a connection, which gets his hole cards and the full game's state
+        :detached: DetachedOutbox of the player
+        :conn: Outbox of the connection
+        :message: str, sent to the player first, if any
+        :return: tuple (Game, Player)
+        """
+        with self.lock:
+            game, player = self.connections.pop(detached)
+            self.connections[conn] = (game, player)
+        conn.sent_bytes = Metrics.TABLE_BYTES.labels(game.table_id)
+        with game.lock:
+            player.sock = conn
+            if message:
+                player.send_to_client('message', message)
+            if game.on and player.in_hand:
+                game.send_hand(player)
+            game.send_game_state(full=True)
+            game.send_chat_history(player)
+        return game, player
+
+    def release(self, game):
+        """
+        Stops hosting a table without removing its players, e.g. to hand it over to another process
+        :game: Game object
+        :return: list of the players' Outbox
+        """
+        conns = [player.sock for player in game.players if player]
+        with self.lock:
+            for conn in conns:
+                self.connections.pop(conn, None)
+            self.close_table(game.table_id)
+        return conns
+
+    def close_table(self, table_id):
+        """
+        Forgets a table, the lock being held
+        :table_id: int
+        :return: None
+        """
+        self.tables.pop(table_id).snapshots = None  # Nothing is saved anymore, e.g. when a pending hand ends
+        del self.seated[table_id]
+        self.open_tables.pop(table_id, None)
+        self.unlisted.discard(table_id)
+        Metrics.TABLE_BYTES.remove(table_id)
+        if self.snapshots:
+            self.snapshots.remove(table_id)
+
+    def expire(self):
+        """
+        Removes the restored players whose client did not come back, RECONNECT_GRACE seconds after the restore
+        :return: None
+        """
+        with self.lock:
+            detached = [conn for waiting in self.detached.values() for conn in waiting]
+            self.detached.clear()
+        for conn in detached:
+            self.leave(conn)
+
+    def find_table(self):
+        """
+        Finds a table with a free seat, creating one if all tables are full
+        :return: Game object, None if no seat is available
+        """
+        for game in self.open_tables.values():
+            return game
+        return self.create_table()
+
+    def join(self, name, conn):
+        """
+        Seats a new connection at a table with a free seat, or at its restored seat if a player with this name is
+        waiting for its client after a restart. If the name is already taken at that table, a digit is added to it so
+        it's unique.
+        :name: str
+        :conn: Outbox of the connection
+        :return: tuple (Game, Player), both None if the server is full
+        """
+        if name in self.detached:
+            game, player = self.reattach(name, conn)
+            if player:
+                return game, player
+        with self.lock:
+            game = self.find_table()
+            if game is None:
+                return None, None
+            self.seated[game.table_id] += 1
+            if self.seated[game.table_id] == game.max_players:
+                del self.open_tables[game.table_id]
+        conn.sent_bytes = Metrics.TABLE_BYTES.labels(game.table_id)
+        with game.lock:
+            name_changed = False
+            i = 0
+            while not game.check_name_exist(name):
+                name += str(i)
+                i += 1
+                name_changed = True
+            player = game.add_player(name, conn, name_changed)
+        with self.lock:
+            self.connections[conn] = (game, player)
+        return game, player
+
+    def lookup(self, conn):
+        """
+        Table and player of a connection
+        :conn: Outbox
+        :return: tuple (Game, Player), both None if the connection is not seated
+        """
+        return self.connections.get(conn, (None, None))
+
+    def leave(self, conn):
+        """
+        Removes the player of a connection from its table. Empty tables are closed to free their memory, except the
+        tournament's ones, closed by their director. A player leaving a tournament is knocked out.
+        :conn: Outbox
+        :return: None
+        """
+        with self.lock:
+            game, player = self.connections.get(conn, (None, None))
+            if game is None:
+                return
+            if not game.director:
+                del self.connections[conn]
+                table_id = game.table_id
+                self.seated[table_id] -= 1
+                if self.seated[table_id] == 0:
+                    self.close_table(table_id)
+                else:
+                    self.open_tables[table_id] = game
+        if game.director:
+            # The director frees the seat and forgets the connection, taking its lock before the table's
+            game.director.withdraw(game, player)
+            return
+        with game.lock:
+            game.remove_player(player)
+
+    def move(self, player, old, new):
+        """
+        Follows a player seated, moved or knocked out by a tournament director, see Tournament's on_move
+        :player: Player object
+        :old: Game object the player left, None if he just entered the tournament
+        :new: Game object the player now sits at, None if he was knocked out
+        :return: None
+        """
+        conn = player.sock
+        with self.lock:
+            if old is not None:
+                self.seated[old.table_id] -= 1
+            if new is None:
+                self.connections.pop(conn, None)
+            else:
+                self.seated[new.table_id] += 1
+                self.connections[conn] = (new, player)
+        if new is not None:
+            conn.sent_bytes = Metrics.TABLE_BYTES.labels(new.table_id)
+
+    def memory_report(self):
+        """
+        Memory used by the hosted tables
+        :return: dict
+        """
+        sizes = [table_memory(game) for game in self.tables.values()]
+        return {
+            'tables': len(sizes),
+            'connections': len(self.connections),
+            'total_bytes': sum(sizes),
+            'max_table_bytes': max(sizes, default=0),
+            'avg_table_bytes': sum(sizes) // len(sizes) if sizes else 0,
+        }
+
+
+def table_memory(game):
+    """
+    Approximate number of bytes held by a table: the Game object and everything it references, except connections
+    and objects shared between tables (modules, classes, functions, SHARED)
+    :game: Game object
+    :return: int
+    """
+    seen = set()
+    stack = [game]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type) or callable(obj) or isinstance(obj, SHARED):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        else:
+            for cls in type(obj).__mro__:
+                stack.extend(getattr(obj, slot) for slot in getattr(cls, '__slots__', ()) if hasattr(obj, slot))
+    return total
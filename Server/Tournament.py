@@ -0,0 +1,371 @@
+"""
+Multi-table tournament director: blinds raised on a schedule, eliminations, and table breaking and balancing.
+Tables are ordinary Game objects and players are moved between them as Player objects, only out of tables that are
+between hands. Tables call the director when a hand is about to start and when it ends (see Game.director): every
+table settles its own moves between two of its hands, so the director never holds a table up.
+
+Hosted by a TableRegistry, the tournament's tables are unlisted (join never seats anybody there), every move is
+reported to the registry so that the players' connections follow them, hands are dealt a few seconds after the
+previous one ended and the blinds go up on the registry's timer. Every table keeps its own lock (Game.lock): the
+director takes its lock first, then the locks of the tables it changes, and a table never waits for the director's
+lock. A hand ending at a table only schedules the next one, whose deal knocks out, breaks and balances. Tournaments
+are not saved by the snapshots: restored tables play on without a director.
+Usage, with bots: python Tournament.py [entrants]
+"""
+
+import sys
+import random
+import threading
+from functools import partial
+from time import perf_counter
+from Game import Game, MAX_PLAYERS
+from Log import get_logger
+import Metrics
+
+
+# Blinds of each level
+SCHEDULE = ((10, 20), (15, 30), (25, 50), (50, 100), (75, 150), (100, 200), (150, 300), (200, 400), (300, 600),
+            (400, 800), (500, 1000), (750, 1500), (1000, 2000), (1500, 3000), (2000, 4000), (3000, 6000))
+LEVEL_SECONDS = 600  # Duration of a blind level
+STARTING_STACK = 1500
+HAND_DELAY = 3.0  # Seconds between the end of a hand and the next one at a table, to see who won
+
+log = get_logger("tournament")
+
+
+class Tournament:
+    def __init__(self, table_size=MAX_PLAYERS, schedule=SCHEDULE, level_seconds=LEVEL_SECONDS,
+                 starting_stack=STARTING_STACK, registry=None, on_move=None, first_table_id=0):
+        """
+        :table_size: int, seats per table
+        :schedule: tuple of (sb, bb), one per level
+        :level_seconds: float
+        :starting_stack: int
+        :registry: TableRegistry hosting the tables, whose schedule deals the hands and raises the blinds. None to
+                   create the tables here, and have the caller deal the hands and call raise_blinds, e.g. with bots.
+        :on_move: function called with (player, old table, new table) when a player enters the tournament (old
+                  being None), changes table or is knocked out (new being None), the registry's move by default
+        :first_table_id: int, id of the first table without a registry, the next ones being numbered after it
+        """
+        self.table_size = table_size
+        self.schedule = schedule
+        self.level_seconds = level_seconds
+        self.starting_stack = starting_stack
+        self.registry = registry
+        self.timer = registry.schedule if registry else None  # Function (delay, callback), callable from any thread
+        self.on_move = on_move or (registry.move if registry else None)
+        self.next_table_id = first_table_id
+        self.lock = threading.RLock()  # Taken before the lock of any table of the tournament, see Game.lock
+        self.tables = {}  # Table id -> Game
+        self.counts = {}  # Table id -> number of players seated
+        self.by_count = [set() for _ in range(table_size + 1)]  # Number of players -> ids of the tables having it
+        self.dealing = set()  # Ids of the tables whose next hand is scheduled
+        self.remaining = 0  # Players still in the tournament
+        self.results = []  # (finishing position, name), in the order players are knocked out, the winner last
+        self.level = 0  # Index of the current blind level in the schedule
+        self.over = False
+
+    def start(self, players):
+        """
+        Seats the entrants at random, on as few tables as possible, all of them having the same number of players
+        give or take one. With a registry, the first hands are dealt and the blinds' timer started.
+        :players: list of Player objects, e.g. Player(name, conn) for each connection entering the tournament
+        :return: None
+        """
+        players = list(players)
+        random.shuffle(players)
+        num_tables = -(-len(players) // self.table_size)
+        with self.lock:
+            games = [self.open_table() for _ in range(num_tables)]
+            for i, player in enumerate(players):
+                player.stack = self.starting_stack
+                player.in_hand = False
+                self.seat(player, games[i % num_tables])
+                if self.on_move:
+                    self.on_move(player, None, games[i % num_tables])
+            self.remaining = len(players)
+            sb, bb = self.schedule[0]
+            log.info("Tournament started: %d players on %d tables, blinds %d/%d", len(players), num_tables, sb, bb)
+            if self.timer:
+                self.timer(self.level_seconds, self.raise_blinds)
+                for game in games:
+                    self.deal_later(game, 0)
+
+    def open_table(self):
+        if self.registry:
+            with self.registry.lock:
+                game = self.registry.create_table(self.table_size, listed=False)
+            if game is None:
+                raise RuntimeError("The server cannot host more tables")
+        else:
+            game = Game(self.next_table_id, self.table_size)
+            self.next_table_id += 1
+        game.show_equities = False  # Not worth the time at thousands of tables
+        game.director = self
+        self.tables[game.table_id] = game
+        self.counts[game.table_id] = 0
+        self.by_count[0].add(game.table_id)
+        return game
+
+    def close_table(self, game):
+        self.by_count[self.counts.pop(game.table_id)].discard(game.table_id)
+        del self.tables[game.table_id]
+        if self.registry:
+            with self.registry.lock:
+                self.registry.close_table(game.table_id)
+
+    def set_count(self, game, change):
+        table_id = game.table_id
+        count = self.counts[table_id]
+        self.by_count[count].discard(table_id)
+        self.counts[table_id] = count + change
+        self.by_count[count + change].add(table_id)
+
+    def smallest_table(self, excluded=None):
+        """
+        :excluded: Game object not to be picked
+        :return: Game object having the fewest players, None if there is no other table
+        """
+        for tables in self.by_count:
+            for table_id in tables:
+                if excluded is None or table_id != excluded.table_id:
+                    return self.tables[table_id]
+        return None
+
+    def raise_blinds(self):
+        """
+        Goes to the next blind level, every table raising its blinds before its next hand. Called back by the
+        registry's timer every level_seconds, or by whoever keeps the time without a registry.
+        :return: None
+        """
+        with self.lock:
+            if self.over or self.level == len(self.schedule) - 1:
+                return
+            self.level += 1
+            log.info("Blind level %d: %d/%d", self.level + 1, *self.schedule[self.level])
+            if self.timer:
+                self.timer(self.level_seconds, self.raise_blinds)
+
+    def deal_later(self, game, delay=HAND_DELAY):
+        """
+        Schedules the next hand of a table, with a registry. The table's lock is held.
+        :game: Game object
+        :delay: float, seconds
+        :return: None
+        """
+        if self.timer and game.table_id not in self.dealing:
+            self.dealing.add(game.table_id)
+            self.timer(delay, partial(self.deal, game))
+
+    def deal(self, game):
+        """
+        Settles a table's moves and deals its next hand, called back by the timer
+        :game: Game object
+        :return: None
+        """
+        with self.lock, game.lock:
+            self.dealing.discard(game.table_id)
+            if game.on or game.table_id not in self.tables:
+                return
+            self.between_hands(game)
+            if game.table_id in self.tables and not self.over:
+                game.new_game()  # Unless before_hand says otherwise
+
+    def before_hand(self, game):
+        """
+        Called by a table about to deal (see Game.new_game): raises the blinds if their level is over, and settles the
+        table's moves if it cannot deal
+        :game: Game object
+        :return: bool, True if the table can deal a hand
+        """
+        if game.table_id not in self.tables or self.remaining < 2:
+            return False
+        sb, bb = self.schedule[self.level]
+        if (game.sb, game.bb) != (sb, bb):
+            game.set_blinds(sb, bb)
+            game.send_all('message', f"Blinds are now {sb}/{bb}.")
+        if self.counts[game.table_id] < 2:
+            self.settle(game)
+            return False
+        return True
+
+    def after_hand(self, game):
+        """
+        Called by a table when a hand is over (see Game.end_game), its lock being held. With a registry, the next hand
+        is scheduled, the table's moves being settled when it is dealt: the director's lock is never waited for here.
+        Otherwise the moves are settled at once.
+        :game: Game object
+        :return: None
+        """
+        if game.table_id not in self.tables:
+            return
+        if self.timer:
+            self.deal_later(game)
+        else:
+            with self.lock:
+                self.between_hands(game)
+
+    def between_hands(self, game):
+        """
+        Knocks out the players of a table without chips, then declares the winner once a single player is left, or
+        breaks or balances the table. The director's lock and the table's are held.
+        :game: Game object, not in the middle of a hand
+        :return: None
+        """
+        start = perf_counter()
+        busted = [player for player in game.players if player and not player.stack]
+        # Players knocked out in the same hand are ranked by the chips they had, i.e. put in
+        busted.sort(key=lambda player: game.contributions.get(player, 0))
+        for player in busted:
+            player.send_to_client('message', f"You finished the tournament in position {self.remaining}.")
+            game.player_stand(player)
+            self.knock_out(game, player)
+            if self.on_move:
+                self.on_move(player, game, None)
+        if self.over:
+            return
+        if self.remaining == 1:
+            self.over = True
+            winner = next((player for table in self.tables.values() for player in table.players if player), None)
+            if winner:
+                self.results.append((1, winner.name))
+                winner.send_to_client('message', "You won the tournament!")
+                log.info("%s won the tournament", winner.name)
+            return
+        self.settle(game)
+        Metrics.TOURNAMENT_SETTLE_TIME.observe(perf_counter() - start)
+
+    def withdraw(self, game, player):
+        """
+        Knocks out a player leaving a table of the tournament, e.g. whose client disconnected, his chips going out of
+        play: a hand he is in is folded and goes on without him. Called by the registry, no table's lock being held.
+        :game: Game object, the player's table when he left, which a move may have changed since
+        :player: Player object
+        :return: None
+        """
+        with self.lock:
+            if player not in game.players:
+                game = next((table for table in self.tables.values() if player in table.players), None)
+                if game is None:  # Knocked out meanwhile
+                    return
+            with game.lock:
+                if not self.over:
+                    # Before the player's hand is folded, which may end it
+                    self.knock_out(game, player)
+                if self.on_move:
+                    self.on_move(player, game, None)
+                game.remove_player(player)
+                if not game.on and not self.over:
+                    self.deal_later(game)
+
+    def knock_out(self, game, player):
+        """
+        Ranks a player out of the tournament, whose seat is already free
+        :game: Game object, the player's table
+        :player: Player object
+        :return: None
+        """
+        self.results.append((self.remaining, player.name))
+        log.info("%s knocked out in position %d", player.name, self.remaining, extra={'table': game.table_id})
+        self.remaining -= 1
+        self.set_count(game, -1)
+
+    def settle(self, game):
+        """
+        Moves players out of a table between hands: all of them if the remaining players fit on one table less,
+        otherwise as many as needed for it not to have 2 players more than the smallest table. Tables in the middle
+        of a hand only receive players, who wait for the next hand there. The director's lock and the table's are held.
+        :game: Game object, not in the middle of a hand
+        :return: None
+        """
+        if len(self.tables) > 1 and self.remaining <= (len(self.tables) - 1) * self.table_size:
+            # Other tables always have enough free seats, since the remaining players fit on one table less
+            for player in [player for player in game.players if player]:
+                self.move(player, game, self.smallest_table(game))
+            self.close_table(game)
+            log.info("Table broken, %d tables left", len(self.tables), extra={'table': game.table_id})
+            return
+        while True:
+            smallest = self.smallest_table(game)
+            if smallest is None or self.counts[game.table_id] - self.counts[smallest.table_id] <= 1:
+                return
+            player = next(player for player in reversed(game.players) if player)
+            self.move(player, game, smallest)
+
+    def seat(self, player, game):
+        """
+        Sits a player at a random free seat of a table
+        :player: Player object
+        :game: Game object
+        :return: None
+        """
+        free = [i for i, seated in enumerate(game.players) if not seated]
+        game.player_sit(player, random.choice(free))
+        self.set_count(game, 1)
+
+    def move(self, player, old, new):
+        """
+        Moves a player to another table, where he waits for the next hand. The director's lock and the old table's
+        are held, the new table's is taken.
+        :player: Player object
+        :old: Game object, not in the middle of a hand
+        :new: Game object
+        :return: None
+        """
+        with new.lock:
+            old.player_stand(player)
+            self.set_count(old, -1)
+            player.in_hand = False
+            player.all_in = False
+            player.betting = 0
+            player.hand = b""
+            self.seat(player, new)
+            if self.on_move:
+                self.on_move(player, old, new)
+            player.send_to_client('message', f"You have been moved to table {new.table_id}.")
+            new.send_game_state(full=True)
+            new.send_chat_history(player)
+            if not new.on:  # The table may have been waiting for players
+                self.deal_later(new)
+
+
+def run_with_bots(entrants, seed=None, seconds_per_hand=30):
+    """
+    Plays a whole tournament between bots, table after table, to check and time the director
+    :entrants: int
+    :seed: int
+    :seconds_per_hand: float, time taken by a hand for the blind levels' timer
+    :return: dict of statistics
+    """
+    from Player import Player
+    from Simulation import NullOutbox, play_hand, random_bot
+
+    rng = random.Random(seed)
+    tournament = Tournament()
+    tournament.start(Player(f"bot{i}", NullOutbox()) for i in range(entrants))
+    policies = dict.fromkeys(range(tournament.table_size), random_bot)
+    hands = 0
+    elapsed = 0.0  # Seconds since the blinds last went up
+    while tournament.remaining > 1:
+        for game in list(tournament.tables.values()):
+            if game.table_id in tournament.tables:  # Not broken by another table meanwhile
+                hand_number = game.hand_number
+                play_hand(game, policies, rng)  # The director is called back when the hand starts and ends
+                hands += game.hand_number != hand_number
+        elapsed += seconds_per_hand
+        if elapsed >= tournament.level_seconds:
+            elapsed -= tournament.level_seconds
+            tournament.raise_blinds()
+    chips = sum(player.stack for game in tournament.tables.values() for player in game.players if player)
+    return {'hands': hands, 'level': tournament.level, 'chips': chips,
+            'expected_chips': entrants * tournament.starting_stack, 'podium': tournament.results[:-4:-1]}
+
+
+if __name__ == "__main__":
+    entrants = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    start = perf_counter()
+    stats = run_with_bots(entrants)
+    settle = Metrics.TOURNAMENT_SETTLE_TIME
+    count, total = settle.samples()[-1][2], settle.samples()[-2][2]
+    print(stats)
+    print(f"{perf_counter() - start:.1f}s, {count} hands settled, {total / count * 1e6:.1f}us per hand on average")
@@ -0,0 +1,61 @@
+"""
+Poker variants a table can be played with: number of hole cards dealt, how hands are ranked at showdown and how much
+a player may bet. A table plays a single variant, given to its Game object.
+"""
+
+from Evaluator import evaluate, evaluate_omaha
+
+
+class Holdem:
+    """
+    No-Limit Texas Hold'em: 2 hole cards, the best 5 of the 7 cards, any bet up to the player's whole stack
+    """
+    name = "holdem"
+    code = 0  # Id of the variant in the binary formats (Snapshot.py, HandHistory.py)
+    title = "No-Limit Texas Hold'em"
+    hole_cards = 2
+    equities = True  # Equity.py can compute the players' equities when they are all in
+
+    def strength(self, hand, community):
+        """
+        Strength of a player's best hand
+        :hand: bytes, hole cards
+        :community: bytearray, 5 community cards
+        :return: int, as returned by Evaluator.evaluate
+        """
+        return evaluate(community + hand)
+
+    def max_bet(self, game, player):
+        """
+        Most chips a player may have in front of him once he bet, i.e. the biggest total bet allowed
+        :game: Game object
+        :player: Player object, the acting player
+        :return: int
+        """
+        return player.betting + player.stack
+
+
+class PotLimitOmaha(Holdem):
+    """
+    Pot-Limit Omaha: 4 hole cards, a hand is made of exactly 2 of them and 3 community cards, and a raise is at most
+    the size of the pot once the player called
+    """
+    name = "plo"
+    code = 1
+    title = "Pot-Limit Omaha"
+    hole_cards = 4
+    equities = False  # Equity.py only knows Hold'em hands
+
+    def strength(self, hand, community):
+        return evaluate_omaha(hand, community)
+
+    def max_bet(self, game, player):
+        to_call = game.highest_bet - player.betting
+        pot = sum(game.contributions.values()) + to_call  # Pots, bets of this round and the call
+        return min(game.highest_bet + pot, player.betting + player.stack)
+
+
+HOLDEM = Holdem()
+PLO = PotLimitOmaha()
+VARIANTS = {variant.name: variant for variant in (HOLDEM, PLO)}
+VARIANT_CODES = {variant.code: variant for variant in (HOLDEM, PLO)}
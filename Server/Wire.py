@@ -0,0 +1,214 @@
+"""
+Binary wire protocol, negotiated by sending "07 binary$" with the legacy text protocol. From then on, every message
+in both directions is a frame whose fields are read with struct, without scanning any string:
+
+- Client to server: opcode (1 byte), payload length (2 bytes), payload
+- Server to client: sequence number (4 bytes), opcode (1 byte), payload length (2 bytes), payload
+
+All integers are big-endian. Opcodes are the codes of the text protocol (-1 being 255). Seats and card ids take 1
+byte, chip amounts and versions 4 bytes, texts are UTF-8 and take the rest of the payload. A payload holds at most
+MAX_PAYLOAD bytes: longer texts, e.g. a long chat history, are cut.
+"""
+
+import struct
+
+
+HEADER = struct.Struct('!BH')  # Opcode, payload length
+SEQ = struct.Struct('!I')  # Sequence number of frames sent to clients
+MAX_PAYLOAD = 0xFFFF
+
+# Opcodes of the messages sent to clients, same codes as Player.SEND_PROTOCOL
+SEND_OPCODES = {
+    'disconnect': 0xFF,
+    'hand': 0x00,
+    'game': 0x01,
+    'message': 0x02,
+    'name': 0x03,
+    'showdown': 0x04,
+    'announcement': 0x05,
+    'delta': 0x06,
+}
+SEND_NAMES = {opcode: name for name, opcode in SEND_OPCODES.items()}
+
+# Protocol codes of the messages received from clients, same codes as Session.RECV_PROTOCOL
+RECV_CODES = {0xFF: "-1", 0x00: "00", 0x01: "01", 0x02: "02", 0x03: "03", 0x04: "04", 0x05: "05", 0x06: "06",
+              0x07: "07", 0x08: "08"}
+RECV_OPCODES = {code: opcode for opcode, code in RECV_CODES.items()}
+
+# Payloads of the messages received from clients, None meaning a UTF-8 text
+RECV_PAYLOADS = {
+    "-1": struct.Struct('!'),
+    "00": None,  # Name
+    "01": struct.Struct('!'),
+    "02": struct.Struct('!II'),  # Small blind, big blind
+    "03": struct.Struct('!BI'),  # Action, amount
+    "04": None,  # Chat message
+    "05": struct.Struct('!Bi'),  # Seat, stack change
+    "06": struct.Struct('!'),
+    "07": None,  # Options separated by spaces
+    "08": struct.Struct('!I'),  # Version
+}
+
+STATE = struct.Struct('!?IIIIIBB?B')  # On, version, sb, bb, highest bet, 2nd highest bet, dealer, acting, no raising,
+                                      # number of seated players
+SEAT = struct.Struct('!B?IIB')  # Seat, in hand, stack, betting, length of the name (followed by the name)
+CHIPS = struct.Struct('!I')
+
+
+class ProtocolError(ValueError):
+    """
+    A frame sent by a client that cannot be decoded: unknown opcode or payload of the wrong size
+    """
+
+
+def encode_frame(protocol, payload):
+    """
+    Frame sent to a client, without its sequence number which is added when it is written
+    :protocol: str, key of Player.SEND_PROTOCOL
+    :payload: bytes, cut to MAX_PAYLOAD bytes if it's longer
+    :return: bytes
+    """
+    if len(payload) > MAX_PAYLOAD:
+        end = MAX_PAYLOAD
+        while payload[end] & 0xC0 == 0x80:  # Texts are never cut in the middle of a UTF-8 character
+            end -= 1
+        payload = payload[:end]
+    return HEADER.pack(SEND_OPCODES[protocol], len(payload)) + payload
+
+
+def encode_request(protocol, *args):
+    """
+    Frame sent by a client
+    :protocol: str, code of Session.RECV_PROTOCOL, e.g. "03"
+    :args: fields of the payload, e.g. action and amount
+    :return: bytes
+    """
+    layout = RECV_PAYLOADS[protocol]
+    payload = args[0].encode() if layout is None else layout.pack(*args)
+    return HEADER.pack(RECV_OPCODES[protocol], len(payload)) + payload
+
+
+def decode_request(opcode, payload):
+    """
+    Decode the payload of a frame sent by a client
+    :opcode: int
+    :payload: bytes or memoryview
+    :return: tuple (protocol code, tuple of fields)
+    :raise: ProtocolError if the frame cannot be decoded
+    """
+    protocol = RECV_CODES.get(opcode)
+    if protocol is None:
+        raise ProtocolError(f"Unknown opcode {opcode}")
+    layout = RECV_PAYLOADS[protocol]
+    try:
+        if layout is None:
+            return protocol, (bytes(payload).decode(),)
+        if len(payload) != layout.size:
+            raise ProtocolError(f"Payload of {len(payload)} bytes for opcode {opcode}, {layout.size} expected")
+        return protocol, layout.unpack(payload)
+    except UnicodeDecodeError as error:
+        raise ProtocolError(f"Text of opcode {opcode} is not UTF-8") from error
+
+
+def split_frames(buffer, with_seq=False):
+    """
+    Complete frames at the beginning of a buffer
+    :buffer: bytearray
+    :with_seq: bool, frames sent by the server start with a sequence number
+    :return: tuple (list of (opcode, payload), number of bytes consumed)
+    """
+    frames = []
+    view = memoryview(buffer)
+    offset = 0
+    prefix = SEQ.size if with_seq else 0
+    while len(buffer) - offset >= prefix + HEADER.size:
+        opcode, length = HEADER.unpack_from(view, offset + prefix)
+        start = offset + prefix + HEADER.size
+        if len(buffer) - start < length:
+            break
+        frames.append((opcode, bytes(view[start:start + length])))
+        offset = start + length
+    view.release()
+    return frames, offset
+
+
+def encode_cards(cards):
+    """
+    :cards: list of ints
+    :return: bytes
+    """
+    return bytes(cards)
+
+
+def encode_showdown(hands):
+    """
+    :hands: list of (seat, list of card ids)
+    :return: bytes, for each hand: seat, number of cards, cards
+    """
+    payload = bytearray()
+    for seat, cards in hands:
+        payload.append(seat)
+        payload.append(len(cards))
+        payload += bytes(cards)
+    return bytes(payload)
+
+
+def encode_state(game, no_raising=False):
+    """
+    Binary game's state, holding the same information as Game.game_info
+    :game: Game object
+    :no_raising: bool
+    :return: bytes
+    """
+    seats = [(i, player) for i, player in enumerate(game.players) if player]
+    payload = bytearray(STATE.pack(game.on, game.version, game.sb, game.bb, game.highest_bet,
+                                   game.second_highest_bet, game.dealer, game.acting, no_raising, len(seats)))
+    for i, player in seats:
+        name = player.name.encode()
+        payload += SEAT.pack(i, player.in_hand, player.stack, player.betting, len(name))
+        payload += name
+    payload.append(len(game.pots))
+    for pot in game.pots:
+        payload += CHIPS.pack(pot)
+    payload.append(len(game.community))
+    payload += bytes(game.community)
+    return bytes(payload)
+
+
+def decode_state(payload):
+    """
+    Decode a binary game's state, as a client would
+    :payload: bytes
+    :return: dict
+    """
+    on, version, sb, bb, highest, second, dealer, acting, no_raising, num_seats = STATE.unpack_from(payload)
+    offset = STATE.size
+    seats = {}
+    for _ in range(num_seats):
+        seat, in_hand, stack, betting, length = SEAT.unpack_from(payload, offset)
+        offset += SEAT.size
+        name = bytes(payload[offset:offset + length]).decode()
+        offset += length
+        seats[seat] = {'name': name, 'stack': stack, 'betting': betting, 'in_hand': in_hand}
+    num_pots = payload[offset]
+    pots = list(struct.unpack_from(f'!{num_pots}I', payload, offset + 1))
+    offset += 1 + CHIPS.size * num_pots
+    community = list(payload[offset + 1:offset + 1 + payload[offset]])
+    return {'on': on, 'version': version, 'sb': sb, 'bb': bb, 'highest_bet': highest, 'second_highest_bet': second,
+            'dealer': dealer, 'acting': acting, 'no_raising': no_raising, 'seats': seats, 'pots': pots,
+            'community': community}
+
+
+def decode_showdown(payload):
+    """
+    Decode a binary showdown, as a client would
+    :payload: bytes
+    :return: dict, seat -> list of card ids
+    """
+    hands = {}
+    offset = 0
+    while offset < len(payload):
+        seat, count = payload[offset], payload[offset + 1]
+        hands[seat] = list(payload[offset + 2:offset + 2 + count])
+        offset += 2 + count
+    return hands
@@ -0,0 +1,111 @@
+"""
+Chat: players' rate limits, and messages following a broadcast too closely held and then broadcast together
+"""
+
+import unittest
+from unittest import mock
+from Chat import TokenBucket, CHAT_WINDOW
+from Simulation import new_table
+
+
+class Clock:
+    """
+    Stands for time.monotonic, only moving forward when told to
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('Chat.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst(self):
+        bucket = TokenBucket(rate=1.0, burst=3)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_refill_at_rate(self):
+        bucket = TokenBucket(rate=2.0, burst=3)
+        for _ in range(3):
+            bucket.take()
+        self.clock.now += 0.25
+        self.assertFalse(bucket.take())  # Half a token
+        self.clock.now += 0.25
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+    def test_refill_up_to_burst(self):
+        bucket = TokenBucket(rate=1.0, burst=3)
+        bucket.take()
+        self.clock.now += 60
+        self.assertEqual(bucket.refill(), 3)
+
+
+class CoalesceTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('Chat.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.game = new_table(3)
+        self.listener = next(player for player in self.game.players if player)
+        self.listener.sock.keep = True
+        self.scheduled = []  # (delay, callback)
+
+    def schedule(self, delay, callback):
+        self.scheduled.append((delay, callback))
+
+    def chats(self):
+        """
+        :return: list of bytes, chat messages broadcast to a player
+        """
+        return [data for data in self.listener.sock.sent if b"Bob:" in data]
+
+    def test_without_schedule(self):
+        for text in ("hi", "gl", "hf"):
+            self.game.send_chat(f"Bob: {text}")
+        self.assertEqual(len(self.chats()), 3)
+        self.assertEqual(self.game.chat.pending, [])
+
+    def test_burst_broadcast_together(self):
+        self.game.chat.schedule = self.schedule
+        self.game.send_chat("Bob: hi")  # Nothing was broadcast lately: sent at once
+        self.assertEqual(len(self.chats()), 1)
+        self.clock.now += 0.1
+        self.game.send_chat("Bob: gl")
+        self.game.send_chat("Bob: hf")
+        self.assertEqual(len(self.chats()), 1)
+        # A single flush is scheduled, at the end of the window following the broadcast
+        (delay, callback), = self.scheduled
+        self.assertAlmostEqual(delay, CHAT_WINDOW - 0.1)
+        callback()
+        chats = self.chats()
+        self.assertEqual(len(chats), 2)
+        self.assertIn(b"Bob: gl\nBob: hf", chats[1])
+        self.assertEqual(self.game.chat.pending, [])
+
+    def test_after_window(self):
+        self.game.chat.schedule = self.schedule
+        self.game.send_chat("Bob: hi")
+        self.clock.now += CHAT_WINDOW
+        self.game.send_chat("Bob: gl")
+        self.assertEqual(len(self.chats()), 2)
+        self.assertEqual(self.scheduled, [])
+
+    def test_history_replayed(self):
+        self.game.chat.schedule = self.schedule
+        for text in ("hi", "gl", "hf"):
+            self.game.send_chat(f"Bob: {text}")
+        # Messages still held are part of the history
+        self.game.send_chat_history(self.listener)
+        self.assertIn(b"Recent chat:\nBob: hi\nBob: gl\nBob: hf", self.listener.sock.sent[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Shuffled decks: every card is as likely to end up at any position, and cards are dealt from the top
+"""
+
+import unittest
+from unittest import mock
+import Deck
+from Deck import Deck as Cards, DeckPool, DECK_SIZE, shuffled_cards
+
+SHUFFLES = 20000
+# Chi-square of the card x position counts, 51 * 51 degrees of freedom: mean 2601, standard deviation 72. A fair
+# shuffle goes over the bound about once in a billion runs, the naive one swapping with any card of the deck scores
+# around 15000.
+CHI_SQUARE_BOUND = 2601 + 6 * 72
+
+
+class ShuffleTest(unittest.TestCase):
+    def test_permutation(self):
+        for _ in range(100):
+            self.assertEqual(sorted(shuffled_cards()), list(range(DECK_SIZE)))
+
+    def test_uniform_positions(self):
+        counts = [[0] * DECK_SIZE for _ in range(DECK_SIZE)]  # Card -> position -> times seen
+        for _ in range(SHUFFLES):
+            for position, card in enumerate(shuffled_cards()):
+                counts[card][position] += 1
+        expected = SHUFFLES / DECK_SIZE
+        chi_square = sum((count - expected) ** 2 / expected for row in counts for count in row)
+        self.assertLess(chi_square, CHI_SQUARE_BOUND)
+
+    def test_biased_bytes_rejected(self):
+        # 255 is above the last multiple of every bound but powers of 2, keeping it would favour the first positions
+        entropy = [bytes([255] * 2 * DECK_SIZE), bytes(range(DECK_SIZE))]
+        with mock.patch.object(Deck.os, 'urandom', side_effect=lambda n: entropy.pop(0)[:n]) as urandom:
+            cards = shuffled_cards()
+        self.assertEqual(sorted(cards), list(range(DECK_SIZE)))
+        # The first read is used up rejecting 255 for the last position, the whole shuffle drew from the second one
+        self.assertEqual(urandom.call_count, 2)
+        self.assertFalse(entropy)
+
+
+class DealTest(unittest.TestCase):
+    def test_deal_from_the_top(self):
+        cards = shuffled_cards()
+        deck = Cards(bytearray(cards))
+        dealt = deck.deal_cards(2) + deck.deal_cards(3)
+        self.assertEqual(list(dealt), [cards.pop() for _ in range(5)])
+        self.assertEqual(deck.cards, cards)
+
+    def test_pool(self):
+        pool = DeckPool(size=4)
+        decks = [pool.get() for _ in range(10)]  # More than the pool holds: the rest are shuffled on the spot
+        for deck in decks:
+            self.assertEqual(sorted(deck.cards), list(range(DECK_SIZE)))
+        self.assertEqual(len({bytes(deck.cards) for deck in decks}), len(decks))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Equities: exact ones are the same whatever the suits of a spot, and shared between suit-isomorphic spots by the cache
+of the process asking for them; sampled ones agree with them, and sampling stops once they are precise enough
+"""
+
+import random
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import Equity
+from Equity import enumerate_runouts, summarize, exact_equity, submit_equity, monte_carlo, check_cards, \
+    sample_runouts, confidence_half_width, BATCH_SIZE, IN_FLIGHT
+
+
+def deal(rng, players, board_size):
+    """
+    :return: tuple (hands, board), random cards of a spot
+    """
+    cards = rng.sample(range(52), 2 * players + board_size)
+    return [cards[2 * i:2 * i + 2] for i in range(players)], cards[2 * players:]
+
+
+def relabel(cards, suits):
+    """
+    :cards: list of card ids
+    :suits: tuple, new suit of each suit
+    :return: list of card ids, the same values in other suits
+    """
+    return [suits[card // 13] * 13 + card % 13 for card in cards]
+
+
+def enumerated(hands, board):
+    """
+    :return: list of dicts, exact equities of the spot as dealt, without canonicalization or cache
+    """
+    runouts, wins, ties, equity = enumerate_runouts(hands, board, check_cards(hands, board, ()))
+    return summarize(wins, ties, equity, runouts, exact=True)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """
+    Stands for the process pool, counting the jobs submitted to it
+    """
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.jobs = 0
+
+    def submit(self, *args, **kwargs):
+        self.jobs += 1
+        return super().submit(*args, **kwargs)
+
+
+class ExactTest(unittest.TestCase):
+    def setUp(self):
+        Equity._exact_cache.clear()
+
+    def test_canonical_spot_unchanged(self):
+        rng = random.Random(4)
+        for i in range(20):
+            hands, board = deal(rng, 2 + i % 2, 3 + i % 2)
+            for result, expected in zip(exact_equity(hands, board), enumerated(hands, board)):
+                self.assertAlmostEqual(result['equity'], expected['equity'], places=12)
+                self.assertAlmostEqual(result['win'], expected['win'], places=12)
+                self.assertAlmostEqual(result['tie'], expected['tie'], places=12)
+                self.assertTrue(result['exact'])
+
+    def test_isomorphic_spots_cached_once(self):
+        hands, board = deal(random.Random(5), 3, 3)
+        expected = exact_equity(hands, board)
+        for suits in ((1, 0, 3, 2), (3, 2, 1, 0), (2, 0, 1, 3)):
+            results = exact_equity([relabel(hand, suits) for hand in hands], relabel(board, suits))
+            self.assertEqual(results, expected)
+        self.assertEqual(len(Equity._exact_cache), 1)
+
+    def test_cache_evicts_least_recently_used(self):
+        rng = random.Random(6)
+        spots = [deal(rng, 2, 4) for _ in range(3)]
+        with mock.patch.object(Equity, 'CACHE_SIZE', 2):
+            exact_equity(*spots[0])
+            exact_equity(*spots[1])
+            exact_equity(*spots[0])  # Now the most recently used
+            exact_equity(*spots[2])
+        cached = [Equity.canonical_spot(hands, board, ()) for hands, board in spots]
+        self.assertEqual(list(Equity._exact_cache), [cached[0], cached[2]])
+
+    def test_submitted_spots_cached_by_the_caller(self):
+        # A board of 2 cards leaves more runouts than submit_equity enumerates inline
+        hands, board = deal(random.Random(7), 2, 2)
+        executor = CountingExecutor()
+        with executor, mock.patch.object(Equity, '_executor', executor):
+            results = submit_equity(hands, board).result()
+            self.assertEqual(executor.jobs, 1)
+            suits = (2, 3, 0, 1)
+            future = submit_equity([relabel(hand, suits) for hand in hands], relabel(board, suits))
+            self.assertTrue(future.done())
+            self.assertEqual(executor.jobs, 1)
+        self.assertEqual(future.result(), results)
+        for result, expected in zip(results, enumerated(hands, board)):
+            self.assertAlmostEqual(result['equity'], expected['equity'], places=12)
+
+    def test_matches_monte_carlo(self):
+        rng = random.Random(8)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for players in (2, 3):
+                hands, board = deal(rng, players, 3)
+                exact = exact_equity(hands, board)
+                sampled = monte_carlo(hands, board, samples=20000, executor=executor)
+                for result, estimate in zip(exact, sampled):
+                    # 0.02 is more than 5 standard deviations of 20000 samples
+                    self.assertAlmostEqual(result['equity'], estimate['equity'], delta=0.02)
+                    self.assertFalse(estimate['exact'])
+
+
+class MonteCarloTest(unittest.TestCase):
+    def test_sampled_runouts_counted(self):
+        hands, board = deal(random.Random(9), 3, 3)
+        remaining = check_cards(hands, board, ())
+        samples, wins, ties, equity, equity_sq = sample_runouts(hands, board, remaining, 1000, 42)
+        self.assertEqual(samples, 1000)
+        self.assertAlmostEqual(sum(equity), 1000)  # Every runout is won or shared
+        for i in range(3):
+            self.assertLessEqual(wins[i] + ties[i], 1000)
+            self.assertLessEqual(equity_sq[i], equity[i])
+        # The same seed deals the same runouts
+        self.assertEqual(sample_runouts(hands, board, remaining, 1000, 42), (samples, wins, ties, equity, equity_sq))
+
+    def test_confidence_half_width(self):
+        # Half of 100 runouts won: a variance of 0.25, the widest among the players is kept
+        self.assertAlmostEqual(confidence_half_width([50, 100], [50, 100], 100), 1.96 * 0.05)
+        self.assertEqual(confidence_half_width([100], [100], 100), 0.0)
+
+    def test_river_not_sampled(self):
+        hands, board = deal(random.Random(10), 2, 5)
+        executor = CountingExecutor()
+        with executor:
+            results = monte_carlo(hands, board, executor=executor)
+        self.assertEqual(executor.jobs, 0)
+        self.assertEqual(results, enumerated(hands, board))
+
+    def test_stops_at_target_precision(self):
+        hands, board = deal(random.Random(11), 2, 3)
+        with mock.patch.object(Equity, '_pool_size', 1):
+            executor = CountingExecutor()
+            with executor:
+                results = monte_carlo(hands, board, samples=20 * BATCH_SIZE, target_ci=0.05, executor=executor)
+            # The first batch is precise enough: nothing is submitted after the batches in flight
+            self.assertEqual(executor.jobs, IN_FLIGHT)
+            self.assertAlmostEqual(sum(result['equity'] for result in results), 1)
+            executor = CountingExecutor()
+            with executor:
+                monte_carlo(hands, board, samples=20 * BATCH_SIZE, executor=executor)
+            self.assertEqual(executor.jobs, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
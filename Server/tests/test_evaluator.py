@@ -0,0 +1,121 @@
+"""
+Evaluator.py checked against Rules.py, the slow but straightforward rules kept as the reference
+"""
+
+import random
+import unittest
+from itertools import combinations
+import Rules
+from Evaluator import evaluate, evaluate_omaha, ranking_to_strength, strength_to_ranking
+
+
+def card(value, suit):
+    """
+    :value: int, 2 to 14 (ace)
+    :suit: int, 0 to 3
+    :return: int, card id as dealt by the Deck
+    """
+    return suit * 13 + value - 2
+
+
+def reference(cards):
+    """
+    Strength of the best 5-card hand according to Rules.py
+    :cards: list of 5 to 7 card ids
+    :return: int
+    """
+    return ranking_to_strength(Rules.hand_ranking(Rules.best_hand(combinations(cards, 5))))
+
+
+def reference_omaha(hand, board):
+    """
+    Strength of the best hand made of exactly 2 hole cards and 3 community cards according to Rules.py
+    :return: int
+    """
+    return max(ranking_to_strength(Rules.hand_ranking(list(two) + list(three)))
+               for two in combinations(hand, 2) for three in combinations(board, 3))
+
+
+class EvaluateTest(unittest.TestCase):
+    def test_random_hands(self):
+        rng = random.Random(1)
+        for size in (5, 6, 7):
+            for _ in range(3000):
+                cards = rng.sample(range(52), size)
+                self.assertEqual(evaluate(cards), reference(cards), cards)
+
+    def test_every_category(self):
+        rng = random.Random(2)
+        categories = set()
+        while len(categories) < 9:
+            cards = rng.sample(range(52), 7)
+            if rng.random() < 0.5:  # Suited hands, for enough flushes
+                suit = rng.randrange(4)
+                cards = rng.sample(range(suit * 13, suit * 13 + 13), 5) + cards[:2]
+                if len(set(cards)) < 7:
+                    continue
+            strength = evaluate(cards)
+            self.assertEqual(strength, reference(cards), cards)
+            categories.add(strength_to_ranking(strength)[0])
+
+    def test_wheel(self):
+        wheel = [card(14, 0), card(2, 1), card(3, 2), card(4, 3), card(5, 0)]
+        self.assertEqual(strength_to_ranking(evaluate(wheel)), [4, 5])
+        # A six makes a higher straight than the wheel
+        self.assertEqual(strength_to_ranking(evaluate(wheel + [card(6, 1), card(13, 2)])), [4, 6])
+        steel_wheel = [card(value, 2) for value in (14, 2, 3, 4, 5)]
+        self.assertEqual(strength_to_ranking(evaluate(steel_wheel + [card(13, 2), card(9, 0)])), [8, 5])
+        self.assertEqual(evaluate(steel_wheel), reference(steel_wheel))
+
+    def test_flush_and_straight_flush(self):
+        # A flush and a straight, but not a straight flush
+        cards = [card(9, 1), card(10, 1), card(11, 1), card(12, 1), card(2, 1), card(13, 0), card(8, 3)]
+        self.assertEqual(strength_to_ranking(evaluate(cards)), [5, 12, 11, 10, 9, 2])
+        # The straight flush beats the higher flush of the same suit
+        cards = [card(8, 3), card(9, 3), card(10, 3), card(11, 3), card(12, 3), card(14, 3), card(2, 0)]
+        self.assertEqual(strength_to_ranking(evaluate(cards)), [8, 12])
+        royal = [card(value, 0) for value in (10, 11, 12, 13, 14)]
+        self.assertEqual(strength_to_ranking(evaluate(royal)), [8, 14])
+        self.assertEqual(evaluate(royal), reference(royal))
+
+    def test_ranking_round_trip(self):
+        rng = random.Random(3)
+        for _ in range(2000):
+            ranking = Rules.hand_ranking(rng.sample(range(52), 5))
+            self.assertEqual(strength_to_ranking(ranking_to_strength(ranking)), ranking)
+
+    def test_strength_order(self):
+        rng = random.Random(4)
+        for _ in range(2000):
+            first, second = rng.sample(range(52), 5), rng.sample(range(52), 5)
+            expected = Rules.hand_ranking(first) > Rules.hand_ranking(second)
+            self.assertEqual(evaluate(first) > evaluate(second), expected, (first, second))
+
+
+class EvaluateOmahaTest(unittest.TestCase):
+    def test_random_hands(self):
+        rng = random.Random(5)
+        for _ in range(1000):
+            cards = rng.sample(range(52), 9)
+            hand, board = cards[:4], cards[4:]
+            self.assertEqual(evaluate_omaha(hand, board), reference_omaha(hand, board), (hand, board))
+
+    def test_flush_needs_two_hole_cards(self):
+        board = [card(2, 0), card(7, 0), card(9, 0), card(12, 0), card(4, 2)]
+        # A single suited hole card makes no flush in Omaha
+        hand = [card(14, 0), card(14, 1), card(13, 3), card(3, 2)]
+        self.assertEqual(strength_to_ranking(evaluate_omaha(hand, board))[0], 1)
+        hand = [card(14, 0), card(13, 0), card(8, 1), card(3, 2)]
+        self.assertEqual(strength_to_ranking(evaluate_omaha(hand, board)), [5, 14, 13, 12, 9, 7])
+        self.assertEqual(evaluate_omaha(hand, board), reference_omaha(hand, board))
+
+    def test_board_straight_not_played(self):
+        # The board's straight needs 3 of its cards, exactly 2 come from the hand
+        board = [card(10, 0), card(11, 1), card(12, 2), card(13, 3), card(14, 0)]
+        hand = [card(2, 1), card(2, 2), card(5, 3), card(7, 1)]
+        self.assertEqual(evaluate_omaha(hand, board), reference_omaha(hand, board))
+        self.assertEqual(strength_to_ranking(evaluate_omaha(hand, board))[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
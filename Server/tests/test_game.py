@@ -0,0 +1,79 @@
+"""
+Players leaving a table in the middle of a hand: their hand is folded and the hand goes on without them
+"""
+
+import random
+import unittest
+from Simulation import new_table, random_bot, MAX_ACTIONS
+
+
+def play_on(game, rng, leave_at=None):
+    """
+    Plays the hand in progress until it ends, a random player still in hand leaving the table after some actions
+    :game: Game object
+    :rng: random.Random
+    :leave_at: int, number of actions before the player leaves, None for nobody
+    :return: Player object who left, None if nobody did
+    """
+    left = None
+    for actions in range(MAX_ACTIONS):
+        if not game.on:
+            return left
+        if actions == leave_at:
+            left = rng.choice([player for player in game.players if player and player.in_hand])
+            game.remove_player(left)
+            continue
+        actor = game.players[game.acting]
+        assert actor and actor.in_hand, "Nobody seated in hand is to act"
+        game.act(actor, *random_bot(game, actor, rng))
+    raise AssertionError(f"Hand stuck after {MAX_ACTIONS} actions")
+
+
+class LeaveTest(unittest.TestCase):
+    def test_acting_player_leaves(self):
+        game = new_table(4)
+        game.new_game()
+        actor = game.players[game.acting]
+        game.remove_player(actor)
+        self.assertTrue(game.on)
+        self.assertIsNot(game.players[game.acting], None)
+        self.assertTrue(game.players[game.acting].in_hand)
+        self.assertIsNone(play_on(game, random.Random(0)))
+
+    def test_heads_up(self):
+        game = new_table(2)
+        game.new_game()
+        actor = game.players[game.acting]
+        winner, = [player for player in game.players if player and player is not actor]
+        game.remove_player(actor)
+        self.assertFalse(game.on)
+        self.assertEqual(winner.stack, 200 + game.sb)  # The small blind of the player who left
+
+    def test_last_to_act_leaves(self):
+        # The big blind leaves out of turn: the round now ends with the player before him
+        game = new_table(3)
+        game.new_game()
+        last = game.players[game.last_to_act]
+        game.remove_player(last)
+        for _ in range(2):
+            actor = game.players[game.acting]
+            game.act(actor, "call" if game.highest_bet > actor.betting else "check", 0)
+        self.assertEqual(game.round, 1)
+        self.assertEqual(len(game.community), 3)
+
+    def test_chips_conserved(self):
+        for seed in range(300):
+            rng = random.Random(seed)
+            game = new_table(rng.randint(2, 6), variant="plo" if seed % 3 == 0 else "holdem")
+            players = [player for player in game.players if player]
+            game.new_game()
+            left = play_on(game, rng, leave_at=rng.randint(0, 8))
+            self.assertFalse(game.on)
+            # The player who left keeps his stack, the chips he put in stay at the table
+            self.assertEqual(sum(player.stack for player in players), 200 * len(players))
+            if left:
+                self.assertNotIn(left, game.players)
+
+
+if __name__ == "__main__":
+    unittest.main()
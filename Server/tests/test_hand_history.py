@@ -0,0 +1,60 @@
+"""
+Hand log: pots are read back as they were awarded, odd chips included
+"""
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+import HandHistory
+from HandHistory import HandHistory as Writer, HandLogReader, HandRecord
+from Variants import VARIANTS
+
+
+class Seated:
+    def __init__(self, name, hand):
+        self.name = name
+        self.stack = 1000
+        self.hand = hand
+        self.in_hand = True
+
+
+def record():
+    """
+    :return: tuple (HandRecord of a three-handed hand, dict of the players' seats: 0, 2 and 3)
+    """
+    players = [Seated(name, bytes([i, i + 13])) if name else None
+               for i, name in enumerate(["Alice", None, "Bob", "Carol"])]
+    game = SimpleNamespace(table_id=7, hand_number=42, sb=5, bb=10, dealer=0, variant=VARIANTS['holdem'],
+                           players=players)
+    return HandRecord(game), {player: seat for seat, player in enumerate(players) if player}
+
+
+class HandLogTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_split_pot_with_odd_chip(self):
+        hand, seats = record()
+        alice, bob, carol = seats
+        results = [[301, [bob, alice], (1, 14, 13), [151, 150]], [40, [carol], None, [40]]]
+        log = Writer(self.path)
+        log.write(hand.encode([4, 5, 6, 7, 8], results, seats))
+        log.close()
+        with HandLogReader(self.path) as reader:
+            hand, = reader
+        self.assertEqual(hand['pots'][0]['amount'], 301)
+        self.assertEqual(hand['pots'][0]['winners'], [2, 0])
+        self.assertEqual(hand['pots'][0]['won'], [151, 150])
+        self.assertEqual(hand['pots'][1], {'amount': 40, 'ranking': None, 'winners': [3], 'won': [40]})
+        self.assertIn("Pot of 301 chips won by Bob (151), Alice (150)", HandHistory.replay(hand)[-2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Outbound queues: a full queue makes room by dropping its oldest game state, and a client too slow to keep up without
+any game state to drop is disconnected
+"""
+
+import unittest
+import Wire
+from Outbox import Outbox
+
+
+class QueueOutbox(Outbox):
+    """
+    Outbox nobody drains, counting its wake-ups
+    """
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        self.wakes = 0
+
+    def wake(self):
+        self.wakes += 1
+
+
+class OverflowTest(unittest.TestCase):
+    def test_queued_in_order(self):
+        outbox = QueueOutbox(4)
+        outbox.put('message', b"a")
+        outbox.put('game', b"b")
+        self.assertEqual(list(outbox.queue), [('message', b"a"), ('game', b"b")])
+        self.assertEqual(outbox.wakes, 2)
+
+    def test_oldest_state_dropped(self):
+        outbox = QueueOutbox(4)
+        outbox.put('message', b"a")
+        outbox.put('game', b"state 1")
+        outbox.pause(0.5)
+        outbox.put('game', b"state 2")
+        outbox.put('game', b"state 3")  # Full: the first state goes, with the pause following it
+        self.assertEqual(list(outbox.queue), [('message', b"a"), ('game', b"state 2"), ('game', b"state 3")])
+        self.assertFalse(outbox.closed)
+
+    def test_slow_client_disconnected(self):
+        outbox = QueueOutbox(2)
+        outbox.put('game', b"state")
+        outbox.put('message', b"a")
+        outbox.put('message', b"b")  # Only game states can be dropped
+        self.assertTrue(outbox.closed)
+        self.assertEqual(list(outbox.queue), [('close', None)])
+        outbox.put('message', b"c")
+        outbox.pause(1)
+        self.assertEqual(list(outbox.queue), [('close', None)])
+
+    def test_no_state_to_drop(self):
+        outbox = QueueOutbox(2)
+        outbox.put('message', b"a")
+        outbox.put('message', b"b")
+        outbox.put('game', b"state")
+        self.assertTrue(outbox.closed)
+        self.assertEqual(list(outbox.queue), [('close', None)])
+
+    def test_close_after_queued_messages(self):
+        outbox = QueueOutbox(4)
+        outbox.put('message', b"a")
+        outbox.close()
+        outbox.close()
+        self.assertEqual(list(outbox.queue), [('message', b"a"), ('close', None)])
+
+
+class PauseTest(unittest.TestCase):
+    def test_consecutive_pauses_merged(self):
+        outbox = QueueOutbox(4)
+        outbox.put('message', b"a")
+        outbox.pause(0.5)
+        outbox.pause(0.25)
+        self.assertEqual(list(outbox.queue), [('message', b"a"), ('pause', 0.75)])
+
+    def test_no_pause_when_full(self):
+        outbox = QueueOutbox(1)
+        outbox.put('message', b"a")
+        outbox.pause(0.5)
+        self.assertEqual(list(outbox.queue), [('message', b"a")])
+
+    def test_sequenced_not_paused(self):
+        outbox = QueueOutbox(4)
+        outbox.sequenced = True
+        outbox.pause(0.5)
+        self.assertEqual(list(outbox.queue), [])
+        self.assertEqual((outbox.header(), outbox.header()), (b"#1 ", b"#2 "))
+        outbox.binary = True
+        self.assertEqual(outbox.header(), Wire.SEQ.pack(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
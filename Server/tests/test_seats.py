@@ -0,0 +1,52 @@
+"""
+Seats kept as bitmasks: the next and previous seats around the table are those found by walking around it seat by
+seat, for every set of seats of a 10-max table
+"""
+
+import unittest
+from Seats import seat_bit, seat_count, seat_list, next_seat, previous_seat
+
+SEATS = 10
+
+
+def walk(seats, seat, step):
+    """
+    :seats: int, mask of seats, not empty
+    :seat: int
+    :step: int, 1 to go forward, -1 to go backward
+    :return: int, first seat of the mask met going around the table from a seat, the seat itself coming last
+    """
+    for i in range(1, SEATS + 1):
+        other = (seat + step * i) % SEATS
+        if seats & seat_bit(other):
+            return other
+    raise AssertionError("Empty mask")
+
+
+class SeatsTest(unittest.TestCase):
+    def test_examples(self):
+        seats = seat_bit(1) | seat_bit(4) | seat_bit(8)
+        self.assertEqual(seat_list(seats), [1, 4, 8])
+        self.assertEqual(seat_count(seats), 3)
+        self.assertEqual(next_seat(seats, 1), 4)
+        self.assertEqual(next_seat(seats, 5), 8)
+        self.assertEqual(next_seat(seats, 8), 1)  # Around the table
+        self.assertEqual(previous_seat(seats, 4), 1)
+        self.assertEqual(previous_seat(seats, 1), 8)
+        self.assertEqual(previous_seat(seats, 0), 8)
+
+    def test_single_seat(self):
+        self.assertEqual(next_seat(seat_bit(3), 3), 3)
+        self.assertEqual(previous_seat(seat_bit(3), 3), 3)
+
+    def test_every_mask(self):
+        for seats in range(1, 1 << SEATS):
+            self.assertEqual(seat_count(seats), len(seat_list(seats)))
+            self.assertEqual(sum(map(seat_bit, seat_list(seats))), seats)
+            for seat in range(SEATS):
+                self.assertEqual(next_seat(seats, seat), walk(seats, seat, 1))
+                self.assertEqual(previous_seat(seats, seat), walk(seats, seat, -1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Main and side pots built from the contributions of a hand, and awarded at showdown
+"""
+
+import unittest
+from Settlement import build_pots, uncalled_bet, award
+
+
+class Seat:
+    def __init__(self, name, stack=0):
+        self.name = name
+        self.stack = stack
+
+    def __repr__(self):
+        return self.name
+
+
+A, B, C, D = (Seat(name) for name in "ABCD")
+
+
+class BuildPotsTest(unittest.TestCase):
+    def test_single_pot(self):
+        self.assertEqual(build_pots([(A, 100, True), (B, 100, True), (C, 100, True)]), [[300, [A, B, C]]])
+
+    def test_side_pots(self):
+        # A is all in for 50, B for 120, C and D went on betting
+        pots = build_pots([(A, 50, True), (B, 120, True), (C, 300, True), (D, 300, True)])
+        self.assertEqual(pots, [[200, [A, B, C, D]], [210, [B, C, D]], [360, [C, D]]])
+
+    def test_folded_chips(self):
+        # D folded after putting in 80: chips below A's all in go to the main pot, the rest to the side pot
+        pots = build_pots([(A, 50, True), (B, 200, True), (C, 200, True), (D, 80, False)])
+        self.assertEqual(pots, [[200, [A, B, C]], [330, [B, C]]])
+        self.assertEqual(sum(amount for amount, _ in pots), 530)
+
+    def test_folded_above_everyone(self):
+        # B folded to A's all in after betting more than A had: B's extra chips stay in the last pot
+        pots = build_pots([(A, 40, True), (B, 100, False), (C, 40, True)])
+        self.assertEqual(pots, [[180, [A, C]]])
+
+    def test_everyone_folded(self):
+        self.assertEqual(build_pots([(A, 10, False), (B, 20, False)]), [[30, []]])
+        self.assertEqual(build_pots([]), [])
+
+
+class UncalledBetTest(unittest.TestCase):
+    def test_uncalled(self):
+        self.assertEqual(uncalled_bet([(A, 50, True), (B, 300, True), (C, 120, False)]), (B, 180))
+
+    def test_called(self):
+        self.assertEqual(uncalled_bet([(A, 300, True), (B, 300, True), (C, 120, False)]), (None, 0))
+        self.assertEqual(uncalled_bet([(A, 300, True)]), (None, 0))
+
+
+class AwardTest(unittest.TestCase):
+    def setUp(self):
+        for seat in (A, B, C, D):
+            seat.stack = 0
+
+    def test_side_pot_to_another_player(self):
+        # A has the best hand but only put in 50: B wins what A could not cover
+        pots = build_pots([(A, 50, True), (B, 120, True), (C, 120, True)])
+        results = award(pots, {A: 9, B: 7, C: 3}, {A: 0, B: 1, C: 2})
+        self.assertEqual(results, [[150, [A], 9, [150]], [140, [B], 7, [140]]])
+        self.assertEqual((A.stack, B.stack, C.stack), (150, 140, 0))
+
+    def test_odd_chips_from_the_dealers_left(self):
+        # Three-way split of 100: the odd chip goes to the first winner left of the dealer, C
+        results = award([[100, [A, B, C]]], {A: 5, B: 5, C: 5}, {C: 0, A: 1, B: 2})
+        self.assertEqual(results, [[100, [C, A, B], 5, [34, 33, 33]]])
+        self.assertEqual((C.stack, A.stack, B.stack), (34, 33, 33))
+        results = award([[101, [A, B, C, D]]], {A: 5, B: 5, C: 5, D: 2}, {D: 0, B: 1, A: 2, C: 3})
+        self.assertEqual(results[0][1:], [[B, A, C], 5, [34, 34, 33]])
+
+    def test_chips_conserved(self):
+        contributions = [(A, 37, True), (B, 211, True), (C, 211, True), (D, 90, False)]
+        pots = build_pots(contributions)
+        award(pots, {A: 4, B: 4, C: 4}, {A: 0, B: 1, C: 2, D: 3})
+        self.assertEqual(A.stack + B.stack + C.stack + D.stack, sum(chips for _, chips, _ in contributions))
+
+    def test_pot_nobody_can_win(self):
+        self.assertEqual(award([[30, []]], {}, {}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Table snapshots: a table restored mid-hand plays on exactly as the saved one, and the file is kept private
+"""
+
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+import Snapshot
+from Snapshot import Snapshots, encode_table, decode_table, load
+from HandHistory import LENGTH
+from Simulation import new_table, seat_policies, play_hand, random_bot, MAX_ACTIONS
+
+
+class History:
+    """
+    Hand log keeping nothing, so that hands are recorded
+    """
+    def write(self, record):
+        pass
+
+
+def restored(game):
+    """
+    :game: Game object
+    :return: Game object, rebuilt from the snapshot of the table
+    """
+    return decode_table(encode_table(game), LENGTH.size)
+
+
+def play_on(game, seed):
+    """
+    Plays the hand in progress until it ends, with the same decisions for the same seed
+    :game: Game object
+    :seed: int
+    :return: list of the players' stacks
+    """
+    rng = random.Random(seed)
+    for _ in range(MAX_ACTIONS):
+        if not game.on:
+            break
+        actor = game.players[game.acting]
+        game.act(actor, *random_bot(game, actor, rng))
+    return [player.stack if player else None for player in game.players]
+
+
+class EncodingTest(unittest.TestCase):
+    def test_between_hands(self):
+        game = new_table(3)
+        play_hand(game, seat_policies(game, ['calling_station'] * 3), random.Random(1))
+        copy = restored(game)
+        self.assertFalse(copy.on)
+        self.assertEqual(copy.game_info(), game.game_info())
+        self.assertEqual((copy.hand_number, copy.sb, copy.bb, copy.variant), (game.hand_number, 5, 10, game.variant))
+
+    def test_mid_hand(self):
+        for seed in range(20):
+            game = new_table(4, variant="plo" if seed % 2 else "holdem")
+            game.history = History()
+            game.new_game()
+            policies = seat_policies(game, ['calling_station'] * 4)
+            actor = game.players[game.acting]
+            game.act(actor, *policies[game.acting](game, actor, random.Random(seed)))
+            # A player leaves after putting chips in: they stay in the pots under their name
+            departed = next(player for player in game.contributions if player is not game.players[game.acting])
+            game.remove_player(departed)
+            copy = restored(game)
+            self.assertEqual(copy.game_info(), game.game_info())
+            self.assertEqual(copy.deck.cards, game.deck.cards)
+            self.assertEqual(copy.community, game.community)
+            self.assertEqual([(player.name, chips) for player, chips in copy.contributions.items()],
+                             [(player.name, chips) for player, chips in game.contributions.items()])
+            self.assertEqual(copy.record.seats, game.record.seats)
+            self.assertEqual(copy.record.actions, game.record.actions)
+            copy.history = game.history  # Given by the registry hosting the table
+            self.assertEqual(play_on(copy, seed), play_on(game, seed))
+
+
+class FileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "tables.snapshot")
+        self.snapshots = Snapshots(self.path)
+        self.snapshots.close()  # Written on demand by the tests
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def table(self, table_id):
+        game = new_table(2)
+        game.table_id = table_id
+        game.snapshots = self.snapshots
+        return game
+
+    @unittest.skipUnless(os.name == 'posix', "permissions of POSIX systems")
+    def test_private_file(self):
+        with open(self.path + ".tmp", "wb"):  # Left by a crash, readable by everyone
+            pass
+        os.chmod(self.path + ".tmp", 0o644)
+        self.snapshots.update(self.table(1))
+        self.snapshots.write()
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertEqual([game.table_id for game in load(self.path)], [1])
+
+    def test_only_changed_tables_encoded(self):
+        first, second = self.table(1), self.table(2)
+        with mock.patch.object(Snapshot, 'encode_table', wraps=encode_table) as encode:
+            for _ in range(5):
+                self.snapshots.update(first)
+            self.snapshots.update(second)
+            self.snapshots.write()
+            self.assertEqual(encode.call_count, 2)
+            first.set_blinds(10, 20)
+            self.snapshots.update(first)
+            self.snapshots.write()
+            self.assertEqual(encode.call_count, 3)
+            self.snapshots.write()
+            self.assertEqual(encode.call_count, 3)
+        self.assertEqual({game.table_id: game.bb for game in load(self.path)}, {1: 20, 2: 10})
+
+    def test_closed_table(self):
+        first, second = self.table(1), self.table(2)
+        self.snapshots.update(first)
+        self.snapshots.update(second)
+        self.snapshots.write()
+        second.snapshots = None  # As TableRegistry.close_table does
+        self.snapshots.remove(2)
+        self.snapshots.write()
+        self.assertEqual([game.table_id for game in load(self.path)], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
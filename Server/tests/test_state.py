@@ -0,0 +1,101 @@
+"""
+Versioned game's states: players who negotiated delta updates only get the components that changed since the version
+they acknowledged, and the full state once that version is no longer kept
+"""
+
+import unittest
+from Game import STATE_HISTORY
+from Simulation import new_table
+
+
+def table():
+    """
+    :return: tuple (Game, player using delta updates, player using full states), both keeping their messages
+    """
+    game = new_table(3)
+    delta, full, _ = [player for player in game.players if player]
+    delta.delta = True
+    delta.sock.keep = full.sock.keep = True
+    return game, delta, full
+
+
+def change_blinds(game, sb):
+    """
+    Changes a single component of the game's state and sends it
+    """
+    game.sb, game.bb = sb, 2 * sb
+    game.send_game_state()
+
+
+class DeltaTest(unittest.TestCase):
+    def test_full_state_until_acknowledged(self):
+        game, delta, full = table()
+        game.send_game_state()
+        self.assertTrue(delta.sock.sent[-1].startswith(b"01 VS(%d:0) ON(0) BL(5:10) PL(" % game.version))
+        self.assertTrue(full.sock.sent[-1].startswith(b"01 ON(0) BL(5:10) PL("))
+
+    def test_changed_components_only(self):
+        game, delta, full = table()
+        game.send_game_state()
+        delta.acked_version = base = game.version
+        change_blinds(game, 10)
+        self.assertEqual(game.version, base + 1)
+        self.assertEqual(delta.sock.sent[-1], b"06 VS(%d:%d) BL(10:20)$" % (base + 1, base))
+        self.assertTrue(full.sock.sent[-1].startswith(b"01 ON(0) BL(10:20) PL("))
+
+    def test_changes_since_acknowledged_version(self):
+        game, delta, _ = table()
+        game.send_game_state()
+        delta.acked_version = base = game.version
+        change_blinds(game, 10)
+        game.dealer = 3
+        game.send_game_state()
+        self.assertEqual(delta.sock.sent[-1], b"06 VS(%d:%d) BL(10:20) DL(3)$" % (base + 2, base))
+
+    def test_same_state_same_version(self):
+        game, delta, _ = table()
+        game.send_game_state()
+        delta.acked_version = version = game.version
+        sent = len(delta.sock.sent)
+        game.send_game_state()
+        self.assertEqual(game.version, version)
+        self.assertEqual(len(delta.sock.sent), sent)  # Nothing new to tell
+
+    def test_full_state_forced(self):
+        game, delta, _ = table()
+        game.send_game_state()
+        delta.acked_version = game.version
+        game.send_game_state(full=True)
+        self.assertTrue(delta.sock.sent[-1].startswith(b"01 VS(%d:0) ON(0)" % game.version))
+
+    def test_acknowledged_version_ages_out(self):
+        game, delta, _ = table()
+        game.send_game_state()
+        delta.acked_version = base = game.version
+        for sb in range(10, 10 + STATE_HISTORY - 1):
+            change_blinds(game, sb)
+        # The version acknowledged is the oldest one kept
+        self.assertEqual(next(iter(game.states)), base)
+        self.assertTrue(delta.sock.sent[-1].startswith(b"06 VS(%d:%d) BL(" % (game.version, base)))
+        change_blinds(game, 100)
+        self.assertEqual(len(game.states), STATE_HISTORY)
+        self.assertNotIn(base, game.states)
+        self.assertTrue(delta.sock.sent[-1].startswith(b"01 VS(%d:0) ON(0) BL(100:200) PL(" % game.version))
+
+    def test_versions_pruned(self):
+        # Without any player using delta updates, only the latest version is kept
+        game, delta, _ = table()
+        delta.delta = False
+        for sb in range(10, 15):
+            change_blinds(game, sb)
+        self.assertEqual(list(game.states), [game.version])
+        # Versions older than the oldest one acknowledged are forgotten
+        delta.delta = True
+        delta.acked_version = base = game.version
+        for sb in range(15, 20):
+            change_blinds(game, sb)
+        self.assertEqual(list(game.states), list(range(base, game.version + 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Table registry: connections are seated at the first table with a free seat, tables are reopened when a seat is freed
+and closed when their last player leaves
+"""
+
+import unittest
+from Game import MAX_PLAYERS
+from Simulation import NullOutbox
+from Tables import TableRegistry
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = TableRegistry()
+
+    def join(self, count, name="player"):
+        """
+        :return: list of tuples (Outbox, Game, Player)
+        """
+        seated = []
+        for _ in range(count):
+            conn = NullOutbox()
+            game, player = self.registry.join(name, conn)
+            seated.append((conn, game, player))
+        return seated
+
+    def test_fills_tables_in_order(self):
+        seated = self.join(MAX_PLAYERS + 1)
+        first, second = seated[0][1], seated[-1][1]
+        self.assertTrue(all(game is first for _, game, _ in seated[:-1]))
+        self.assertIsNot(second, first)
+        self.assertEqual(self.registry.seated, {first.table_id: MAX_PLAYERS, second.table_id: 1})
+        self.assertEqual(list(self.registry.open_tables), [second.table_id])
+        for conn, game, player in seated:
+            self.assertEqual(self.registry.lookup(conn), (game, player))
+
+    def test_names_unique_at_a_table(self):
+        (_, _, first), (_, _, second) = self.join(2, "bob")
+        self.assertEqual(first.name, "bob")
+        self.assertEqual(second.name, "bob0")
+
+    def test_leave_reopens_table(self):
+        seated = self.join(MAX_PLAYERS)
+        conn, game, player = seated[0]
+        self.assertNotIn(game.table_id, self.registry.open_tables)
+        self.registry.leave(conn)
+        self.assertNotIn(player, game.players)
+        self.assertEqual(self.registry.lookup(conn), (None, None))
+        self.assertEqual(self.registry.seated[game.table_id], MAX_PLAYERS - 1)
+        self.assertIs(self.registry.open_tables[game.table_id], game)
+        # The free seat is taken before a new table is created
+        (_, other, _), = self.join(1)
+        self.assertIs(other, game)
+
+    def test_last_player_closes_table(self):
+        seated = self.join(2)
+        for conn, _, _ in seated:
+            self.registry.leave(conn)
+        self.assertEqual(self.registry.tables, {})
+        self.assertEqual(self.registry.open_tables, {})
+        self.assertEqual(self.registry.seated, {})
+        self.assertEqual(self.registry.connections, {})
+        self.registry.leave(seated[0][0])  # Already gone, nothing to do
+
+    def test_release_keeps_players(self):
+        seated = self.join(3)
+        game = seated[0][1]
+        conns = self.registry.release(game)
+        self.assertEqual(set(conns), {conn for conn, _, _ in seated})
+        self.assertNotIn(game.table_id, self.registry.tables)
+        self.assertEqual(self.registry.connections, {})
+        # The players are still seated, the table is handed over as it is
+        self.assertEqual(sum(1 for player in game.players if player), 3)
+
+    def test_server_full(self):
+        self.registry = TableRegistry(max_tables=1)
+        self.join(MAX_PLAYERS)
+        self.assertEqual(self.registry.join("late", NullOutbox()), (None, None))
+
+    def test_table_ids(self):
+        # Registries of several processes never give the same id to two tables
+        self.registry = TableRegistry(first_id=1, id_step=2)
+        seated = self.join(2 * MAX_PLAYERS + 1)
+        self.assertEqual(sorted({game.table_id for _, game, _ in seated}), [1, 3, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tournament hosted by a table registry: hands dealt and blinds raised on the registry's timer, players' connections
+following them from table to table until they are knocked out
+"""
+
+import random
+import unittest
+from Player import Player
+from Session import Session, RECV_PROTOCOL
+from Simulation import NullOutbox, random_bot
+from Tables import TableRegistry
+from Tournament import Tournament, HAND_DELAY
+
+ENTRANTS = 23
+
+
+class Timer:
+    """
+    Schedule of the registry, called back when the test says so
+    """
+    def __init__(self):
+        self.pending = []  # (delay, callback)
+
+    def __call__(self, delay, callback):
+        self.pending.append((delay, callback))
+
+    def run(self):
+        """
+        Calls back everything scheduled so far, soonest first
+        """
+        pending, self.pending = sorted(self.pending, key=lambda call: call[0]), []
+        for _, callback in pending:
+            callback()
+
+
+class TournamentTest(unittest.TestCase):
+    def setUp(self):
+        self.timer = Timer()
+        self.registry = TableRegistry(schedule=self.timer, chat_limit=None)
+        self.tournament = Tournament(registry=self.registry)
+        self.sessions = [Session(self.registry, NullOutbox()) for _ in range(ENTRANTS)]
+        self.tournament.start(Player(f"bot{i}", session.conn) for i, session in enumerate(self.sessions))
+
+    def check_registry(self):
+        tournament, registry = self.tournament, self.registry
+        self.assertEqual(set(registry.tables), set(tournament.tables))
+        self.assertEqual(registry.unlisted, set(tournament.tables))
+        self.assertFalse(registry.open_tables)
+        self.assertEqual(registry.seated, tournament.counts)
+        for session in self.sessions:
+            if session.player:
+                self.assertIs(session.game.players[session.game.players.index(session.player)], session.player)
+
+    def play(self, hands):
+        """
+        Plays until the tournament is over or every table played a number of hands
+        :hands: int
+        :return: None
+        """
+        rng = random.Random(hands)
+        for _ in range(hands):
+            self.timer.run()  # Deals every table and raises the blinds
+            for game in list(self.tournament.tables.values()):
+                while game.on:
+                    actor = game.players[game.acting]
+                    with game.lock:
+                        game.act(actor, *random_bot(game, actor, rng))
+            self.check_registry()
+            if self.tournament.over:
+                return
+
+    def test_start(self):
+        self.assertEqual(len(self.tournament.tables), 4)
+        delays = sorted(delay for delay, _ in self.timer.pending)
+        self.assertEqual(delays, [0, 0, 0, 0, self.tournament.level_seconds])
+        self.check_registry()
+        joined, _ = self.registry.join("Carol", NullOutbox())
+        self.assertNotIn(joined.table_id, self.tournament.tables)
+
+    def test_blinds_on_timer(self):
+        schedule = self.tournament.schedule
+        self.play(1)
+        self.assertEqual(self.tournament.level, 1)
+        self.assertEqual({(game.sb, game.bb) for game in self.tournament.tables.values()}, {schedule[0]})
+        self.assertIn(HAND_DELAY, [delay for delay, _ in self.timer.pending])
+        self.play(1)
+        self.assertEqual(self.tournament.level, 2)
+        self.assertEqual({(game.sb, game.bb) for game in self.tournament.tables.values() if game.hand_number == 2},
+                         {schedule[1]})
+
+    def test_whole_tournament(self):
+        self.play(1000)
+        tournament = self.tournament
+        self.assertTrue(tournament.over)
+        self.assertEqual(sorted(position for position, _ in tournament.results), list(range(1, ENTRANTS + 1)))
+        winner, = [session for session in self.sessions if session.player]
+        self.assertEqual(winner.player.stack, ENTRANTS * tournament.starting_stack)
+        self.assertEqual(tournament.results[-1], (1, winner.player.name))
+        self.assertEqual(len(self.registry.connections), 1)
+        self.timer.run()
+        self.assertFalse(winner.game.on)  # Nobody left to play against
+
+    def test_orders_of_the_director(self):
+        session = self.sessions[0]
+        session.player.gm = True
+        self.timer.run()
+        game = session.game
+        sb, bb, hand_number = game.sb, game.bb, game.hand_number
+        session.dispatch(RECV_PROTOCOL['blind'], 500, 1000)
+        session.dispatch(RECV_PROTOCOL['stack'], game.players.index(session.player), 100000)
+        self.assertEqual((game.sb, game.bb, game.hand_number), (sb, bb, hand_number))
+        self.assertEqual(session.player.stack + session.player.betting, self.tournament.starting_stack)
+
+    def test_disconnection(self):
+        session = self.sessions[0]  # Leaves before the first hand
+        game = session.game
+        session.close()
+        self.assertIsNone(session.player)
+        self.assertEqual(self.tournament.remaining, ENTRANTS - 1)
+        self.assertEqual(self.tournament.results, [(ENTRANTS, "bot0")])
+        self.assertIn(game.table_id, self.registry.tables)
+        self.play(1000)
+        self.assertTrue(self.tournament.over)
+
+    def test_disconnection_mid_hand(self):
+        self.timer.run()
+        for game in self.tournament.tables.values():
+            actor = game.players[game.acting]
+            session, = [session for session in self.sessions if session.player is actor]
+            session.close()  # On his turn: his hand is folded, the next player acts
+            self.assertIsNone(session.player)
+            self.assertNotIn(actor, game.players)
+            if game.on:
+                self.assertTrue(game.players[game.acting].in_hand)
+        self.assertEqual(self.tournament.remaining, ENTRANTS - len(self.tournament.tables))
+        self.check_registry()
+        self.play(1000)
+        self.assertTrue(self.tournament.over)
+        self.assertEqual(sorted(position for position, _ in self.tournament.results), list(range(1, ENTRANTS + 1)))
+
+    def test_own_locks(self):
+        locks = {id(game.lock) for game in self.tournament.tables.values()}
+        self.assertEqual(len(locks), len(self.tournament.tables))
+        self.assertNotIn(id(self.tournament.lock), locks)
+
+
+if __name__ == "__main__":
+    unittest.main()
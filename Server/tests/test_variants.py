@@ -0,0 +1,95 @@
+"""
+Betting limits of the variants: a Pot-Limit Omaha bet or shove bigger than the pot is cut down to the pot
+"""
+
+import unittest
+from Simulation import new_table
+from Variants import HOLDEM, PLO
+
+
+def plo_table():
+    """
+    :return: Game object, a three-handed Pot-Limit Omaha hand having started, blinds 5/10, whose acting player keeps
+             the messages he is sent
+    """
+    game = new_table(3, variant="plo")
+    game.new_game()
+    game.players[game.acting].sock.keep = True
+    return game
+
+
+class MaxBetTest(unittest.TestCase):
+    def test_bet_to_call(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        # Calling 10 makes the pot 25, the raise is at most 25 more
+        self.assertEqual(PLO.max_bet(game, actor), 35)
+        self.assertEqual(HOLDEM.max_bet(game, actor), actor.stack)
+
+    def test_no_bet_to_call(self):
+        game = plo_table()
+        for _ in range(3):
+            actor = game.players[game.acting]
+            game.act(actor, "call" if game.highest_bet > actor.betting else "check", 0)
+        self.assertEqual((game.round, game.highest_bet), (1, 0))
+        self.assertEqual(PLO.max_bet(game, game.players[game.acting]), 30)  # The pot
+
+    def test_short_stack(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        actor.stack = 20
+        self.assertEqual(PLO.max_bet(game, actor), 20)
+
+
+class PotLimitTest(unittest.TestCase):
+    def test_bet_reduced(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        game.act(actor, "bet", 150)
+        self.assertEqual((actor.betting, actor.stack, game.highest_bet), (35, 165, 35))
+        self.assertFalse(actor.all_in)
+        self.assertIn(b"Your bet is reduced to the limit of 35.", b"".join(actor.sock.sent))
+
+    def test_shove_reduced(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        game.act(actor, "shove", 0)
+        self.assertEqual((actor.betting, actor.stack), (35, 165))
+        self.assertFalse(actor.all_in)
+        self.assertTrue(game.active_seats & (1 << game.players.index(actor)))
+        self.assertIn(b"Your bet is reduced to the limit of 35.", b"".join(actor.sock.sent))
+
+    def test_bet_within_limit(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        game.act(actor, "bet", 30)
+        self.assertEqual(actor.betting, 30)
+        self.assertNotIn(b"reduced", b"".join(actor.sock.sent))
+
+    def test_shove_within_limit(self):
+        game = plo_table()
+        actor = game.players[game.acting]
+        actor.stack = 30
+        game.act(actor, "shove", 0)
+        self.assertEqual((actor.betting, actor.stack), (30, 0))
+        self.assertTrue(actor.all_in)
+
+    def test_shove_down_to_the_stack(self):
+        # The limit is the whole stack: the bet becomes a shove
+        game = plo_table()
+        actor = game.players[game.acting]
+        actor.stack = 35
+        game.act(actor, "bet", 100)
+        self.assertEqual((actor.betting, actor.stack), (35, 0))
+        self.assertTrue(actor.all_in)
+
+    def test_no_limit(self):
+        game = new_table(3)
+        game.new_game()
+        actor = game.players[game.acting]
+        game.act(actor, "bet", 150)
+        self.assertEqual(actor.betting, 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Binary wire protocol: frames encoded by one side are decoded by the other
+"""
+
+import unittest
+import Wire
+import Log
+from Game import Game
+from Player import Message
+from Session import Session
+from Simulation import NullOutbox
+from Tables import TableRegistry
+
+
+def server_frames(*messages):
+    """
+    Frames as received by a client, with their sequence numbers
+    :messages: Message objects
+    :return: bytearray
+    """
+    data = bytearray()
+    for seq, message in enumerate(messages, 1):
+        data += Wire.SEQ.pack(seq) + message.encode(True)
+    return data
+
+
+class RequestTest(unittest.TestCase):
+    def test_round_trip(self):
+        requests = [("-1",), ("00", "TrungDam"), ("01",), ("02", 5, 10), ("03", 5, 120), ("04", "nice hand ♠"),
+                    ("05", 3, -15), ("06",), ("07", "seq delta"), ("08", 12)]
+        for protocol, *fields in requests:
+            frame = Wire.encode_request(protocol, *fields)
+            opcode, length = Wire.HEADER.unpack_from(frame)
+            self.assertEqual(length, len(frame) - Wire.HEADER.size)
+            self.assertEqual(Wire.decode_request(opcode, frame[Wire.HEADER.size:]), (protocol, tuple(fields)))
+
+    def test_invalid_frames(self):
+        with self.assertRaises(Wire.ProtocolError):
+            Wire.decode_request(0x42, b"")
+        with self.assertRaises(Wire.ProtocolError):
+            Wire.decode_request(Wire.RECV_OPCODES["03"], b"\x05")  # Amount missing
+        with self.assertRaises(Wire.ProtocolError):
+            Wire.decode_request(Wire.RECV_OPCODES["04"], b"\xff\xfe")
+
+    def test_session_skips_invalid_frames(self):
+        registry = TableRegistry(chat_limit=None)
+        conn = NullOutbox(keep=True)
+        conn.binary = True
+        session = Session(registry, conn)
+        data = Wire.HEADER.pack(0x42, 3) + b"abc" + Wire.encode_request("00", "Bob")
+        with self.assertLogs(f"{Log.ROOT}.session", "WARNING"):
+            self.assertEqual(session.receive(data), 0)
+        self.assertEqual(session.player.name, "Bob")
+        session.close()
+
+
+class FrameTest(unittest.TestCase):
+    def test_split_frames(self):
+        data = server_frames(Message('message', "hello"), Message('name', "Bob0"), Message('disconnect', ""))
+        frames, consumed = Wire.split_frames(data + b"\x00\x00", with_seq=True)  # Start of a 4th frame
+        self.assertEqual(consumed, len(data))
+        self.assertEqual([opcode for opcode, _ in frames],
+                         [Wire.SEND_OPCODES['message'], Wire.SEND_OPCODES['name'], Wire.SEND_OPCODES['disconnect']])
+        self.assertTrue(frames[0][1].decode().endswith("hello"))
+        self.assertEqual(frames[1][1], b"Bob0")
+        self.assertEqual(frames[2][1], b"")
+
+    def test_oversized_payload_is_cut(self):
+        frame = Message('message', "x" * 70000).encode(True)
+        opcode, length = Wire.HEADER.unpack_from(frame)
+        self.assertEqual(length, Wire.MAX_PAYLOAD)
+        self.assertEqual(len(frame), Wire.HEADER.size + length)
+        # Never in the middle of a character
+        frame = Wire.encode_frame('message', "é".encode() * 40000)
+        _, length = Wire.HEADER.unpack_from(frame)
+        self.assertLessEqual(length, Wire.MAX_PAYLOAD)
+        self.assertEqual(frame[Wire.HEADER.size:].decode(), "é" * (length // 2))
+
+    def test_state_round_trip(self):
+        game = Game(3)
+        for name in ("Alice", "Bob", "Chloé"):
+            game.add_player(name, NullOutbox(), False)
+        game.set_blinds(5, 10)
+        game.new_game()
+        game.community = bytearray([0, 13, 26])
+        game.pots = [30, 12]
+        state = Wire.decode_state(Wire.encode_state(game, no_raising=True))
+        self.assertEqual((state['on'], state['sb'], state['bb'], state['version']), (True, 5, 10, game.version))
+        self.assertEqual((state['highest_bet'], state['dealer'], state['acting']),
+                         (game.highest_bet, game.dealer, game.acting))
+        self.assertTrue(state['no_raising'])
+        self.assertEqual(state['pots'], [30, 12])
+        self.assertEqual(state['community'], [0, 13, 26])
+        seats = {i: {'name': player.name, 'stack': player.stack, 'betting': player.betting,
+                     'in_hand': player.in_hand} for i, player in enumerate(game.players) if player}
+        self.assertEqual(state['seats'], seats)
+
+    def test_showdown_round_trip(self):
+        hands = [(0, bytes([12, 25])), (4, bytes([1, 2, 3, 4]))]
+        self.assertEqual(Wire.decode_showdown(Wire.encode_showdown(hands)), {0: [12, 25], 4: [1, 2, 3, 4]})
+
+
+if __name__ == "__main__":
+    unittest.main()